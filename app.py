@@ -9,10 +9,12 @@ from time import time
 
 import pkg_resources
 import yaml
-from flask import Flask, redirect, render_template, request, send_from_directory, url_for
+from flask import Flask, jsonify, redirect, render_template, request, send_from_directory, session, url_for
 
+from src import explain
 from src import model
 from src import serialize
+from src import similar
 from src.albums_database import Albums, AlbumManager
 
 # Initialize the Flask application
@@ -36,10 +38,34 @@ logger.debug("Web app log")
 with open(pkg_resources.resource_filename(__name__, app.config["PIPELINE_CONFIG"]), "r") as config_file:
     pipeline_config = yaml.load(config_file, Loader=yaml.FullLoader)
 
-# Initialize the database session
+# Features the model reads, which an album must match exactly to reuse its stored prediction
+preprocessor_config = pipeline_config["model"]["make_preprocessor"]
+model_features = (
+    preprocessor_config["numeric_features"]
+    + preprocessor_config["categorical_features"]
+    + (preprocessor_config.get("high_cardinality_features") or [])
+)
+
+# Initialize the database session (and those of any read replicas)
 album_manager = AlbumManager(app)
 
 
+@app.before_request
+def require_latest_write():
+    """Read the client's own latest write (from any app process), whose heartbeat version is kept in its session."""
+    album_manager.require_version(session.get("write_version"))
+
+
+def clip_score(score: float) -> float:
+    """Round a predicted score, clipped between 0 and 10."""
+    return min(10, max(0, round(score, 2)))
+
+
+def with_predicted_scores(albums: list) -> list:
+    """Pair albums (with their predicted score) for the index.html template, clipping the scores."""
+    return [(album, None if predicted is None else clip_score(predicted)) for album, predicted in albums]
+
+
 @app.route("/")
 def index():
     """
@@ -52,10 +78,11 @@ def index():
         Rendered HTML template for the SPA
     """
     try:
-        # Default view shows the first MAX_ROWS_SHOW albums in the database
-        albums = album_manager.session.query(Albums).limit(app.config["MAX_ROWS_SHOW"]).all()
+        # Default view shows the first MAX_ROWS_SHOW albums in the database,
+        # with their precomputed predicted scores
+        albums = album_manager.query_with_predictions(model_version).limit(app.config["MAX_ROWS_SHOW"]).all()
         logger.debug("Index page accessed")
-        return render_template("index.html", albums=albums)
+        return render_template("index.html", albums=with_predicted_scores(albums))
     except:
         traceback.print_exc()
         logger.warning("Not able to display albums. Error page returned.")
@@ -77,7 +104,7 @@ def search():
 
     # Filter all songs based on user input
     # TO DO: Validate user input before querying database
-    albums = album_manager.session.query(Albums)
+    albums = album_manager.query_with_predictions(model_version)
     if album_name:
         albums = albums.filter(Albums.album.like("%" + album_name + "%"))
     if artist_name:
@@ -93,7 +120,7 @@ def search():
     )
     albums = albums.limit(app.config["MAX_ROWS_SHOW"]).all()
 
-    return render_template("index.html", albums=albums)
+    return render_template("index.html", albums=with_predicted_scores(albums))
 
 
 @app.route("/add", methods=["POST"])
@@ -113,9 +140,16 @@ def add_entry():
         form_data["reviewauthor"] = form_data.get("reviewauthor", "Not provided")
         form_data["score"] = form_data.get("score", 0)
 
-        # Add to database
-        album_manager.add_album(**form_data)
+        # Add to database, and score the new album
+        album_id = album_manager.add_album(**form_data)
         logger.info("New album added: %s by %s", form_data["album"], form_data["artist"])
+        if album_id is not None:
+            album_manager.refresh_predictions(pipeline, model_version, album_ids=[album_id])
+        session["write_version"] = album_manager.required_version
+        with similarity_index.lock:  # So concurrent requests don't both add the albums after `max_id`
+            similarity_index.add(
+                album_manager.album_features(similarity_index.features, after_id=similarity_index.max_id)
+            )
         return redirect(url_for("index"))
     except:
         traceback.print_exc()
@@ -128,6 +162,11 @@ def predict_rating():
     """
     Predict the rating for an input album given a POST form of input data.
 
+    If the form (or query string) sets `explain`, the response is JSON with the
+    score, the model's expected value, and each input feature's contribution.
+    Otherwise, if an album in the database has exactly the same features, its
+    precomputed score is returned without running the model.
+
     Returns:
         Redirect to index page
     """
@@ -135,6 +174,24 @@ def predict_rating():
 
     # Convert request form to the model's required `pandas.DataFrame` format
     input_data = request.form.to_dict()
+    explain_prediction = bool(input_data.pop("explain", None) or request.args.get("explain"))
+    if not explain_prediction and all(feature in input_data for feature in model_features):
+        try:
+            stored_score = album_manager.find_prediction(
+                model_version, {feature: input_data[feature] for feature in model_features}
+            )
+        except:
+            traceback.print_exc()
+            logger.warning("Failed to look up a precomputed prediction. Predicting with the model instead.")
+            stored_score = None
+        if stored_score is not None:
+            logger.debug(
+                "Prediction: %0.2f (precomputed). Total time for lookup: %0.4fs",
+                clip_score(stored_score),
+                time() - start_time
+            )
+            return str(clip_score(stored_score))
+
     input_df = model.parse_dict_to_dataframe(input_data)
 
     # Ensure all columns (& order) match the original training data
@@ -142,10 +199,8 @@ def predict_rating():
     logger.debug("Parsed input data to DataFrame format")
 
     try:
-        score = round(pipeline.predict(validated_df)[0], 2)
-
         # Clip predicted score between 0 and 10
-        score = min(10, max(0, score))
+        score = clip_score(pipeline.predict(validated_df)[0])
 
         logger.debug(
             """Prediction: %0.2f.
@@ -153,6 +208,13 @@ def predict_rating():
             score,
             time() - start_time
         )
+        if explain_prediction and explainer:
+            contributions = explainer.contributions(validated_df).iloc[0]
+            return jsonify(
+                score=score,
+                expected_value=explainer.expected_value,
+                contributions=contributions.to_dict()
+            )
         return str(score)
     except:
         traceback.print_exc()
@@ -160,6 +222,78 @@ def predict_rating():
         return render_template("error.html")
 
 
+@app.route("/similar", methods=["GET", "POST"])
+def similar_albums():
+    """
+    Find the reviewed albums that sound most like an album, by their audio features.
+
+    Compares to the album whose id is given as `album_id` in the query string,
+    or else to the audio features in a POST form (as for `/predict`). The
+    number of albums is `k` in the query string (or form).
+
+    Returns:
+        JSON list of the most similar albums with their actual scores, closest first
+    """
+    try:
+        input_data = request.form.to_dict()
+        k = int(request.args.get("k") or input_data.pop("k", None) or pipeline_config["similar"]["similar_albums"]["k"])
+        album_id = request.args.get("album_id")
+        if album_id is not None:
+            albums = similar.similar_albums(similarity_index, album_manager, album_id=int(album_id), k=k)
+        else:
+            input_df = model.parse_dict_to_dataframe(input_data)
+            albums = similar.similar_albums(
+                similarity_index, album_manager, data=input_df.reindex(columns=similarity_index.features), k=k
+            )
+        return jsonify(albums=albums.to_dict("records"))
+    except:
+        traceback.print_exc()
+        logger.warning("Failed to find similar albums. Error page returned.")
+        return render_template("error.html")
+
+
+@app.route("/stats")
+def album_stats():
+    """
+    Summarize albums' scores and audio features for dashboards.
+
+    The query string may give `by`, the comma-separated dimensions (of genre,
+    releaseyear, and recordlabel) to group by, `measures`, the comma-separated
+    measures to summarize (default: all), and a value of any other dimension to
+    filter to (e.g. `?by=releaseyear&genre=Rock`).
+
+    Returns:
+        JSON list of each group's count, mean, standard deviation, minimum, and
+            maximum of each measure
+    """
+    try:
+        filters = request.args.to_dict()
+        by = [dimension for dimension in filters.pop("by", "").split(",") if dimension]
+        measures = filters.pop("measures", None)
+        stats = album_manager.album_stats(by, measures.split(",") if measures else None, **filters)
+        return jsonify(stats=stats.astype(object).where(stats.notna(), None).to_dict("records"))
+    except:
+        traceback.print_exc()
+        logger.warning("Failed to summarize albums. Error page returned.")
+        return render_template("error.html")
+
+
+@app.route("/replicas")
+def replica_lag():
+    """
+    Report how far behind the database each read replica is.
+
+    Returns:
+        JSON list of each replica's URL, and how many writes and seconds it's behind
+    """
+    try:
+        return jsonify(replicas=album_manager.replica_lag())
+    except:
+        traceback.print_exc()
+        logger.warning("Failed to report replica lag. Error page returned.")
+        return render_template("error.html")
+
+
 @app.route("/favicon.ico")
 def favicon():
     """Show pitchfork favicon in browser."""
@@ -172,11 +306,34 @@ def favicon():
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Run web application")
-    parser.add_argument("--model", "-m", help="Path to trained model object")
+    parser.add_argument(
+        "--model", "-m",
+        help="Path to trained model object (joblib pipeline, or ONNX graph ending in \".onnx\")"
+    )
     args = parser.parse_args()
 
     # Preload the trained model for extremely fast inference
     pipeline = serialize.load_pipeline(args.model)
     logger.debug("Loaded saved model pipeline")
 
+    # Score the albums this model hasn't yet (all of them, for a newly deployed model)
+    model_version = serialize.model_version(pipeline)
+    album_manager.refresh_predictions(pipeline, model_version)
+
+    # Index the albums by audio features, standardized as the model does if it can
+    index_config = pipeline_config["similar"]["build_index"]
+    album_data = album_manager.album_features(index_config["features"])
+    try:
+        similarity_index = similar.build_index(album_data, pipeline=pipeline, **index_config)
+    except (TypeError, ValueError):
+        logger.warning("Model does not scale the audio features. Similar albums use the albums' own scaling.")
+        similarity_index = similar.build_index(album_data, **index_config)
+
+    # Unpack the model's trees once, so explanations are fast too
+    try:
+        explainer = explain.TreeExplainer(pipeline)
+    except ValueError:
+        explainer = None
+        logger.warning("Model does not support explanations. Predictions will not be explained.")
+
     app.run(debug=app.config["DEBUG"], port=app.config["PORT"], host=app.config["HOST"])
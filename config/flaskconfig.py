@@ -9,6 +9,9 @@ APP_NAME = "pitchfork"
 SQLALCHEMY_TRACK_MODIFICATIONS = True
 SQLALCHEMY_ECHO = False  # If True, SQL queries will be echoed/printed
 MAX_ROWS_SHOW = 1000
+# Signs session cookies. Set it (the same in every app process) so that clients'
+# sessions are kept across processes and restarts.
+SECRET_KEY = os.environ.get("FLASK_SECRET_KEY") or os.urandom(24)
 # Some artists/albums have latin1-incompatible characters (default encoding in RDS),
 # so we need to specify the character set for MySQL to use
 CHARACTER_SET = "utf8mb4"
@@ -36,3 +39,8 @@ else:
         db=DATABASE,
         charset=CHARACTER_SET
     )
+
+# Read replicas of the database, as comma-separated connection strings. Writes go
+# to the database above, and each client reads from replicas that have its latest
+# write, which is kept in its session.
+SQLALCHEMY_REPLICA_URIS = [uri for uri in os.environ.get("SQLALCHEMY_REPLICA_URIS", "").split(",") if uri]
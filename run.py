@@ -2,16 +2,18 @@
 Receives command-line arguments from the user and delegates
 instructions to the appropriate module in `src/`. It handles:
 
-- Database interaction (creation, deletion, ingestion)
+- Database interaction (creation, deletion, ingestion, summary statistics, precomputed predictions, similar albums)
 - Data downloading from source, uploading to S3, and downloading from S3
 - Data processing and model training pipeline
 - Making predictions on new data
 """
 import argparse
 import logging.config
+import os
 import pkg_resources
 
 import botocore
+import fsspec
 import pandas as pd
 import yaml
 
@@ -19,12 +21,18 @@ from config.flaskconfig import SQLALCHEMY_DATABASE_URI
 from src import (
     albums_database,
     clean,
+    compress,
+    cross_validate,
     evaluate_performance,
+    executor,
     load_data,
     model,
     post_process,
+    quantize,
     score_model,
-    serialize
+    serialize,
+    similar,
+    tune
 )
 
 # Using `pkg_resources` here allows Sphinx to find the logging config
@@ -42,6 +50,16 @@ DEFAULT_S3_PATH = "raw/P4KxSpotify.csv"
 DEFAULT_S3_LOCATION = DEFAULT_S3_BUCKET + DEFAULT_S3_PATH
 
 
+def fingerprints_path(path: str) -> str:
+    """Location of the row fingerprints saved alongside a cleaned dataset."""
+    return os.path.splitext(path)[0] + ".fingerprints.csv"
+
+
+def best_config_path(path: str) -> str:
+    """Location of the winning config saved alongside a tuning leaderboard."""
+    return os.path.splitext(path)[0] + ".best_config.yaml"
+
+
 if __name__ == "__main__":
     # Add parsers for both managing database, cleaning data, and modeling
     parser = argparse.ArgumentParser(description="Create/update database, clean data, and model")
@@ -133,6 +151,54 @@ if __name__ == "__main__":
         help="Filename or path to file containing CSV dataset of albums to load",
     )
 
+    # Sub-parser for summarizing the albums in the database from scratch
+    sp_rebuild_stats = subparsers.add_parser(
+        "rebuild_stats",
+        description="Summarize the albums in the database again (only needed if albums were changed or deleted)"
+    )
+    sp_rebuild_stats.add_argument(
+        "--engine_string",
+        default=SQLALCHEMY_DATABASE_URI,
+        help="SQLAlchemy connection URI for database",
+    )
+
+    # Sub-parser for precomputing predictions for the albums in the database
+    sp_precompute = subparsers.add_parser(
+        "precompute_predictions",
+        description="Score the albums in the database that a model hasn't scored yet"
+    )
+    sp_precompute.add_argument(
+        "--engine_string",
+        default=SQLALCHEMY_DATABASE_URI,
+        help="SQLAlchemy connection URI for database",
+    )
+    sp_precompute.add_argument("--model", required=True, help="Path to trained model object")
+    sp_precompute.add_argument(
+        "--batch_size", default=5000, type=int, help="Number of albums to score and save at a time"
+    )
+    sp_precompute.add_argument(
+        "--workers", default=1, type=int, help="Number of worker processes to score with (-1 for one per CPU core)"
+    )
+
+    # Sub-parser for finding similar albums in the database
+    sp_similar = subparsers.add_parser(
+        "similar_albums", description="Find the albums in the database that sound most like an album"
+    )
+    sp_similar.add_argument(
+        "--engine_string",
+        default=SQLALCHEMY_DATABASE_URI,
+        help="SQLAlchemy connection URI for database",
+    )
+    sp_similar.add_argument("--album_id", required=True, type=int, help="Id of the album to compare to")
+    sp_similar.add_argument("-k", type=int, help="Number of albums to find (default: from the config)")
+    sp_similar.add_argument(
+        "--model", help="Path to trained model object, to standardize features as it does (default: as the albums)"
+    )
+    sp_similar.add_argument(
+        "--config", default="config/pipeline.yaml", help="Path to configuration file"
+    )
+    sp_similar.add_argument("--output", "-o", help="Path to save similar albums to (default: log them)")
+
     # Sub-parser for downloading dataset and moving between S3
     sp_load_data = subparsers.add_parser(
         "load_data", description="Download data and move between S3"
@@ -178,8 +244,11 @@ if __name__ == "__main__":
     )
     sp_pipeline.add_argument(
         "step",
-        help="Which step to run",
-        choices=["clean", "model", "predict", "evaluate"]
+        help="Which step to run (`all` runs every step, skipping those whose artifacts are cached)",
+        choices=[
+            "clean", "model", "predict", "evaluate", "all", "tune", "cross_validate", "evaluate_slices",
+            "importance", "compress", "export_onnx", "quantize"
+        ]
     )
     sp_pipeline.add_argument(
         "--input", "-i",
@@ -194,22 +263,77 @@ if __name__ == "__main__":
     sp_pipeline.add_argument(
         "--output", "-o",
         default=None,
-        help="Path to save output CSV (optional, default=None)"
+        help="""Path to save output CSV (optional, default=None). For `all`, the directory
+            or S3 location to save every artifact under."""
     )
     sp_pipeline.add_argument(
         "--model", "-m",
         default=None,
-        help="Path to load trained model object. Only used for `predict`."
+        help="""Path to load trained model object (for `predict`, a joblib pipeline or an ONNX
+            graph ending in ".onnx"). Only used for `predict`, `importance`, `compress`,
+            `export_onnx`, and `quantize`."""
     )
     sp_pipeline.add_argument(
         "--local_copy",
         default=None,
-        help="Local path to save output CSV (optional, default=None)"
+        help="""Local path to save output CSV (optional, default=None). For `all`, the local
+            directory to save every artifact under."""
+    )
+    sp_pipeline.add_argument(
+        "--cache_dir",
+        default=None,
+        help="Directory or S3 location of the artifact cache. Only used for `all` (default=<output>/cache)."
+    )
+    sp_pipeline.add_argument(
+        "--no_cache",
+        default=False,
+        action="store_true",
+        help="If used, run every step without reading or writing the artifact cache. Only used for `all`."
+    )
+    sp_pipeline.add_argument(
+        "--artifacts",
+        nargs="+",
+        default=list(executor.STEPS),
+        choices=list(executor.STEPS),
+        help="Steps whose artifacts to save. Only used for `all` (default: every step)."
+    )
+    sp_pipeline.add_argument(
+        "--workers", "-w",
+        default=1,
+        type=int,
+        help="""Number of worker processes, or -1 for all cores. Only used for `clean`, `predict`,
+            `tune`, `cross_validate`, and `importance`."""
+    )
+    sp_pipeline.add_argument(
+        "--chunksize",
+        default=None,
+        type=int,
+        help="""If used, evaluate predictions this many rows at a time, in constant memory (MAD
+            is then approximate). Only used for `evaluate`."""
+    )
+    sp_pipeline.add_argument(
+        "--validate",
+        default=False,
+        action="store_true",
+        help="""If used, train on the training split only and record the validation split's
+            loss after each boosting stage in the training telemetry (saved alongside the
+            model). Only used for `model`."""
+    )
+    sp_pipeline.add_argument(
+        "--incremental",
+        default=False,
+        action="store_true",
+        help="""If used, only clean rows that are new since the cleaned data at `--local_copy`
+            (or `--output`, if no local copy is given). For `model`, add boosting stages for
+            new rows to the model at `--output` instead of retraining (unless the new rows
+            have drifted). Only used for `clean` and `model`."""
     )
 
     # Interpret and execute commands
     args = parser.parse_args()
     sp_used = args.subparser_name
+    if sp_used == "pipeline" and args.incremental and not args.output:
+        parser.error("--incremental requires --output")
     if sp_used == "create_db":
         albums_database.create_db(args.engine_string)
     elif sp_used == "delete_db":
@@ -241,6 +365,35 @@ if __name__ == "__main__":
         album_manager = albums_database.AlbumManager(engine_string=args.engine_string)
         album_manager.ingest_dataset(args.file)
         album_manager.close()
+    elif sp_used == "rebuild_stats":
+        album_manager = albums_database.AlbumManager(engine_string=args.engine_string)
+        album_manager.rebuild_stats()
+        album_manager.close()
+    elif sp_used == "precompute_predictions":
+        pipeline = serialize.load_pipeline(args.model)
+        album_manager = albums_database.AlbumManager(engine_string=args.engine_string)
+        album_manager.refresh_predictions(
+            pipeline, serialize.model_version(pipeline), batch_size=args.batch_size, n_workers=args.workers
+        )
+        album_manager.close()
+    elif sp_used == "similar_albums":
+        with open(args.config, "r") as config_file:
+            config = yaml.load(config_file, Loader=yaml.FullLoader)["similar"]
+        album_manager = albums_database.AlbumManager(engine_string=args.engine_string)
+        index = similar.build_index(
+            album_manager.album_features(config["build_index"]["features"]),
+            pipeline=serialize.load_pipeline(args.model) if args.model else None,
+            **config["build_index"]
+        )
+        albums = similar.similar_albums(
+            index, album_manager, album_id=args.album_id, k=args.k or config["similar_albums"]["k"]
+        )
+        album_manager.close()
+        if args.output:
+            albums.to_csv(args.output, index=False)
+            logger.info("Similar albums saved to %s", args.output)
+        else:
+            logger.info("Similar albums:\n%s", albums.to_string(index=False))
     elif sp_used == "load_data":
         # Assume data exists already in S3
         if args.download:
@@ -267,52 +420,168 @@ if __name__ == "__main__":
             config = yaml.load(config_file, Loader=yaml.FullLoader)
         logger.debug("Configuration file loaded from %s", args.config)
 
-        if args.input:
+        # Streaming evaluation reads its input in chunks
+        if args.input and not (args.step == "evaluate" and args.chunksize):
             input_data = pd.read_csv(args.input)
             logger.debug("Input df loaded from %s", args.input)
 
-        if args.step == "clean":
+        if args.step == "all":
+            logger.debug("Beginning `all`")
+            output_prefix = args.output or "."
+            if args.no_cache:
+                cache_dir = None
+            else:
+                cache_dir = args.cache_dir or output_prefix.rstrip("/") + "/cache"
+            executor.run_pipeline(
+                args.input,
+                config,
+                output_prefix,
+                cache_dir,
+                local_prefix=args.local_copy,
+                artifacts=args.artifacts
+            )
+        elif args.step == "clean":
             logger.debug("Beginning `clean`")
-            output = clean.clean_dataset(input_data, config["clean"])
+            if args.incremental:
+                # Row fingerprints of the previous snapshot are saved alongside it
+                snapshot_path = args.local_copy or args.output
+                try:
+                    # Read back exactly what was written (e.g. the artist "NA" stays a string)
+                    previous_data = pd.read_csv(
+                        snapshot_path, float_precision="round_trip", keep_default_na=False, na_values=[""]
+                    )
+                    previous_fingerprints = pd.read_csv(
+                        fingerprints_path(snapshot_path), dtype="uint64"
+                    )["fingerprint"]
+                except FileNotFoundError:
+                    logger.info("No previous cleaned data found at %s. Cleaning all rows.", snapshot_path)
+                    # Fingerprint first, since cleaning modifies the raw data in place
+                    fingerprints = clean.fingerprint_rows(input_data, config["clean"])
+                    output = clean.clean_dataset(input_data, config["clean"], n_workers=args.workers)
+                else:
+                    output, fingerprints = clean.clean_incremental(
+                        input_data,
+                        config["clean"],
+                        previous_data,
+                        previous_fingerprints,
+                        n_workers=args.workers
+                    )
+            else:
+                output = clean.clean_dataset(input_data, config["clean"], n_workers=args.workers)
         elif args.step == "model":
             logger.debug("Beginning `model`")
 
+            fitted_pipeline = None
+            if args.incremental:
+                try:
+                    previous_pipeline = serialize.load_pipeline(args.output)
+                except FileNotFoundError:
+                    logger.info("No previous model found at %s. Training from scratch.", args.output)
+                else:
+                    X, y = model.split_predictors_response(
+                        input_data, **config["model"]["split_predictors_response"]
+                    )
+                    fitted_pipeline = model.retrain_pipeline(
+                        previous_pipeline, X, y,
+                        training_data=serialize.load_training_data(args.output),
+                        **config["model"].get("retrain_pipeline", {})
+                    )
+
             # Train on full dataset for deployment
-            X, y = model.split_predictors_response(
+            if fitted_pipeline is None:
+                fitted_pipeline = executor.run_step("model", {"clean": input_data}, config, validate=args.validate)
+        elif args.step == "tune":
+            logger.debug("Beginning `tune`")
+            output, best_params = tune.tune_model(
                 input_data,
-                **config["model"]["split_predictors_response"]
+                config["model"],
+                n_workers=args.workers,
+                **config["tune"]["tune_model"]
             )
-
-            # Model building and training
-            preprocessor = model.make_preprocessor(**config["model"]["make_preprocessor"])
-            model_pipeline = model.make_model(**config["model"]["make_model"])
-            fitted_pipeline = model.train_pipeline(X, y, preprocessor, model_pipeline)
-
-            feature_importances = post_process.get_feature_importance(
-                fitted_pipeline,
-                **config["post_process"]["get_feature_importance"]
+            best_config = dict(config, model=dict(config["model"], make_model=best_params))
+        elif args.step == "cross_validate":
+            logger.debug("Beginning `cross_validate`")
+            output = cross_validate.cross_validate_model(
+                input_data,
+                config["model"],
+                n_workers=args.workers,
+                **config["cross_validate"]["cross_validate_model"]
             )
-            logger.info("Feature importances from training:\n%s", feature_importances)
         elif args.step == "predict":
             logger.debug("Beginning `predict`")
             fitted_pipeline = serialize.load_pipeline(args.model)
             output = score_model.append_predictions(
                 fitted_pipeline,
                 input_data,
+                n_workers=args.workers,
                 **config["score_model"]["append_predictions"]
             )
         elif args.step == "evaluate":
             logger.debug("Beginning `evaluate`")
-            output = evaluate_performance.evaluate_model(
+            if args.chunksize:
+                output = evaluate_performance.evaluate_model_streaming(
+                    args.input,
+                    chunksize=args.chunksize,
+                    **config["evaluate_performance"]["evaluate_model"]
+                )
+            else:
+                output = evaluate_performance.evaluate_model(
+                    input_data,
+                    **config["evaluate_performance"]["evaluate_model"]
+                )
+
+        elif args.step == "importance":
+            logger.debug("Beginning `importance`")
+            fitted_pipeline = serialize.load_pipeline(args.model)
+            output = post_process.get_permutation_importance(
+                fitted_pipeline,
+                input_data,
+                n_workers=args.workers,
+                **config["post_process"]["get_permutation_importance"]
+            ).reset_index()
+        elif args.step == "compress":
+            logger.debug("Beginning `compress`")
+            X, y = model.split_predictors_response(input_data, **config["model"]["split_predictors_response"])
+            X_train, X_val, _, y_train, y_val, _ = model.split_train_val_test(
+                X, y, **config["model"]["split_train_val_test"]
+            )
+            fitted_pipeline, _ = compress.compress_pipeline(
+                serialize.load_pipeline(args.model),
+                X_train, y_train, X_val, y_val,
+                **config["compress"]["compress_pipeline"]
+            )
+        elif args.step == "export_onnx":
+            logger.debug("Beginning `export_onnx`")
+            # Predictions are compared on the input data, if given
+            serialize.export_onnx(
+                serialize.load_pipeline(args.model),
+                args.output,
+                check_data=input_data if args.input else None
+            )
+        elif args.step == "quantize":
+            logger.debug("Beginning `quantize`")
+            # Every leaf and prediction is checked on the input data, if given
+            fitted_pipeline = quantize.quantize_pipeline(
+                serialize.load_pipeline(args.model),
+                check_data=input_data if args.input else None
+            )
+        elif args.step == "evaluate_slices":
+            logger.debug("Beginning `evaluate_slices`")
+            output = evaluate_performance.evaluate_slices(
                 input_data,
-                **config["evaluate_performance"]["evaluate_model"]
+                **config["evaluate_performance"]["evaluate_slices"]
             )
 
-        # Only the output from `model` cannot be saved in CSV format (returns a TMO)
-        if args.output:
-            if args.step != "model":
+        # Only the output from `model`, `compress`, and `quantize` cannot be saved in
+        # CSV format (returns a TMO). `all` and `export_onnx` save their own artifacts.
+        if args.output and args.step not in ["all", "export_onnx"]:
+            if args.step not in ["model", "compress", "quantize"]:
+                # Incremental cleaning also needs the fingerprints of the cleaned rows
+                saved_fingerprints = args.step == "clean" and args.incremental
                 try:
                     output.to_csv(args.output, index=False)
+                    if saved_fingerprints:
+                        fingerprints.to_frame("fingerprint").to_csv(fingerprints_path(args.output), index=False)
                 except botocore.exceptions.ClientError:
                     logger.warning("Failed to upload to S3 (bad permissions). Skipped.")
                 else:
@@ -320,7 +589,16 @@ if __name__ == "__main__":
 
                 if args.local_copy:
                     output.to_csv(args.local_copy, index=False)
+                    if saved_fingerprints:
+                        fingerprints.to_frame("fingerprint").to_csv(fingerprints_path(args.local_copy), index=False)
                     logger.info("Local copy saved to %s", args.local_copy)
+
+                # Tuning also saves the config with the winning model parameters
+                if args.step == "tune":
+                    for path in filter(None, [args.output, args.local_copy]):
+                        with fsspec.open(best_config_path(path), "w") as config_file:
+                            yaml.dump(best_config, config_file, sort_keys=False)
+                        logger.info("Best config saved to %s", best_config_path(path))
             else:
                 serialize.save_pipeline(fitted_pipeline, args.output)
                 logger.info("Trained model object saved to %s", args.output)
@@ -2,28 +2,52 @@
 Create and manipulate a relational database for holding album data.
 """
 import csv
+import itertools
 import logging.config
 import os
+import threading
 import traceback
+import typing
 from datetime import datetime
 from time import time
 
+import numpy as np
+import pandas as pd
+import sklearn.pipeline
 import sqlalchemy
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Date, Float, Integer, String
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Integer, String, and_, or_
+from sqlalchemy.orm import scoped_session, sessionmaker
 from flask_sqlalchemy import SQLAlchemy
 
-from src import load_data
+from src import dates, load_data, score_model
 
 logger = logging.getLogger(__name__)
 Base = declarative_base()
 
+# Summary statistics of these measures are kept for every combination of the
+# dimensions, each either grouped by or rolled up over (see `AlbumStats`)
+STATS_DIMENSIONS = ["genre", "releaseyear", "recordlabel"]
+STATS_MEASURES = [
+    "score", "danceability", "energy", "key", "loudness", "speechiness",
+    "acousticness", "instrumentalness", "liveness", "valence", "tempo"
+]
+STATS_STATISTICS = ["count", "sum", "sumsq", "min", "max"]
+STATS_ALL = "*"  # Value of a dimension that's rolled up over
+HEARTBEAT_HISTORY = 1000  # Latest writes whose time is kept, to tell how long replicas have lagged
+# Albums are indexed by their audio features, most distinct first, to look up
+# stored predictions by features (see `AlbumManager.find_prediction`)
+FEATURE_INDEX_COLUMNS = [
+    "tempo", "loudness", "energy", "danceability", "valence",
+    "acousticness", "speechiness", "liveness", "instrumentalness", "key"
+]
+
 
 class Albums(Base):
     """Create a data model for the database to capture albums."""
 
     __tablename__ = "albums"
+    __table_args__ = (sqlalchemy.Index("ix_albums_features", *FEATURE_INDEX_COLUMNS),)
 
     id = Column(Integer(), primary_key=True)
     album = Column(String(100), nullable=False)
@@ -49,6 +73,119 @@ class Albums(Base):
         return "Album(%r, %r)" % (self.album, self.artist)
 
 
+class Predictions(Base):
+    """Create a data model for the database to capture each model version's predicted album scores."""
+
+    __tablename__ = "predictions"
+
+    album_id = Column(Integer(), ForeignKey("albums.id"), primary_key=True)
+    model_version = Column(String(32), primary_key=True)
+    score = Column(Float(), nullable=False)
+
+    def __repr__(self):
+        return "Prediction(%r, %r, %r)" % (self.album_id, self.model_version, self.score)
+
+
+class AlbumStats(Base):
+    """
+    Create a data model for the database to capture summary statistics of albums.
+
+    Each row holds the count, sum, sum of squares, minimum, and maximum of each
+    of `STATS_MEASURES` for one group of albums. `grouping` lists the
+    dimensions grouped by, and the others are `STATS_ALL`. Release years are
+    strings, and missing values are empty.
+    """
+
+    __table__ = sqlalchemy.Table(
+        "album_stats",
+        Base.metadata,
+        Column("grouping", String(40), primary_key=True),
+        Column("genre", String(50), primary_key=True),
+        Column("releaseyear", String(4), primary_key=True),
+        Column("recordlabel", String(100), primary_key=True),
+        # Sums are kept in double precision (MySQL's plain FLOAT is single)
+        *[
+            Column("%s_%s" % (measure, statistic), Integer() if statistic == "count" else Float(precision=53))
+            for measure in STATS_MEASURES
+            for statistic in STATS_STATISTICS
+        ]
+    )
+
+    def __repr__(self):
+        return "AlbumStats(%r, %r, %r)" % (self.genre, self.releaseyear, self.recordlabel)
+
+
+class Heartbeat(Base):
+    """
+    Create a data model for the database to capture its latest write.
+
+    Its one row's version goes up with every write through `AlbumManager`, so
+    a read replica with the same version has every write so far.
+    """
+
+    __tablename__ = "heartbeat"
+
+    id = Column(Integer(), primary_key=True)
+    version = Column(Integer(), nullable=False)
+    written_at = Column(DateTime(), nullable=False)
+
+    def __repr__(self):
+        return "Heartbeat(%r, %r)" % (self.version, self.written_at)
+
+
+class HeartbeatHistory(Base):
+    """Create a data model for the database to capture when each of its latest `HEARTBEAT_HISTORY` writes was made."""
+
+    __tablename__ = "heartbeat_history"
+
+    version = Column(Integer(), primary_key=True)
+    written_at = Column(DateTime(), nullable=False)
+
+    def __repr__(self):
+        return "HeartbeatHistory(%r, %r)" % (self.version, self.written_at)
+
+
+def aggregate_stats(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    Summarize albums for every grouping of `STATS_DIMENSIONS`.
+
+    Args:
+        data (:obj:`pandas.DataFrame`): Albums, with `STATS_DIMENSIONS` and
+            `STATS_MEASURES` columns
+
+    Returns:
+        :obj:`pandas.DataFrame` of `AlbumStats` columns, indexed by grouping and dimensions
+    """
+    keys = pd.DataFrame(data={
+        "genre": data["genre"].fillna("").astype(str).str[:50],
+        "releaseyear": pd.to_numeric(data["releaseyear"], errors="coerce").map(
+            lambda year: "" if pd.isna(year) else str(int(year))
+        ),
+        "recordlabel": data["recordlabel"].fillna("").astype(str).str[:100]
+    }, index=data.index)
+    measures = data[STATS_MEASURES].apply(pd.to_numeric, errors="coerce")
+    squares = (measures ** 2).add_suffix("_squared")
+
+    frames = []
+    for is_grouped in itertools.product([True, False], repeat=len(STATS_DIMENSIONS)):
+        frame = keys.copy()
+        for dimension, grouped in zip(STATS_DIMENSIONS, is_grouped):
+            if not grouped:
+                frame[dimension] = STATS_ALL
+        frame.insert(0, "grouping", ",".join(itertools.compress(STATS_DIMENSIONS, is_grouped)))
+        frames.append(pd.concat([frame, measures, squares], axis=1))
+
+    groups = pd.concat(frames, ignore_index=True).groupby(["grouping"] + STATS_DIMENSIONS, sort=False)
+    stats = pd.DataFrame(index=groups.size().index)
+    for measure in STATS_MEASURES:
+        stats[measure + "_count"] = groups[measure].count()
+        stats[measure + "_sum"] = groups[measure].sum()
+        stats[measure + "_sumsq"] = groups[measure + "_squared"].sum()
+        stats[measure + "_min"] = groups[measure].min()
+        stats[measure + "_max"] = groups[measure].max()
+    return stats
+
+
 def create_db(engine_string: str) -> None:
     """Create database from provided engine string."""
     # The Base.metadata object collects and manages Table operations
@@ -88,7 +225,7 @@ def delete_db(engine_string: str) -> None:
 class AlbumManager:
     """Manages Flask <-> SQLAlchemy connection and adds data to database."""
 
-    def __init__(self, app=None, engine_string=None):
+    def __init__(self, app=None, engine_string=None, replica_strings=None):
         """
         Create a SQLAlchemy session.
 
@@ -96,9 +233,17 @@ class AlbumManager:
         and holds the ORM-mapped objects which can be queried. More info:
         https://docs.sqlalchemy.org/en/14/orm/session_basics.html
 
+        Writes go to the (primary) database through `session`. Reads go to read
+        replicas in turn, if there are any, through `read_session`. With a Flask
+        app, the version reads need (see `require_version`) is reset after
+        every request.
+
         Args:
             app (Flask, optional): Flask app. Defaults to None.
             engine_string (str, optional): Engine string. Defaults to None.
+            replica_strings (list(str), optional): Engine strings of read
+                replicas of the database. Defaults to None (the app's
+                `SQLALCHEMY_REPLICA_URIS`, if any).
 
         Raises:
             ValueError: If neither an app nor an engine string is provided.
@@ -114,6 +259,29 @@ class AlbumManager:
         else:
             raise ValueError("Need either an engine string or a Flask app to initialize")
 
+        # Replica sessions are per thread (as Flask-SQLAlchemy's is), and end
+        # with each request so that every request reads the latest data
+        if replica_strings is None and app:
+            replica_strings = app.config.get("SQLALCHEMY_REPLICA_URIS")
+        self.replica_sessions = [
+            scoped_session(sessionmaker(bind=sqlalchemy.create_engine(replica_string)))
+            for replica_string in replica_strings or []
+        ]
+        if app and self.replica_sessions:
+            @app.teardown_appcontext
+            def remove_replica_sessions(exception=None):
+                for replica in self.replica_sessions:
+                    replica.remove()
+                self.require_version(None)
+
+        # Replicas' state is shared by every thread (behind a lock), while the
+        # heartbeat version reads need is each thread's (i.e. each request's)
+        self._lock = threading.Lock()
+        self._next_replica = 0
+        self._replica_versions = [0] * len(self.replica_sessions)  # Latest version seen on each
+        self._local = threading.local()
+        self._tables_checked = False
+
     def __repr__(self):
         return "AlbumManager(%r)" % self.session
 
@@ -125,6 +293,96 @@ class AlbumManager:
             None
         """
         self.session.close()
+        for replica in self.replica_sessions:
+            replica.remove()
+
+    @property
+    def required_version(self) -> typing.Optional[int]:
+        """Heartbeat version this thread's reads need: its latest write's, or one set by `require_version`."""
+        return getattr(self._local, "required_version", None)
+
+    def require_version(self, version: typing.Optional[int]) -> None:
+        """
+        Only read from replicas with a heartbeat version, in this thread.
+
+        A web app can keep each client's `required_version` after it writes
+        (e.g. in its session), and require it for the client's next requests,
+        so that the client reads its own writes from whichever app process
+        serves them.
+
+        Args:
+            version (int): Heartbeat version, or None to read from any replica
+
+        Returns:
+            None
+        """
+        self._local.required_version = version
+
+    def read_session(self, min_version: typing.Optional[int] = None) -> sqlalchemy.orm.Session:
+        """
+        Get a session to read with.
+
+        Replicas take turns, but only those with the heartbeat version
+        `min_version` (i.e. every write up to it) are read from. If none has it
+        yet, or there are no replicas, this is the primary's session.
+
+        Args:
+            min_version (int, optional): Heartbeat version to read. Defaults to
+                None (`required_version`).
+
+        Returns:
+            :obj:`sqlalchemy.orm.Session` on a replica or the primary
+        """
+        if not self.replica_sessions:
+            return self.session
+        if min_version is None:
+            min_version = self.required_version
+        with self._lock:
+            first = self._next_replica
+            self._next_replica = (first + 1) % len(self.replica_sessions)
+        for offset in range(len(self.replica_sessions)):
+            replica = (first + offset) % len(self.replica_sessions)
+            if self._has_version(replica, min_version):
+                return self.replica_sessions[replica]
+        return self.session
+
+    def replica_lag(self) -> typing.List[dict]:
+        """
+        Report how far behind the primary each read replica is.
+
+        A replica's lag is the time since the primary made the first write the
+        replica doesn't have yet (or, if that's older than the primary's
+        `HEARTBEAT_HISTORY` latest writes, since the oldest of them).
+
+        Returns:
+            list(dict) of each replica's URL (without its password), and how
+                many writes and seconds it's behind (None if it can't be read,
+                or the primary has no record of when the writes were made)
+        """
+        primary = self.session.query(Heartbeat.version).filter(Heartbeat.id == 1).scalar() or 0
+        lag = []
+        for replica, replica_session in enumerate(self.replica_sessions):
+            version = self._replica_version(replica)
+            if version is None:
+                versions_behind = seconds_behind = None
+            elif version >= primary:
+                versions_behind, seconds_behind = 0, 0.0
+            else:
+                versions_behind = primary - version
+                first_missing = self.session.query(HeartbeatHistory.written_at).filter(
+                    HeartbeatHistory.version > version
+                ).order_by(HeartbeatHistory.version).first()
+                seconds_behind = None
+                if first_missing:
+                    seconds_behind = (datetime.utcnow() - first_missing.written_at).total_seconds()
+            lag.append({
+                "replica": repr(replica_session.get_bind().url),
+                "versions_behind": versions_behind,
+                "seconds_behind": seconds_behind
+            })
+            if versions_behind:
+                logger.info("Replica %s is %s writes behind the primary", lag[-1]["replica"], versions_behind)
+        return lag
 
     def add_album(
         self,
@@ -146,10 +404,13 @@ class AlbumManager:
         liveness: float,
         valence: float,
         tempo: float,
-    ) -> None:
+    ) -> typing.Optional[int]:
         """
         Seed an existing database with additional albums.
 
+        The album is counted in the summary statistics (see `album_stats`) in
+        the same transaction.
+
         Args:
             album (str): Album title
             artist (str): Artist
@@ -171,11 +432,11 @@ class AlbumManager:
             tempo (float): Spotify tempo score
 
         Returns:
-            None
+            int id of the new album, or None if it couldn't be added
         """
         try:
             # The original dataset provides dates in form (for example) "June 9 2021"
-            reviewdate = datetime.strptime(reviewdate, "%B %d %Y").date()
+            reviewdate = dates.parse_date(reviewdate)
         except ValueError:
             traceback.print_exc()
             logger.error("Failed to parse the given reviewdate \"%s\". Aborting.", reviewdate)
@@ -202,9 +463,11 @@ class AlbumManager:
                 valence=valence,
                 tempo=tempo
             )
-            session.add(new_album)
             try:
-                session.commit()
+                self._ensure_tables()
+                session.add(new_album)
+                self._update_stats([new_album])
+                self._commit_write()
             except sqlalchemy.exc.OperationalError:
                 traceback.print_exc()
                 logger.error(
@@ -213,13 +476,22 @@ class AlbumManager:
                     that you are connected to the Northwestern VPN."""
                 )
                 session.rollback()
+            except sqlalchemy.exc.IntegrityError:
+                traceback.print_exc()
+                logger.error("Could not add %s (it conflicts with a concurrent write). Rolling back.", album)
+                session.rollback()
             else:
                 logger.info("%s added to database", album)
+                return new_album.id
+        return None
 
     def ingest_dataset(self, file_or_path: str) -> None:
         """
         Add entries from a CSV file to the database.
 
+        The albums are counted in the summary statistics (see `album_stats`) in
+        the same transaction.
+
         Args:
             file_or_path (str): Location of dataset to load into database
 
@@ -252,26 +524,26 @@ class AlbumManager:
             local_path = file_or_path
 
         start_time = time()
-        albums = []
         try:
             with open(local_path, "r", encoding="utf-8") as file:
-                reader = csv.DictReader(file)
-                for row in reader:
-                    try:
-                        # Convert reviewdate field to datetime
-                        row["reviewdate"] = datetime.strptime(row["reviewdate"], "%B %d %Y").date()
-                    except ValueError:
-                        # Actual date string doesn't match the given format
-                        # (likely has been parsed before during cleaning and is now in ISO format)
-                        row["reviewdate"] = datetime.strptime(row["reviewdate"], "%Y-%m-%d").date()
-                    albums.append(Albums(**row))
+                rows = list(csv.DictReader(file))
         except FileNotFoundError:
             logger.error("Could not find file %s to ingest", local_path)
             raise
 
+        # Convert the reviewdate field to datetime all at once. Dates may be raw
+        # ("June 9 2021") or have been parsed before during cleaning (ISO format).
+        reviewdates = dates.parse_dates([row["reviewdate"] for row in rows]).dt.date
+        albums = []
+        for row, reviewdate in zip(rows, reviewdates):
+            row["reviewdate"] = reviewdate
+            albums.append(Albums(**row))
+
         try:
+            self._ensure_tables()
             session.add_all(albums)
-            session.commit()
+            self._update_stats(albums)
+            self._commit_write()
         except sqlalchemy.exc.OperationalError:
             traceback.print_exc()
             logger.error(
@@ -280,9 +552,383 @@ class AlbumManager:
                 that you are connected to the Northwestern VPN."""
             )
             session.rollback()
+        except sqlalchemy.exc.IntegrityError:
+            traceback.print_exc()
+            logger.error(
+                "Could not add the contents of %s (they conflict with a concurrent write). Rolling back transaction.",
+                file_or_path
+            )
+            session.rollback()
         else:
             logger.info(
                 "Contents of %s added to database. Time taken: %0.4fs",
                 file_or_path,
                 time() - start_time
             )
+
+    def refresh_predictions(
+        self,
+        pipeline: sklearn.pipeline.Pipeline,
+        model_version: str,
+        batch_size: int = 5000,
+        n_workers: int = 1,
+        album_ids: typing.Optional[typing.List[int]] = None
+    ) -> int:
+        """
+        Score the albums that have no prediction from a model version yet.
+
+        Run it when a model is deployed, to score every album, and after albums
+        are added, to score just those (given as `album_ids`, so the rest aren't
+        searched). Predictions from other model versions are kept, so going back
+        to an earlier model doesn't score every album again.
+
+        Args:
+            pipeline (:obj:`sklearn.pipeline.Pipeline`): Trained model pipeline
+            model_version (str): Version of the pipeline (see
+                `serialize.model_version`)
+            batch_size (int, optional): Albums to score and commit at a time.
+                Defaults to 5000.
+            n_workers (int, optional): Worker processes to score each batch
+                with (see `score_model.get_predictions`). Defaults to 1.
+            album_ids (list(int), optional): Only score these albums (if they
+                have no prediction yet). Defaults to None (every album).
+
+        Returns:
+            int: Number of albums scored
+        """
+        session = self.session
+        start_time = time()
+
+        self._ensure_tables()
+
+        columns = [column.name for column in Albums.__table__.columns]
+        unscored = session.query(*Albums.__table__.columns).outerjoin(
+            Predictions,
+            and_(Predictions.album_id == Albums.id, Predictions.model_version == model_version)
+        ).filter(Predictions.album_id.is_(None)).order_by(Albums.id)
+        if album_ids is not None:
+            unscored = unscored.filter(Albums.id.in_(album_ids))
+
+        n_scored = 0
+        last_id = None
+        while True:
+            batch = unscored if last_id is None else unscored.filter(Albums.id > last_id)
+            rows = batch.limit(batch_size).all()
+            if not rows:
+                break
+
+            data = pd.DataFrame(rows, columns=columns)
+            preds = score_model.get_predictions(pipeline, data, n_workers)
+            session.bulk_insert_mappings(Predictions, [
+                {"album_id": album_id, "model_version": model_version, "score": float(pred)}
+                for album_id, pred in zip(data["id"], preds)
+            ])
+            try:
+                self._commit_write()
+            except sqlalchemy.exc.OperationalError:
+                traceback.print_exc()
+                logger.error("Could not save predictions. Rolling back transaction.")
+                session.rollback()
+                break
+            n_scored += len(rows)
+            last_id = rows[-1].id
+
+        logger.info(
+            "Scored %d albums with model version %s. Time taken: %0.4fs",
+            n_scored,
+            model_version,
+            time() - start_time
+        )
+        return n_scored
+
+    def query_with_predictions(self, model_version: str) -> sqlalchemy.orm.Query:
+        """
+        Query albums along with their predicted scores.
+
+        Args:
+            model_version (str): Version of the model whose predictions to join
+
+        Returns:
+            :obj:`sqlalchemy.orm.Query` of (`Albums`, predicted score) pairs,
+                where the score is None for albums that haven't been scored
+        """
+        return self.read_session().query(Albums, Predictions.score).outerjoin(
+            Predictions,
+            and_(Predictions.album_id == Albums.id, Predictions.model_version == model_version)
+        )
+
+    def find_prediction(self, model_version: str, features: dict) -> typing.Optional[float]:
+        """
+        Look up the stored prediction for an album with exactly the given features.
+
+        Args:
+            model_version (str): Version of the model whose predictions to use
+            features (dict): Value of each feature the model reads, as `Albums`
+                column names (values may be strings, e.g. from a form). None
+                matches a missing value.
+
+        Returns:
+            Predicted score, or None if no scored album has these features
+        """
+        query = self.read_session().query(Predictions.score).join(
+            Albums, Predictions.album_id == Albums.id
+        ).filter(Predictions.model_version == model_version)
+
+        for name, value in features.items():
+            if name not in Albums.__table__.columns:
+                return None
+            column = Albums.__table__.columns[name]
+            if value is None:
+                query = query.filter(column.is_(None))
+                continue
+            try:
+                value = column.type.python_type(value)
+            except (TypeError, ValueError):
+                return None
+            if isinstance(column.type, Float):
+                # Floats may be stored in single precision (e.g. MySQL's FLOAT)
+                tolerance = abs(value) * 1e-6
+                query = query.filter(column.between(value - tolerance, value + tolerance))
+            else:
+                query = query.filter(column == value)
+
+        match = query.first()
+        return match.score if match else None
+
+    def album_features(self, columns: typing.List[str], after_id: typing.Optional[int] = None) -> pd.DataFrame:
+        """
+        Get the id and some columns of every album.
+
+        Args:
+            columns (list(str)): `Albums` columns to get
+            after_id (int, optional): Only get albums with a larger id (i.e.
+                added since). Defaults to None.
+
+        Returns:
+            :obj:`pandas.DataFrame` with an "id" column and `columns`, ordered by id
+        """
+        return _album_frame(self.read_session(), columns, after_id)
+
+    def get_albums(self, album_ids: typing.List[int]) -> typing.List[Albums]:
+        """
+        Get albums by id.
+
+        Args:
+            album_ids (list(int)): Ids of the albums to get
+
+        Returns:
+            list(`Albums`) of the albums that exist, in no particular order
+        """
+        if not album_ids:
+            return []
+        return self.read_session().query(Albums).filter(Albums.id.in_(album_ids)).all()
+
+    def album_stats(
+        self,
+        by: typing.Sequence[str] = (),
+        measures: typing.Optional[typing.List[str]] = None,
+        **filters
+    ) -> pd.DataFrame:
+        """
+        Summarize albums by some of genre, release year, and record label.
+
+        Statistics are read from the `AlbumStats` table, which has every group
+        already summarized, so this takes the same time however many albums
+        there are.
+
+        Args:
+            by (list(str), optional): Dimensions (of `STATS_DIMENSIONS`) to
+                group by. Defaults to none, to summarize all albums together.
+            measures (list(str), optional): Measures (of `STATS_MEASURES`) to
+                summarize. Defaults to None (all of them).
+            **filters: Value of any other dimensions to only summarize albums
+                with (e.g. `genre="Rock"`). Missing values are empty strings.
+
+        Returns:
+            :obj:`pandas.DataFrame` with a row per group: its value of each
+                dimension in `by`, and the count, mean, (sample) standard
+                deviation, minimum, and maximum of each measure
+
+        Raises:
+            ValueError: If a dimension or measure is unknown
+        """
+        measures = STATS_MEASURES if measures is None else list(measures)
+        unknown = (set(by) | set(filters)) - set(STATS_DIMENSIONS) | set(measures) - set(STATS_MEASURES)
+        if unknown:
+            raise ValueError("Unknown dimensions or measures: %s" % ", ".join(sorted(unknown)))
+
+        table = AlbumStats.__table__
+        grouping = [dimension for dimension in STATS_DIMENSIONS if dimension in by or dimension in filters]
+        query = self.read_session().query(table).filter(table.c.grouping == ",".join(grouping))
+        for dimension, value in filters.items():
+            query = query.filter(table.c[dimension] == str(value))
+        stats = pd.DataFrame(query.all(), columns=[column.name for column in table.columns])
+
+        summary = stats[list(by)].copy()
+        for measure in measures:
+            count = stats[measure + "_count"]
+            mean = stats[measure + "_sum"] / count.where(count > 0)
+            variance = (stats[measure + "_sumsq"] - mean * stats[measure + "_sum"]) / (count - 1).where(count > 1)
+            summary[measure + "_count"] = count
+            summary[measure + "_mean"] = mean
+            summary[measure + "_std"] = np.sqrt(variance.clip(lower=0))
+            summary[measure + "_min"] = stats[measure + "_min"]
+            summary[measure + "_max"] = stats[measure + "_max"]
+        return summary.sort_values(list(by)).reset_index(drop=True) if by else summary
+
+    def rebuild_stats(self) -> None:
+        """
+        Summarize every album in the database again, from scratch.
+
+        Albums are counted in the statistics as they're added, so this is only
+        needed if albums are changed or deleted some other way.
+
+        Returns:
+            None
+        """
+        start_time = time()
+        self._ensure_tables()
+        stats = aggregate_stats(_album_frame(self.session, STATS_DIMENSIONS + STATS_MEASURES))
+        self.session.query(AlbumStats).delete()
+        self.session.bulk_insert_mappings(AlbumStats, _stats_records(stats))
+        self._commit_write()
+        logger.info("Summarized albums into %d groups. Time taken: %0.4fs", len(stats), time() - start_time)
+
+    def _ensure_tables(self) -> None:
+        """Create the tables (summarizing the albums) and indexes that databases created by earlier versions don't have."""
+        if self._tables_checked:
+            return
+        self._tables_checked = True
+        inspector = sqlalchemy.inspect(self.session.connection())
+        existing = inspector.get_table_names()
+        for table in [Predictions.__table__, Heartbeat.__table__, HeartbeatHistory.__table__, AlbumStats.__table__]:
+            if table.name not in existing:
+                table.create(self.session.connection())
+        if Albums.__table__.name in existing:
+            indexes = [index["name"] for index in inspector.get_indexes(Albums.__table__.name)]
+            for index in Albums.__table__.indexes:
+                if index.name not in indexes:
+                    index.create(self.session.connection())
+        self.session.commit()
+        if AlbumStats.__table__.name not in existing:
+            self.rebuild_stats()
+
+    def _commit_write(self) -> None:
+        """
+        Commit a write to the primary, along with a new heartbeat, so replicas can be told to have it.
+
+        This thread's reads then need the new heartbeat version (see `required_version`).
+        """
+        session = self.session
+        written_at = datetime.utcnow()
+        updated = session.query(Heartbeat).filter(Heartbeat.id == 1).update(
+            {Heartbeat.version: Heartbeat.version + 1, Heartbeat.written_at: written_at},
+            synchronize_session=False
+        )
+        if not updated:
+            session.add(Heartbeat(id=1, version=1, written_at=written_at))
+        # The heartbeat row stays locked until the commit, so versions are never shared
+        version = session.query(Heartbeat.version).filter(Heartbeat.id == 1).scalar()
+        session.add(HeartbeatHistory(version=version, written_at=written_at))
+        session.query(HeartbeatHistory).filter(
+            HeartbeatHistory.version <= version - HEARTBEAT_HISTORY
+        ).delete(synchronize_session=False)
+        session.commit()
+        self.require_version(max(version, self.required_version or 0))
+
+    def _has_version(self, replica: int, version: typing.Optional[int]) -> bool:
+        """Whether a replica has a heartbeat version (checking it only if it wasn't seen there before)."""
+        if version is None:
+            return True
+        with self._lock:
+            if self._replica_versions[replica] >= version:
+                return True
+        replica_version = self._replica_version(replica)
+        if replica_version is None or replica_version < version:
+            logger.debug("Replica %r doesn't have write %s yet", self.replica_sessions[replica].get_bind().url, version)
+            return False
+        return True
+
+    def _replica_version(self, replica: int) -> typing.Optional[int]:
+        """A replica's latest heartbeat version (0 if it has none, and None if it can't be read)."""
+        session = self.replica_sessions[replica]
+        try:
+            session.rollback()  # Read the latest data, not that of a transaction in progress
+            version = session.query(Heartbeat.version).filter(Heartbeat.id == 1).scalar() or 0
+        except sqlalchemy.exc.SQLAlchemyError:
+            logger.warning("Could not read the heartbeat of replica %r", session.get_bind().url)
+            return None
+        with self._lock:
+            self._replica_versions[replica] = max(self._replica_versions[replica], version)
+        return version
+
+    def _update_stats(self, albums: typing.List[Albums]) -> None:
+        """
+        Count new albums (not yet committed) in the summary statistics.
+
+        Each group's statistics are added to in the database (e.g. `count =
+        count + 1`) rather than read and written back, so concurrent writes
+        don't overwrite each other. Groups are added first if they're missing.
+        """
+        columns = STATS_DIMENSIONS + STATS_MEASURES
+        stats = aggregate_stats(pd.DataFrame(
+            [[getattr(album, column) for column in columns] for album in albums], columns=columns
+        )).sort_index()  # Rows are locked in the same order by every writer
+
+        table = AlbumStats.__table__
+        empty = {
+            "%s_%s" % (measure, statistic): 0 for measure in STATS_MEASURES for statistic in ["count", "sum", "sumsq"]
+        }
+        self.session.execute(
+            _insert_missing(table, self.session.get_bind().dialect.name),
+            [dict(zip(stats.index.names, key), **empty) for key in stats.index]
+        )
+
+        # Parameters are renamed, since columns can't be bound under their own
+        # names: "key_" for the group's key, and "new_" for its new statistics
+        values = {}
+        for measure in STATS_MEASURES:
+            for statistic in ["count", "sum", "sumsq"]:
+                column = table.c["%s_%s" % (measure, statistic)]
+                values[column] = column + sqlalchemy.bindparam("new_" + column.name, type_=column.type)
+            for statistic, is_beyond in [("min", lambda new, old: new < old), ("max", lambda new, old: new > old)]:
+                column = table.c["%s_%s" % (measure, statistic)]
+                new = sqlalchemy.bindparam("new_" + column.name, type_=column.type)
+                values[column] = sqlalchemy.case(
+                    [(new.is_(None), column), (or_(column.is_(None), is_beyond(new, column)), new)],
+                    else_=column
+                )
+        key_columns = [table.c[column] for column in stats.index.names]
+        update = table.update().where(and_(*[
+            column == sqlalchemy.bindparam("key_" + column.name) for column in key_columns
+        ])).values(values)
+        updated = stats.add_prefix("new_").rename_axis(["key_" + column.name for column in key_columns])
+        self.session.execute(update, _stats_records(updated))
+
+
+def _album_frame(
+        session: sqlalchemy.orm.Session,
+        columns: typing.List[str],
+        after_id: typing.Optional[int] = None
+) -> pd.DataFrame:
+    """Ids and some columns of albums (with a larger id than `after_id`), ordered by id."""
+    query = session.query(Albums.id, *[Albums.__table__.columns[column] for column in columns])
+    if after_id is not None:
+        query = query.filter(Albums.id > after_id)
+    return pd.DataFrame(query.order_by(Albums.id).all(), columns=["id"] + list(columns))
+
+
+def _insert_missing(table: sqlalchemy.Table, dialect: str) -> sqlalchemy.sql.Insert:
+    """Insert statement that skips rows whose primary key is taken (e.g. by a concurrent write)."""
+    if dialect == "sqlite":
+        return table.insert().prefix_with("OR IGNORE")
+    if dialect == "mysql":
+        return table.insert().prefix_with("IGNORE")
+    return table.insert()  # Raises IntegrityError if another write added the row first
+
+
+def _stats_records(stats: pd.DataFrame) -> typing.List[dict]:
+    """Rows of statistics as dictionaries of Python values, with None for missing values."""
+    stats = stats.reset_index()
+    values = stats.astype(object).where(stats.notna(), None).to_numpy().tolist()
+    return [dict(zip(stats.columns, row)) for row in values]
@@ -1,10 +1,19 @@
 """
 Clean the dataset before modeling.
 """
+import hashlib
 import logging
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from time import time
 
+import numpy as np
 import pandas as pd
+import yaml
+
+from src import dates
 
 logger = logging.getLogger(__name__)
 
@@ -39,46 +48,319 @@ FILL_MISSING_RECORDLABEL_DATA = (
     "Self-released"         # Coloring Book
 )
 
+# `clean_dataset` runs in three stages: the row-local steps before the manual
+# fill, the (order-dependent) manual fill, and the row-local steps after it
+ALL_STAGES = ("pre_fill", "fill", "post_fill")
+
 
-def clean_dataset(data: pd.DataFrame, config) -> pd.DataFrame:
+def clean_dataset(data: pd.DataFrame, config, n_workers: int = 1) -> pd.DataFrame:
     """
     Perform full data processing pipeline.
 
+    Every step except `fill_missing_manually` works on each row independently, so
+    with `n_workers` > 1 the data is split into contiguous partitions which are
+    cleaned in a process pool. The manual fill is positional (the n-th missing
+    value receives the n-th replacement), so each partition is handed the slice of
+    replacement values matching its missing rows. The result is identical to a
+    serial run.
+
     Args:
         data (:obj:`pandas.DataFrame`): Raw data
         config (dict): Config file as read in by PyYAML
+        n_workers (int, optional): Number of worker processes. Defaults to 1
+            (serial). Use -1 for one worker per CPU core.
 
     Returns:
         :obj:`pandas.DataFrame` of cleaned data
     """
     start_time = time()
 
-    # Perform cleaning steps specified in config file
-    if "fill_na_with_str" in config:
-        data = fill_na_with_str(data, **config["fill_na_with_str"]["iteration1"])
-        data = fill_na_with_str(data, **config["fill_na_with_str"]["iteration2"])
+    if n_workers == -1:
+        n_workers = os.cpu_count() or 1
+
+    if n_workers > 1 and len(data.index) > 1:
+        data = _clean_dataset_parallel(data, config, n_workers)
+    else:
+        data = _clean_partition(data, config)
+
+    logger.info("Completed data cleaning process. Time taken: %0.4fs", time() - start_time)
+    return data
+
+
+def _clean_partition(data: pd.DataFrame, config, stages: tuple = ALL_STAGES, fill_with=None) -> pd.DataFrame:
+    """
+    Perform the cleaning steps specified in the config file for one partition.
+
+    Args:
+        data (:obj:`pandas.DataFrame`): Raw data (or a contiguous slice of it)
+        config (dict): Config file as read in by PyYAML
+        stages (tuple(str), optional): Which of the "pre_fill", "fill", and
+            "post_fill" stages to run. Defaults to all of them.
+        fill_with (iterable, optional): Replacement values for
+            `fill_missing_manually`, overriding the config. Defaults to None.
+
+    Returns:
+        :obj:`pandas.DataFrame` of cleaned data
+    """
+    if "pre_fill" in stages:
+        if "fill_na_with_str" in config:
+            data = fill_na_with_str(data, **config["fill_na_with_str"]["iteration1"])
+            data = fill_na_with_str(data, **config["fill_na_with_str"]["iteration2"])
+
+        if "convert_str_to_datetime" in config:
+            data = convert_str_to_datetime(data, **config["convert_str_to_datetime"])
+
+        if "approximate_missing_year" in config:
+            data = approximate_missing_year(data, **config["approximate_missing_year"])
+
+        if "convert_datetime_to_date" in config:
+            data = convert_datetime_to_date(data, **config["convert_datetime_to_date"])
+
+    # A partition without any missing values gets an empty slice of replacements
+    if "fill" in stages and "fill_missing_manually" in config and fill_with != []:
+        kwargs = dict(config["fill_missing_manually"])
+        if fill_with is not None:
+            kwargs["fill_with"] = fill_with
+        data = fill_missing_manually(data, **kwargs)
+
+    if "post_fill" in stages:
+        if "strip_whitespace" in config:
+            data = strip_whitespace(data, **config["strip_whitespace"])
+
+        if "bucket_values_together" in config:
+            data = bucket_values_together(data, **config["bucket_values_together"]["iteration1"])
+            data = bucket_values_together(data, **config["bucket_values_together"]["iteration2"])
 
-    if "convert_str_to_datetime" in config:
-        data = convert_str_to_datetime(data, **config["convert_str_to_datetime"])
+    return data
+
+
+def _clean_dataset_parallel(data: pd.DataFrame, config, n_workers: int) -> pd.DataFrame:
+    """
+    Clean contiguous partitions of the data in a process pool.
+
+    If no step before `fill_missing_manually` can change which values of its
+    column are missing, the replacement values are divided among partitions up
+    front and each partition is cleaned in a single pass. Otherwise the row-local
+    steps before the fill run first, and the fill and remaining steps run in a
+    second pass once the missing rows are known.
+
+    Args:
+        data (:obj:`pandas.DataFrame`): Raw data
+        config (dict): Config file as read in by PyYAML
+        n_workers (int): Number of worker processes
+
+    Returns:
+        :obj:`pandas.DataFrame` of cleaned data
+    """
+    bounds = np.linspace(0, len(data.index), num=min(n_workers, len(data.index)) + 1, dtype=int)
+    partitions = [data.iloc[start:stop] for start, stop in zip(bounds[:-1], bounds[1:])]
+    logger.debug("Cleaning %d partitions with %d workers", len(partitions), n_workers)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        if "fill_missing_manually" in config and _fill_column_changed_before_fill(config):
+            partitions = list(executor.map(
+                _clean_partition, partitions, repeat(config), repeat(("pre_fill",))
+            ))
+            stages = ("fill", "post_fill")
+        else:
+            stages = ALL_STAGES
+
+        fill_slices = _split_manual_fill(partitions, config)
+        partitions = list(executor.map(
+            _clean_partition, partitions, repeat(config), repeat(stages), fill_slices
+        ))
+
+    return pd.concat(partitions)
+
+
+def _fill_column_changed_before_fill(config) -> bool:
+    """Whether a step before `fill_missing_manually` fills NAs in the column it fills."""
+    fill_column = config["fill_missing_manually"].get("colname", "recordlabel")
 
+    filled_columns = set()
+    if "fill_na_with_str" in config:
+        filled_columns.update(
+            config["fill_na_with_str"][iteration].get("colname", "genre")
+            for iteration in ("iteration1", "iteration2")
+        )
     if "approximate_missing_year" in config:
-        data = approximate_missing_year(data, **config["approximate_missing_year"])
+        filled_columns.add(config["approximate_missing_year"].get("fill_column", "releaseyear"))
+
+    return fill_column in filled_columns
+
 
-    if "convert_datetime_to_date" in config:
-        data = convert_datetime_to_date(data, **config["convert_datetime_to_date"])
+def _split_manual_fill(partitions: typing.List[pd.DataFrame], config) -> typing.List[typing.Optional[list]]:
+    """
+    Divide the `fill_missing_manually` replacement values among partitions.
 
+    Args:
+        partitions (list(:obj:`pandas.DataFrame`)): Contiguous partitions of the data,
+            in their original order
+        config (dict): Config file as read in by PyYAML
+
+    Returns:
+        list of replacement values for each partition (`None` for every partition
+            if the config does not include `fill_missing_manually`)
+
+    Raises:
+        `ValueError` if the number of replacement values does not match the number
+            of missing values
+    """
+    if "fill_missing_manually" not in config:
+        return [None] * len(partitions)
+
+    colname = config["fill_missing_manually"].get("colname", "recordlabel")
+    fill_with = list(config["fill_missing_manually"].get("fill_with", FILL_MISSING_RECORDLABEL_DATA))
+
+    # Partitions without the column are left untouched, as in a serial run
+    counts = [
+        int(pd.isna(partition[colname]).sum()) if colname in partition.columns else 0
+        for partition in partitions
+    ]
+    if any(colname in partition.columns for partition in partitions) and sum(counts) != len(fill_with):
+        raise ValueError(
+            "Received %d values to fill %d missing rows in column %s"
+            % (len(fill_with), sum(counts), colname)
+        )
+
+    offsets = np.cumsum([0] + counts)
+    return [fill_with[start:stop] for start, stop in zip(offsets[:-1], offsets[1:])]
+
+
+def fingerprint_rows(data: pd.DataFrame, config) -> pd.Series:
+    """
+    Fingerprint raw rows to tell which ones have been cleaned before.
+
+    Two rows share a fingerprint only if they would be cleaned identically: the
+    fingerprint covers the row's values, the cleaning config, and (for rows
+    missing a value that `fill_missing_manually` fills) the replacement value
+    the row's position among the missing rows gives it. The list of replacement
+    values is left out of the config, so extending it for newly added rows keeps
+    the fingerprints of existing rows.
+
+    Args:
+        data (:obj:`pandas.DataFrame`): Raw data
+        config (dict): Config file as read in by PyYAML
+
+    Returns:
+        :obj:`pandas.Series` of `uint64` fingerprints, one per row
+    """
+    fill_value = pd.Series(None, index=data.index, dtype=object)
+    hashed_config = dict(config)
     if "fill_missing_manually" in config:
-        data = fill_missing_manually(data, **config["fill_missing_manually"])
+        fill_config = dict(config["fill_missing_manually"])
+        fill_with = list(fill_config.pop("fill_with", FILL_MISSING_RECORDLABEL_DATA))
+        hashed_config["fill_missing_manually"] = fill_config
+
+        colname = fill_config.get("colname", "recordlabel")
+        if colname in data.columns:
+            missing = pd.isna(data[colname])
+            fill_rank = missing.cumsum()[missing] - 1
+            fill_value[missing] = [fill_with[rank] if rank < len(fill_with) else None for rank in fill_rank]
+
+    config_hash = int(hashlib.sha1(yaml.dump(hashed_config).encode("utf-8")).hexdigest()[:16], 16)
+    components = pd.DataFrame({
+        "row": pd.util.hash_pandas_object(data, index=False),
+        "fill_value": pd.util.hash_pandas_object(fill_value, index=False),
+        "config": np.uint64(config_hash)
+    })
+    return pd.util.hash_pandas_object(components, index=False)
+
+
+def clean_incremental(
+        data: pd.DataFrame,
+        config,
+        previous_data: pd.DataFrame,
+        previous_fingerprints: pd.Series,
+        n_workers: int = 1
+) -> typing.Tuple[pd.DataFrame, pd.Series]:
+    """
+    Clean only the rows that are new or changed since a previous cleaned snapshot.
 
-    if "strip_whitespace" in config:
-        data = strip_whitespace(data, **config["strip_whitespace"])
+    Rows whose fingerprint appears in the previous snapshot are taken from it as is;
+    the rest are cleaned with `clean_dataset`. The order-dependent manual fill hands
+    each new missing row the replacement value it would get in a full run, so the
+    output is identical to cleaning all of `data` from scratch. If an earlier step
+    can change which rows of the fill column are missing, positions can't be known
+    up front and all rows are cleaned.
 
-    if "bucket_values_together" in config:
-        data = bucket_values_together(data, **config["bucket_values_together"]["iteration1"])
-        data = bucket_values_together(data, **config["bucket_values_together"]["iteration2"])
+    Args:
+        data (:obj:`pandas.DataFrame`): Raw data
+        config (dict): Config file as read in by PyYAML
+        previous_data (:obj:`pandas.DataFrame`): Previously cleaned data
+        previous_fingerprints (:obj:`pandas.Series`): Fingerprints of the raw rows
+            behind `previous_data`, in the same order
+        n_workers (int, optional): Number of worker processes used to clean the new
+            rows. Defaults to 1 (serial).
 
-    logger.info("Completed data cleaning process. Time taken: %0.4fs", time() - start_time)
-    return data
+    Returns:
+        tuple(:obj:`pandas.DataFrame`, :obj:`pandas.Series`): Cleaned data and the
+            fingerprints of its raw rows
+    """
+    start_time = time()
+    fingerprints = fingerprint_rows(data, config)
+
+    if "fill_missing_manually" in config and _fill_column_changed_before_fill(config):
+        logger.warning("Manual fill column is changed by an earlier step. Cleaning all rows.")
+        return clean_dataset(data, config, n_workers=n_workers), fingerprints
+
+    # Previously cleaned rows, looked up by fingerprint (duplicates are identical)
+    previous_data = previous_data.set_axis(previous_fingerprints.to_numpy(), axis=0)
+    previous_data = previous_data[~previous_data.index.duplicated()]
+    is_new = ~fingerprints.isin(previous_data.index)
+    logger.info("Cleaning %d new or changed rows out of %d", is_new.sum(), len(data.index))
+
+    cleaned = previous_data
+    if is_new.any():
+        new_data_config = config
+        if "fill_missing_manually" in config:
+            new_data_config = dict(config, fill_missing_manually=_manual_fill_for_rows(
+                data, is_new, config["fill_missing_manually"]
+            ))
+        new_data = clean_dataset(data[is_new].copy(), new_data_config, n_workers=n_workers)
+        cleaned = pd.concat([cleaned, new_data.set_axis(fingerprints[is_new].to_numpy(), axis=0)])
+
+    # Reassemble in the order of the raw data
+    cleaned = cleaned[~cleaned.index.duplicated()].loc[fingerprints.to_numpy()]
+    cleaned.index = data.index
+
+    logger.info("Completed incremental cleaning process. Time taken: %0.4fs", time() - start_time)
+    return cleaned, fingerprints
+
+
+def _manual_fill_for_rows(data: pd.DataFrame, rows: pd.Series, fill_config: dict) -> dict:
+    """
+    Select the `fill_missing_manually` replacement values for a subset of rows.
+
+    Args:
+        data (:obj:`pandas.DataFrame`): All raw data
+        rows (:obj:`pandas.Series`): Boolean mask of the rows to be cleaned
+        fill_config (dict): `fill_missing_manually` section of the config
+
+    Returns:
+        dict of `fill_missing_manually` settings with only the replacement values
+            for the missing rows in the subset
+
+    Raises:
+        `ValueError` if the number of replacement values does not match the number
+            of missing values in all of the data
+    """
+    colname = fill_config.get("colname", "recordlabel")
+    fill_with = list(fill_config.get("fill_with", FILL_MISSING_RECORDLABEL_DATA))
+    if colname not in data.columns:
+        return dict(fill_config)
+
+    missing = pd.isna(data[colname])
+    if missing.sum() != len(fill_with):
+        raise ValueError(
+            "Received %d values to fill %d missing rows in column %s"
+            % (len(fill_with), missing.sum(), colname)
+        )
+
+    # Position of each missing row among all missing rows
+    fill_rank = missing.cumsum() - 1
+    subset_fill_with = [fill_with[rank] for rank in fill_rank[missing & rows]]
+    return dict(fill_config, fill_with=subset_fill_with)
 
 
 def convert_str_to_datetime(
@@ -105,8 +387,12 @@ def convert_str_to_datetime(
         logger.warning("%s not found in columns. Returning original data.", colname)
         return data
 
-    # Convert to datetime
-    data[colname] = pd.to_datetime(data[colname], format=datetime_format)
+    # Convert to datetime. Each unique string is parsed once; columns that
+    # don't hold strings are passed straight to pandas.
+    if pd.api.types.is_object_dtype(data[colname]):
+        data[colname] = dates.parse_dates(data[colname], formats=(datetime_format,))
+    else:
+        data[colname] = pd.to_datetime(data[colname], format=datetime_format)
     logger.debug("Converted column %s to datetime format", colname)
 
     return data
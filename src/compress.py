@@ -0,0 +1,253 @@
+"""
+Shrink a trained model pipeline to a latency or accuracy budget, by truncating
+its boosting stages or distilling it into a smaller model.
+"""
+import logging
+import pickle
+import typing
+from copy import deepcopy
+from time import perf_counter, time
+
+import numpy as np
+import pandas as pd
+import sklearn.base
+import sklearn.pipeline
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.linear_model import Ridge
+from sklearn.pipeline import Pipeline, make_pipeline
+from sklearn.preprocessing import PolynomialFeatures
+
+from src import model
+
+logger = logging.getLogger(__name__)
+
+# Student models for `compress_pipeline`'s distillation, and their default parameters
+STUDENTS = {
+    "shallow": lambda **params: GradientBoostingRegressor(
+        **dict({"max_depth": 2, "n_estimators": 50, "learning_rate": 0.1, "random_state": 0}, **params)
+    ),
+    "linear": lambda **params: make_pipeline(
+        PolynomialFeatures(degree=2, interaction_only=True, include_bias=False),
+        Ridge(**dict({"alpha": 1.0}, **params))
+    )
+}
+
+
+def compress_pipeline(
+        trained_pipeline: sklearn.pipeline.Pipeline,
+        X_train: pd.DataFrame,
+        y_train: list,
+        X_val: pd.DataFrame,
+        y_val: list,
+        max_rmse_increase: typing.Optional[float] = None,
+        max_latency_ms: typing.Optional[float] = None,
+        distill: typing.Optional[str] = None,
+        distill_params: typing.Optional[dict] = None,
+        n_timing_rows: int = 200
+) -> typing.Tuple[sklearn.pipeline.Pipeline, pd.DataFrame]:
+    """
+    Find the smallest pipeline within an accuracy or latency budget.
+
+    Candidates are the pipeline itself, the pipeline truncated to its first
+    boosting stages, and (if `distill` is given) a student model trained on the
+    pipeline's predictions for the training data, behind the same preprocessor.
+    The truncated pipeline keeps the fewest stages whose validation RMSE is
+    within `max_rmse_increase` of the full pipeline's or, with only a latency
+    budget, the most accurate number of stages within `max_latency_ms`.
+
+    The candidates within every given budget are compared: with a latency
+    budget, the most accurate is chosen, and otherwise the smallest. Latency is
+    that of predicting one row at a time (as `/predict` does): the candidates
+    share the preprocessor, so it's timed once, and each predictor separately.
+
+    Args:
+        trained_pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted pipeline
+        X_train (:obj:`pandas.DataFrame`): Features to distill on, and to
+            refit a truncated "hist_gradient_boosting" predictor on
+        y_train (array-like): Training targets, to report RMSE and refit a
+            truncated "hist_gradient_boosting" predictor
+        X_val (:obj:`pandas.DataFrame`): Features to choose stages, and time
+            predictions, on. These should be held out from training.
+        y_val (array-like): Validation targets
+        max_rmse_increase (float, optional): Largest acceptable increase in
+            validation RMSE. Defaults to None.
+        max_latency_ms (float, optional): Largest acceptable prediction latency
+            per row, in milliseconds. Defaults to None.
+        distill (str, optional): Student model, one of `STUDENTS` ("shallow"
+            boosting or "linear" with pairwise interactions). Defaults to None.
+        distill_params (dict, optional): Parameters for the student model.
+            Defaults to None.
+        n_timing_rows (int, optional): Rows to time predictions on. Defaults to 200.
+
+    Returns:
+        tuple(:obj:`sklearn.pipeline.Pipeline`, :obj:`pandas.DataFrame`): The
+            chosen pipeline (with the report as its telemetry), and each
+            candidate's number of stages, RMSE, latency, and size
+    """
+    start_time = time()
+    if max_rmse_increase is None and max_latency_ms is None:
+        raise ValueError("Give at least one of `max_rmse_increase` or `max_latency_ms`")
+    if distill is not None and distill not in STUDENTS:
+        raise ValueError("Unknown student model \"%s\" (options: %s)" % (distill, ", ".join(STUDENTS)))
+
+    X_train = model.validate_dataframe(X_train.copy())
+    X_val = model.validate_dataframe(X_val.copy())
+    preprocessor = trained_pipeline["preprocessor"]
+    timing_rows = [X_val.iloc[[row]] for row in range(min(n_timing_rows, len(X_val)))]
+    preprocessor_ms = _median_ms(preprocessor.transform, timing_rows)
+    timing_rows = [preprocessor.transform(row) for row in timing_rows]
+    staged_rmse = np.array(model.staged_rmse(trained_pipeline["predictor"], preprocessor.transform(X_val), y_val))
+    latency = {}
+
+    def stage_latency(n_stages):
+        if n_stages not in latency:
+            predictor = trained_pipeline["predictor"] if n_stages == len(staged_rmse) else \
+                truncate_pipeline(trained_pipeline, n_stages, X_train, y_train)["predictor"]
+            latency[n_stages] = preprocessor_ms + _median_ms(predictor.predict, timing_rows)
+        return latency[n_stages]
+
+    n_stages = len(staged_rmse)
+    if max_rmse_increase is not None:
+        n_stages = int(np.argmax(staged_rmse <= staged_rmse[-1] + max_rmse_increase)) + 1
+    elif stage_latency(n_stages) > max_latency_ms:
+        # Latency grows with the number of stages, so the most stages within the
+        # budget can be found by bisection
+        low, high = 1, n_stages
+        while low < high:
+            middle = (low + high + 1) // 2
+            low, high = (middle, high) if stage_latency(middle) <= max_latency_ms else (low, middle - 1)
+        n_stages = int(np.argmin(staged_rmse[:low])) + 1
+
+    candidates = {
+        "original": (trained_pipeline, stage_latency(len(staged_rmse))),
+        "truncated": (truncate_pipeline(trained_pipeline, n_stages, X_train, y_train), stage_latency(n_stages))
+    }
+    if distill:
+        student = STUDENTS[distill](**(distill_params or {}))
+        student.fit(preprocessor.transform(X_train), trained_pipeline.predict(X_train))
+        student_pipeline = Pipeline(steps=[
+            ("preprocessor", preprocessor),
+            ("predictor", student)
+        ])
+        candidates["distilled_" + distill] = (student_pipeline, preprocessor_ms + _median_ms(student.predict, timing_rows))
+
+    rows = []
+    for name, (pipe, latency_ms) in candidates.items():
+        val_rmse = _rmse(pipe.predict(X_val), y_val)
+        rows.append({
+            "candidate": name,
+            "n_stages": _n_stages(pipe["predictor"]),
+            "train_rmse": _rmse(pipe.predict(X_train), y_train),
+            "val_rmse": val_rmse,
+            "rmse_increase": val_rmse - staged_rmse[-1],
+            "latency_ms": latency_ms,
+            "batch_latency_us": _batch_latency(pipe, X_val),
+            "size_kb": len(pickle.dumps(pipe["predictor"])) / 1024
+        })
+    report = pd.DataFrame(rows)
+
+    within_budget = pd.Series(True, index=report.index)
+    if max_rmse_increase is not None:
+        within_budget &= report["rmse_increase"] <= max_rmse_increase
+    if max_latency_ms is not None:
+        within_budget &= report["latency_ms"] <= max_latency_ms
+    if not within_budget.any():
+        logger.warning("No candidate is within budget. Keeping the original pipeline.")
+        within_budget[report["candidate"] == "original"] = True
+    sort_by = ["val_rmse", "latency_ms"] if max_latency_ms is not None else ["size_kb", "val_rmse"]
+    chosen = report[within_budget].sort_values(sort_by).index[0]
+    report["selected"] = report.index == chosen
+
+    chosen_pipeline = candidates[report.loc[chosen, "candidate"]][0]
+    compressed = Pipeline(steps=chosen_pipeline.steps)
+    if hasattr(chosen_pipeline, "training_data_"):
+        compressed.training_data_ = chosen_pipeline.training_data_
+    compressed.telemetry_ = {"compression": report.astype(object).where(report.notna(), None).to_dict("records")}
+    logger.info("Compression candidates:\n%s", report)
+    logger.info(
+        "Chose `%s` pipeline. Time taken: %0.4f seconds", report.loc[chosen, "candidate"], time() - start_time
+    )
+    return compressed, report
+
+
+def truncate_pipeline(
+        trained_pipeline: sklearn.pipeline.Pipeline,
+        n_stages: int,
+        X_train: typing.Optional[pd.DataFrame] = None,
+        y_train: typing.Optional[list] = None
+) -> sklearn.pipeline.Pipeline:
+    """
+    Copy a fitted boosting pipeline, keeping only its first `n_stages` stages.
+
+    A "gradient_boosting" predictor's later stages are dropped, so the copy's
+    predictions are the same as the original's staged predictions after
+    `n_stages` stages, and it can still be updated by `model.retrain_pipeline`.
+    A "hist_gradient_boosting" predictor doesn't expose its stages, so it's
+    refit on the training data for `n_stages` iterations without early
+    stopping. This gives the same stages, unless the original stopped early
+    (and so held out some of the training data).
+
+    Args:
+        trained_pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted pipeline
+        n_stages (int): Number of boosting stages to keep
+        X_train (:obj:`pandas.DataFrame`, optional): Features the pipeline was
+            trained on. Only needed for "hist_gradient_boosting". Defaults to None.
+        y_train (array-like, optional): Targets the pipeline was trained on.
+            Only needed for "hist_gradient_boosting". Defaults to None.
+
+    Returns:
+        Truncated :obj:`sklearn.pipeline.Pipeline`
+
+    Raises:
+        ValueError: If the predictor must be refit but no training data is given
+    """
+    if isinstance(trained_pipeline["predictor"], GradientBoostingRegressor):
+        predictor = deepcopy(trained_pipeline["predictor"])
+        predictor.estimators_ = predictor.estimators_[:n_stages]
+        predictor.train_score_ = predictor.train_score_[:n_stages]
+        if hasattr(predictor, "oob_improvement_"):
+            predictor.oob_improvement_ = predictor.oob_improvement_[:n_stages]
+        predictor.n_estimators = predictor.n_estimators_ = n_stages
+    elif X_train is None or y_train is None:
+        raise ValueError("Truncating a hist_gradient_boosting pipeline refits it, which requires the training data")
+    else:
+        predictor = sklearn.base.clone(trained_pipeline["predictor"])
+        predictor.set_params(max_iter=n_stages, early_stopping=False)
+        predictor.fit(trained_pipeline["preprocessor"].transform(model.validate_dataframe(X_train.copy())), y_train)
+
+    pipe = Pipeline(steps=[
+        ("preprocessor", trained_pipeline["preprocessor"]),
+        ("predictor", predictor)
+    ])
+    if hasattr(trained_pipeline, "training_data_"):
+        pipe.training_data_ = trained_pipeline.training_data_
+    return pipe
+
+
+def _n_stages(predictor: sklearn.base.BaseEstimator) -> typing.Optional[int]:
+    """Number of boosting stages of a fitted predictor (None if it isn't boosted)."""
+    if isinstance(predictor, GradientBoostingRegressor):
+        return predictor.n_estimators_
+    return getattr(predictor, "n_iter_", None)
+
+
+def _rmse(preds: np.ndarray, y: list) -> float:
+    """Root mean squared error."""
+    return float(np.sqrt(np.mean((preds - np.asarray(y, dtype=float)) ** 2)))
+
+
+def _median_ms(function: typing.Callable, rows: list) -> float:
+    """Median milliseconds taken to call a function on each row."""
+    timings = []
+    for row in rows:
+        start_time = perf_counter()
+        function(row)
+        timings.append(perf_counter() - start_time)
+    return float(np.median(timings) * 1000)
+
+
+def _batch_latency(pipe: sklearn.pipeline.Pipeline, X: pd.DataFrame) -> float:
+    """Microseconds taken per row to predict a batch of rows at once."""
+    start_time = perf_counter()
+    pipe.predict(X)
+    return (perf_counter() - start_time) / len(X) * 1e6
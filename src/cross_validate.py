@@ -0,0 +1,117 @@
+"""
+Estimate model performance, and its uncertainty, by k-fold cross-validation.
+"""
+import logging
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+import numpy as np
+import pandas as pd
+from sklearn.model_selection import KFold
+
+from src import evaluate_performance, model
+
+logger = logging.getLogger(__name__)
+
+
+def cross_validate_model(
+        data: pd.DataFrame,
+        model_config: dict,
+        y_true_colname: str = "score",
+        y_pred_colname: str = "preds",
+        n_folds: int = 5,
+        n_bootstrap: int = 1000,
+        confidence: float = 0.95,
+        random_state: typing.Optional[int] = None,
+        n_workers: int = 1
+) -> pd.DataFrame:
+    """
+    Train and score a model on each of `n_folds` folds, in parallel processes.
+
+    Every fold's held-out predictions are evaluated with `evaluate_model`, with
+    bootstrap confidence intervals from `bootstrap_metrics`. The out-of-fold
+    predictions for every row are also evaluated together (fold "all").
+
+    Args:
+        data (:obj:`pandas.DataFrame`): Cleaned data
+        model_config (dict): `model` section of the config file
+        y_true_colname (str, optional): Name of the target column. Defaults to
+            "score".
+        y_pred_colname (str, optional): Name to give the predictions. Defaults
+            to "preds".
+        n_folds (int, optional): Number of folds. Defaults to 5.
+        n_bootstrap (int, optional): Bootstrap resamples per fold. Defaults to 1000.
+        confidence (float, optional): Coverage of the intervals. Defaults to 0.95.
+        random_state (int, optional): Seed for assigning folds and resampling.
+            Defaults to None.
+        n_workers (int, optional): Number of worker processes, or -1 for one per
+            CPU core. Defaults to 1.
+
+    Returns:
+        :obj:`pandas.DataFrame` with each fold's metrics, their confidence
+            intervals, and the number of held-out rows they were computed on
+    """
+    start_time = time()
+    if n_workers == -1:
+        n_workers = os.cpu_count() or 1
+
+    X, y = model.split_predictors_response(data, **model_config["split_predictors_response"])
+    folds = list(KFold(n_splits=n_folds, shuffle=True, random_state=random_state).split(X))
+    logger.info("Cross-validating %d folds with %d workers", n_folds, n_workers)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        fold_preds = list(executor.map(
+            _fit_fold,
+            [X.iloc[train_rows] for train_rows, _ in folds],
+            [y.iloc[train_rows] for train_rows, _ in folds],
+            [X.iloc[test_rows] for _, test_rows in folds],
+            [model_config] * n_folds
+        ))
+
+    # Out-of-fold prediction for every row
+    preds = np.empty(len(y))
+    for (_, test_rows), fold_pred in zip(folds, fold_preds):
+        preds[test_rows] = fold_pred
+
+    reports = []
+    fold_rows = [(fold, test_rows) for fold, (_, test_rows) in enumerate(folds)]
+    for fold, test_rows in fold_rows + [("all", np.arange(len(y)))]:
+        results = pd.DataFrame(data={y_true_colname: y.iloc[test_rows].values, y_pred_colname: preds[test_rows]})
+        report = evaluate_performance.evaluate_model(results, y_true_colname, y_pred_colname).merge(
+            evaluate_performance.bootstrap_metrics(
+                results[y_true_colname],
+                results[y_pred_colname],
+                n_bootstrap=n_bootstrap,
+                confidence=confidence,
+                random_state=random_state
+            ),
+            on="metric"
+        )
+        reports.append(report.assign(fold=fold, n_rows=len(test_rows)))
+
+    report = pd.concat(reports, ignore_index=True)[
+        ["fold", "metric", "performance", "ci_lower", "ci_upper", "n_rows"]
+    ]
+    logger.info("Cross-validation complete. Time taken: %0.4fs", time() - start_time)
+    return report
+
+
+def _fit_fold(
+        X_train: pd.DataFrame,
+        y_train: pd.Series,
+        X_test: pd.DataFrame,
+        model_config: dict
+) -> np.ndarray:
+    """Train a model on one fold's training rows and predict its held-out rows."""
+    preprocessor = model.make_preprocessor(**model_config["make_preprocessor"])
+    estimator = model.make_model(
+        categorical_mask=model.categorical_mask(preprocessor),
+        **model_config["make_model"]
+    )
+    fitted_pipeline = model.train_pipeline(
+        X_train, y_train, preprocessor, estimator,
+        **model_config.get("train_pipeline", {})
+    )
+    return fitted_pipeline.predict(X_test)
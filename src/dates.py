@@ -0,0 +1,98 @@
+"""
+Parse album review dates, shared by data cleaning and database ingestion.
+"""
+import logging
+import typing
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# The original dataset provides dates in form (for example) "June 9 2021", but
+# data that has been cleaned before is saved in ISO format ("2021-06-09")
+DATE_FORMATS = ("%B %d %Y", "%Y-%m-%d")
+
+# Every date string parsed in this process, mapped to its `pandas.Timestamp`,
+# for each sequence of candidate formats. Reviews share a limited number of
+# dates, so this stays small.
+_PARSED_DATES = {}
+
+
+def parse_dates(values: typing.Iterable[str], formats: typing.Sequence[str] = DATE_FORMATS) -> pd.Series:
+    """
+    Parse date strings, parsing each unique string only once.
+
+    Strings seen before (in this process) are looked up in a cache. The rest are
+    parsed with each candidate format in turn, vectorized over the unique strings
+    that no earlier format could parse, so the format is detected automatically.
+
+    Args:
+        values (iterable(str)): Date strings. Missing values are kept as `NaT`.
+        formats (list(str), optional): Candidate date formats, tried in order.
+            Defaults to `DATE_FORMATS`.
+
+    Returns:
+        :obj:`pandas.Series` of dtype `datetime64[ns]` (with the same index as
+            `values`, if it is a `pandas.Series`)
+
+    Raises:
+        `ValueError` if a string does not match any of the formats
+    """
+    index = values.index if isinstance(values, pd.Series) else None
+    codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+    cache = _PARSED_DATES.setdefault(tuple(formats), {})
+
+    # Only parse strings the cache hasn't seen
+    new_strings = [string for string in uniques if string not in cache]
+    if new_strings:
+        cache.update(_parse_unique(new_strings, formats))
+        logger.debug("Parsed %d new unique date strings", len(new_strings))
+
+    # Expand unique values back to the original (-1 marks a missing value)
+    parsed = pd.DatetimeIndex([cache[string] for string in uniques] + [pd.NaT])
+    return pd.Series(parsed.take(codes), index=index)
+
+
+def parse_date(date_string: str, formats: typing.Sequence[str] = DATE_FORMATS) -> date:
+    """
+    Parse a single date string.
+
+    Args:
+        date_string (str): Date string
+        formats (list(str), optional): Candidate date formats, tried in order.
+            Defaults to `DATE_FORMATS`.
+
+    Returns:
+        :obj:`datetime.date`
+
+    Raises:
+        `ValueError` if the string does not match any of the formats
+    """
+    cache = _PARSED_DATES.setdefault(tuple(formats), {})
+    if date_string not in cache:
+        for date_format in formats:
+            try:
+                cache[date_string] = pd.Timestamp(datetime.strptime(date_string, date_format))
+                break
+            except (TypeError, ValueError):
+                continue
+        else:
+            raise ValueError("Date \"%s\" does not match any of: %s" % (date_string, ", ".join(formats)))
+
+    return cache[date_string].date()
+
+
+def _parse_unique(strings: typing.List[str], formats: typing.Sequence[str]) -> typing.Dict[str, pd.Timestamp]:
+    """Try each format on the strings that no previous format could parse."""
+    parsed = {}
+    remaining = pd.Index(strings, dtype=object)
+    for date_format in formats:
+        attempt = pd.to_datetime(remaining, format=date_format, errors="coerce")
+        parsed.update(zip(remaining[~attempt.isna()], attempt[~attempt.isna()]))
+        remaining = remaining[attempt.isna()]
+        if remaining.empty:
+            return parsed
+
+    raise ValueError("Date \"%s\" does not match any of: %s" % (remaining[0], ", ".join(formats)))
@@ -0,0 +1,155 @@
+"""
+Encode high-cardinality categorical features (e.g. artist or record label) into a
+fixed number of columns, however many categories there are.
+"""
+import logging
+import typing
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.model_selection import KFold
+
+logger = logging.getLogger(__name__)
+
+
+class TargetEncoder(BaseEstimator, TransformerMixin):
+    """
+    Replace each category with the (smoothed) mean target of its training rows.
+
+    Categories with few rows are shrunk towards the overall mean:
+    ``(count * category_mean + smoothing * overall_mean) / (count + smoothing)``.
+    Unseen categories are encoded as the overall mean.
+
+    To stop the model from learning the targets through their own encodings,
+    `fit_transform` is cross-fitted: each training row is encoded with means
+    computed from the other folds only. `transform` uses means from all training
+    rows.
+
+    Args:
+        n_folds (int, optional): Folds for cross-fitting. Defaults to 5.
+        smoothing (float, optional): Weight of the overall mean, in rows.
+            Defaults to 10.
+        random_state (int, optional): Seed for shuffling rows into folds.
+            Defaults to 0.
+    """
+
+    def __init__(self, n_folds: int = 5, smoothing: float = 10.0, random_state: int = 0):
+        self.n_folds = n_folds
+        self.smoothing = smoothing
+        self.random_state = random_state
+
+    def fit(self, X: pd.DataFrame, y: typing.Iterable[float]) -> "TargetEncoder":
+        """Compute each category's smoothed mean target over all rows."""
+        X = _as_frame(X)
+        self.columns_ = list(X.columns)
+        self.encodings_, self.target_mean_ = _target_encodings(X, np.asarray(y, dtype=float), self.smoothing)
+        return self
+
+    def fit_transform(self, X: pd.DataFrame, y: typing.Iterable[float] = None, **fit_params) -> np.ndarray:
+        """Fit on all rows, and encode each row with means from the other folds."""
+        if y is None:
+            raise ValueError("TargetEncoder requires the target to fit")
+        X = _as_frame(X)
+        y = np.asarray(y, dtype=float)
+        self.fit(X, y)
+
+        encoded = np.empty(X.shape)
+        folds = KFold(n_splits=self.n_folds, shuffle=True, random_state=self.random_state)
+        for fit_rows, encode_rows in folds.split(X):
+            encodings, target_mean = _target_encodings(X.iloc[fit_rows], y[fit_rows], self.smoothing)
+            encoded[encode_rows] = _map_columns(X.iloc[encode_rows], encodings, target_mean)
+        return encoded
+
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        """Encode each category with its mean over all training rows."""
+        return _map_columns(_as_frame(X, self.columns_), self.encodings_, self.target_mean_)
+
+    def get_feature_names(self) -> typing.List[str]:
+        """Names of the output columns."""
+        return ["%s_target" % column for column in self.columns_]
+
+
+class FrequencyEncoder(BaseEstimator, TransformerMixin):
+    """
+    Replace each category with the fraction of training rows in it.
+
+    Unseen categories are encoded as 0.
+    """
+
+    def fit(self, X: pd.DataFrame, y=None) -> "FrequencyEncoder":
+        """Count each category's share of the training rows."""
+        X = _as_frame(X)
+        self.columns_ = list(X.columns)
+        self.encodings_ = [X[column].value_counts(normalize=True, dropna=False) for column in X.columns]
+        return self
+
+    def transform(self, X: pd.DataFrame) -> np.ndarray:
+        """Encode each category with its training frequency."""
+        return _map_columns(_as_frame(X, self.columns_), self.encodings_, 0.0)
+
+    def get_feature_names(self) -> typing.List[str]:
+        """Names of the output columns."""
+        return ["%s_frequency" % column for column in self.columns_]
+
+
+class HashingEncoder(BaseEstimator, TransformerMixin):
+    """
+    One-hot encode categories into a fixed number of buckets by hashing them.
+
+    Every feature shares the same buckets (categories are hashed together with
+    their feature's name), so collisions are possible, but no vocabulary is stored
+    and unseen categories need no special handling.
+
+    Args:
+        n_buckets (int, optional): Number of output columns. Defaults to 64.
+    """
+
+    def __init__(self, n_buckets: int = 64):
+        self.n_buckets = n_buckets
+
+    def fit(self, X: pd.DataFrame, y=None) -> "HashingEncoder":
+        """Record the input columns (there is nothing to learn)."""
+        self.columns_ = list(_as_frame(X).columns)
+        return self
+
+    def transform(self, X: pd.DataFrame) -> scipy.sparse.csr_matrix:
+        """Hash each row's categories into a sparse matrix of bucket counts."""
+        X = _as_frame(X, self.columns_)
+        tokens = (X.columns + "=").values + X.astype(str).values
+        hasher = FeatureHasher(n_features=self.n_buckets, input_type="string", alternate_sign=False)
+        return hasher.transform(tokens.tolist())
+
+    def get_feature_names(self) -> typing.List[str]:
+        """Names of the output columns."""
+        return ["hash_%d" % bucket for bucket in range(self.n_buckets)]
+
+
+def _as_frame(X, columns: typing.Optional[typing.List[str]] = None) -> pd.DataFrame:
+    """Categories as a `pandas.DataFrame` of objects, with the given column names."""
+    X = pd.DataFrame(X, columns=columns) if not isinstance(X, pd.DataFrame) else X
+    return X.astype(object)
+
+
+def _target_encodings(
+        X: pd.DataFrame,
+        y: np.ndarray,
+        smoothing: float
+) -> typing.Tuple[typing.List[pd.Series], float]:
+    """Smoothed mean target of each category, for each column."""
+    target_mean = y.mean()
+    encodings = []
+    for column in X.columns:
+        stats = pd.Series(y, index=X.index).groupby(X[column].values, dropna=False).agg(["sum", "count"])
+        encodings.append((stats["sum"] + smoothing * target_mean) / (stats["count"] + smoothing))
+    return encodings, target_mean
+
+
+def _map_columns(X: pd.DataFrame, encodings: typing.List[pd.Series], default: float) -> np.ndarray:
+    """Look up each column's values in its encoding (unseen values get `default`)."""
+    encoded = np.empty(X.shape)
+    for i, (column, encoding) in enumerate(zip(X.columns, encodings)):
+        encoded[:, i] = X[column].map(encoding).astype(float).fillna(default).values
+    return encoded
@@ -3,7 +3,11 @@ Evaluate the performance of a model through its predictions.
 """
 import math
 import logging
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
 
+import numpy as np
 import pandas as pd
 from sklearn.metrics import max_error, mean_squared_error, median_absolute_error, r2_score
 
@@ -41,6 +45,99 @@ def evaluate_model(results_data: pd.DataFrame, y_true_colname: str, y_pred_colna
     r_squared = r2_score(y_true, y_pred)
     max_err = max_error(y_true, y_pred)
 
+    return _metric_data(mse, rmse, mad, r_squared, max_err)
+
+
+def evaluate_slices(
+        results_data: pd.DataFrame,
+        y_true_colname: str,
+        y_pred_colname: str,
+        slice_columns: typing.List[typing.Union[str, typing.List[str]]],
+        bucket_widths: typing.Optional[typing.Dict[str, float]] = None
+) -> pd.DataFrame:
+    """
+    Evaluate the metrics of `evaluate_model` within each slice of the data.
+
+    Each entry of `slice_columns` is a column (or a list of columns, to slice by
+    every combination of their values) to group by. The metrics of all of its
+    groups are computed in one vectorized `groupby` aggregation.
+
+    Args:
+        results_data (:obj:`pandas.DataFrame`): DataFrame containing (at least)
+            predicted and ground truth values, and the columns to slice by
+        y_true_colname (str): Name of column containing true values
+        y_pred_colname (str): Name of column containing predicted values
+        slice_columns (list(str or list(str))): Columns to slice by
+        bucket_widths (dict, optional): Width of the buckets to slice numeric
+            columns into, e.g. `{"releaseyear": 5}`. Each bucket is labeled by its
+            lower bound. Defaults to None.
+
+    Returns:
+        :obj:`pandas.DataFrame` with the columns sliced by, the group's values,
+            the number of rows in the group, and each metric and value
+    """
+    logger.debug("Evaluating model performance by slice")
+    bucket_widths = bucket_widths or {}
+
+    y_true = results_data[y_true_colname].astype(float)
+    errors = y_true - results_data[y_pred_colname]
+    columns = pd.DataFrame(data={"squared_error": errors ** 2, "absolute_error": errors.abs(), "y_true": y_true})
+
+    reports = []
+    for slice_column in slice_columns:
+        names = [slice_column] if isinstance(slice_column, str) else list(slice_column)
+        keys = [
+            results_data[name] // bucket_widths[name] * bucket_widths[name] if name in bucket_widths
+            else results_data[name]
+            for name in names
+        ]
+        stats = columns.groupby(keys, dropna=False).agg(
+            n_rows=("squared_error", "size"),
+            mse=("squared_error", "mean"),
+            mad=("absolute_error", "median"),
+            max_err=("absolute_error", "max"),
+            true_variance=("y_true", "var")
+        )
+
+        # As in `sklearn.metrics.r2_score`, a group with constant true values has
+        # an R-squared of 1 if predicted perfectly, and 0 otherwise
+        error_ss = stats["mse"] * stats["n_rows"]
+        total_ss = (stats["true_variance"] * (stats["n_rows"] - 1)).fillna(0)
+        stats["rmse"] = np.sqrt(stats["mse"])
+        stats["r_squared"] = np.where(
+            total_ss > 0,
+            1 - error_ss / total_ss.where(total_ss > 0, 1),
+            (error_ss == 0).astype(float)
+        )
+
+        stats = stats.assign(
+            slice=" x ".join(names),
+            group=[
+                " x ".join(_group_label(value) for value in (group if len(names) > 1 else [group]))
+                for group in stats.index
+            ]
+        )
+        reports.append(
+            stats.set_index(["slice", "group", "n_rows"])[["mse", "rmse", "mad", "r_squared", "max_err"]]
+            .stack(dropna=False)
+            .rename_axis(index={None: "metric"})
+            .reset_index(name="performance")
+        )
+
+    report = pd.concat(reports, ignore_index=True)
+    logger.info("Evaluated %d groups across %d slices", len(report.index) // 5, len(slice_columns))
+    return report
+
+
+def _group_label(value) -> str:
+    """Label for a group's value (e.g. a year bucket of 2005.0 is "2005")."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _metric_data(mse: float, rmse: float, mad: float, r_squared: float, max_err: float) -> pd.DataFrame:
+    """Log the metrics and collect them in a DataFrame."""
     # Log results
     logger.info("""
         MSE:\t\t%0.4f
@@ -63,3 +160,263 @@ def evaluate_model(results_data: pd.DataFrame, y_true_colname: str, y_pred_colna
         columns=["metric", "performance"]
     )
     return metric_data
+
+
+def bootstrap_metrics(
+        y_true: typing.Iterable[float],
+        y_pred: typing.Iterable[float],
+        n_bootstrap: int = 1000,
+        confidence: float = 0.95,
+        random_state: typing.Optional[int] = None,
+        batch_size: int = 100
+) -> pd.DataFrame:
+    """
+    Compute bootstrap confidence intervals for the metrics of `evaluate_model`.
+
+    Rows are resampled with replacement `n_bootstrap` times. Each batch of
+    resamples is drawn as one index matrix and every metric is computed along its
+    rows at once, so memory is bounded by `batch_size` resamples at a time.
+
+    Args:
+        y_true (array-like): True values
+        y_pred (array-like): Predicted values
+        n_bootstrap (int, optional): Number of resamples. Defaults to 1000.
+        confidence (float, optional): Coverage of the (percentile) intervals.
+            Defaults to 0.95.
+        random_state (int, optional): Seed for resampling. Defaults to None.
+        batch_size (int, optional): Resamples drawn at once. Defaults to 100.
+
+    Returns:
+        :obj:`pandas.DataFrame` with each metric and the bounds of its interval
+    """
+    y_true = np.asarray(y_true, dtype=float)
+    errors = y_true - np.asarray(y_pred, dtype=float)
+    rng = np.random.default_rng(random_state)
+
+    batches = []
+    for start in range(0, n_bootstrap, batch_size):
+        rows = rng.integers(0, len(y_true), size=(min(batch_size, n_bootstrap - start), len(y_true)))
+        resampled_true = y_true[rows]
+        resampled_errors = errors[rows]
+
+        mse = np.mean(resampled_errors ** 2, axis=1)
+        total_ss = np.sum((resampled_true - resampled_true.mean(axis=1, keepdims=True)) ** 2, axis=1)
+        # As in `evaluate_slices`, a resample with constant true values has an
+        # R-squared of 1 if predicted perfectly, and 0 otherwise
+        r_squared = np.where(
+            total_ss > 0,
+            1 - mse * len(y_true) / np.where(total_ss > 0, total_ss, 1),
+            (mse == 0).astype(float)
+        )
+        batches.append(np.column_stack([
+            mse,
+            np.sqrt(mse),
+            np.median(np.abs(resampled_errors), axis=1),
+            r_squared,
+            np.max(np.abs(resampled_errors), axis=1)
+        ]))
+
+    alpha = (1 - confidence) / 2
+    lower, upper = np.quantile(np.vstack(batches), [alpha, 1 - alpha], axis=0)
+    return pd.DataFrame(data={
+        "metric": ["mse", "rmse", "mad", "r_squared", "max_err"],
+        "ci_lower": lower,
+        "ci_upper": upper
+    })
+
+
+def evaluate_model_streaming(
+        paths: typing.Union[str, typing.List[str]],
+        y_true_colname: str,
+        y_pred_colname: str,
+        chunksize: int = 1000000,
+        relative_accuracy: float = 0.001,
+        n_workers: int = 1
+) -> pd.DataFrame:
+    """
+    Evaluate the same metrics as `evaluate_model`, reading predictions in chunks.
+
+    Each file is read `chunksize` rows at a time into a `MetricAccumulator`, so
+    memory doesn't grow with the number of predictions. Files are evaluated in
+    parallel processes and their accumulators merged. All metrics are exact
+    except MAD, which is within `relative_accuracy` of the exact value (see
+    `QuantileSketch`).
+
+    Args:
+        paths (str or list(str)): Paths to prediction CSV files (e.g. one per
+            partition of a scoring run)
+        y_true_colname (str): Name of column containing true values
+        y_pred_colname (str): Name of column containing predicted values
+        chunksize (int, optional): Rows read at a time. Defaults to 1,000,000.
+        relative_accuracy (float, optional): Relative error bound for MAD.
+            Defaults to 0.001.
+        n_workers (int, optional): Number of worker processes. Defaults to 1.
+
+    Returns:
+        :obj:`pandas.DataFrame` containing metrics and values
+    """
+    logger.debug("Evaluating model performance in chunks of %d rows", chunksize)
+    paths = [paths] if isinstance(paths, str) else list(paths)
+
+    with ProcessPoolExecutor(max_workers=n_workers) as executor:
+        accumulators = executor.map(
+            _accumulate_file,
+            paths,
+            [y_true_colname] * len(paths),
+            [y_pred_colname] * len(paths),
+            [chunksize] * len(paths),
+            [relative_accuracy] * len(paths)
+        )
+        accumulator = reduce(MetricAccumulator.merge, accumulators)
+
+    return accumulator.report()
+
+
+def _accumulate_file(
+        path: str,
+        y_true_colname: str,
+        y_pred_colname: str,
+        chunksize: int,
+        relative_accuracy: float
+) -> "MetricAccumulator":
+    """Accumulate the metrics of one prediction file, chunk by chunk."""
+    accumulator = MetricAccumulator(relative_accuracy)
+    for chunk in pd.read_csv(path, usecols=[y_true_colname, y_pred_colname], chunksize=chunksize):
+        accumulator.update(chunk[y_true_colname].values, chunk[y_pred_colname].values)
+    logger.debug("Accumulated %d predictions from %s", accumulator.count, path)
+    return accumulator
+
+
+class MetricAccumulator:
+    """
+    Mergeable running state for the metrics of `evaluate_model`.
+
+    Squared errors, max error, and the mean and sum of squared deviations of the
+    true values (combined with Chan et al.'s parallel update, which is stable for
+    any number of rows) are exact. Absolute errors go into a `QuantileSketch` for
+    the median.
+
+    Args:
+        relative_accuracy (float, optional): Relative error bound for MAD.
+            Defaults to 0.001.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.001):
+        self.count = 0
+        self.sum_squared_error = 0.0
+        self.max_error = 0.0
+        self.true_mean = 0.0
+        self.true_sum_squares = 0.0
+        self.absolute_errors = QuantileSketch(relative_accuracy)
+
+    def update(self, y_true: np.ndarray, y_pred: np.ndarray) -> "MetricAccumulator":
+        """Add a chunk of predictions."""
+        y_true = np.asarray(y_true, dtype=float)
+        absolute_errors = np.abs(y_true - np.asarray(y_pred, dtype=float))
+        if not len(y_true):
+            return self
+
+        chunk = MetricAccumulator(self.absolute_errors.relative_accuracy)
+        chunk.count = len(y_true)
+        chunk.sum_squared_error = float(np.sum(absolute_errors ** 2))
+        chunk.max_error = float(np.max(absolute_errors))
+        chunk.true_mean = float(np.mean(y_true))
+        chunk.true_sum_squares = float(np.sum((y_true - chunk.true_mean) ** 2))
+        chunk.absolute_errors.update(absolute_errors)
+        return self.merge(chunk)
+
+    def merge(self, other: "MetricAccumulator") -> "MetricAccumulator":
+        """Combine another accumulator's predictions into this one."""
+        count = self.count + other.count
+        if other.count:
+            delta = other.true_mean - self.true_mean
+            self.true_sum_squares += other.true_sum_squares + delta ** 2 * self.count * other.count / count
+            self.true_mean += delta * other.count / count
+        self.count = count
+        self.sum_squared_error += other.sum_squared_error
+        self.max_error = max(self.max_error, other.max_error)
+        self.absolute_errors.merge(other.absolute_errors)
+        return self
+
+    def report(self) -> pd.DataFrame:
+        """
+        Metrics of every prediction added so far, as in `evaluate_model`.
+
+        Raises:
+            ValueError: If no predictions have been added
+        """
+        if not self.count:
+            raise ValueError("No predictions to evaluate")
+        mse = self.sum_squared_error / self.count
+        # As in `evaluate_model`, constant true values have an R-squared of 1 if
+        # predicted perfectly, and 0 otherwise
+        if self.true_sum_squares > 0:
+            r_squared = 1 - self.sum_squared_error / self.true_sum_squares
+        else:
+            r_squared = float(self.sum_squared_error == 0)
+        return _metric_data(
+            mse,
+            math.sqrt(mse),
+            self.absolute_errors.quantile(0.5),
+            r_squared,
+            self.max_error
+        )
+
+
+class QuantileSketch:
+    """
+    Mergeable sketch of the quantiles of non-negative values (a DDSketch).
+
+    Each value is counted in a logarithmically-sized bucket, `(gamma^(i-1),
+    gamma^i]` with `gamma = (1 + relative_accuracy) / (1 - relative_accuracy)`,
+    and estimated by the bucket's midpoint. Any quantile (interpolated as
+    "lower", i.e. an actual value) is then estimated within `relative_accuracy`
+    of its exact value; values at or below `min_value` are treated as 0. The
+    number of buckets, and so the memory used, is at most
+    `log(max / min_value) / log(gamma)` however many values are added: about
+    12,000 buckets for values between 1e-9 and 10 at the default accuracy.
+
+    Args:
+        relative_accuracy (float, optional): Relative error bound. Defaults to
+            0.001.
+        min_value (float, optional): Smallest value distinguished from 0.
+            Defaults to 1e-9.
+    """
+
+    def __init__(self, relative_accuracy: float = 0.001, min_value: float = 1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.zero_count = 0
+        self.counts = pd.Series(dtype="int64")
+
+    def update(self, values: np.ndarray) -> "QuantileSketch":
+        """Add values to the sketch."""
+        values = np.asarray(values, dtype=float)
+        is_zero = values <= self.min_value
+        self.zero_count += int(np.sum(is_zero))
+
+        buckets = np.ceil(np.log(values[~is_zero]) / np.log(self.gamma)).astype("int64")
+        self.counts = self.counts.add(pd.Series(buckets).value_counts(), fill_value=0).astype("int64")
+        return self
+
+    def merge(self, other: "QuantileSketch") -> "QuantileSketch":
+        """Combine another sketch (with the same accuracy) into this one."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracies")
+        self.zero_count += other.zero_count
+        self.counts = self.counts.add(other.counts, fill_value=0).astype("int64")
+        return self
+
+    def quantile(self, q: float) -> float:
+        """Estimate the `q`-th quantile of the values added so far."""
+        count = self.zero_count + int(self.counts.sum())
+        if not count:
+            return math.nan
+
+        rank = q * (count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        counts = self.counts.sort_index()
+        bucket = counts.index[np.searchsorted(self.zero_count + counts.cumsum().values, rank, side="right")]
+        return 2 * self.gamma ** bucket / (self.gamma + 1)
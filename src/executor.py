@@ -0,0 +1,406 @@
+"""
+Run the clean --> model --> predict --> evaluate pipeline in one process as a DAG
+of cached steps.
+
+Each step's artifact is stored in a cache under a key made from the keys of its
+inputs (or, for the raw data, a hash of its contents), the sections of the config
+file the step reads, and the version of the code it runs (the source of every
+`src` module it imports, directly or not). A step whose key is
+already in the cache is skipped, so only steps downstream of a change are rerun.
+"""
+import ast
+import hashlib
+import logging
+import os
+import shutil
+import typing
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import botocore
+import joblib
+import pandas as pd
+import sklearn
+import yaml
+
+from src import clean, evaluate_performance, load_data, model, post_process, score_model, serialize
+
+logger = logging.getLogger(__name__)
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))  # Where `src` modules' source is read from
+
+# Steps in topological order. Each step lists the artifacts it consumes ("raw" is
+# the input data), the config sections it reads, and the modules it calls into
+# (whose own `src` imports are followed to version its code).
+STEPS = {
+    "clean": {
+        "inputs": ["raw"],
+        "config": ["clean"],
+        "modules": ["src.clean"],
+        "path": "data/cleaned/P4KxSpotify.csv"
+    },
+    "model": {
+        "inputs": ["clean"],
+        "config": ["model"],
+        "modules": ["src.model", "src.post_process"],
+        "path": "models/gbt_pipeline.joblib"
+    },
+    "predict": {
+        "inputs": ["model", "clean"],
+        "config": ["score_model"],
+        "modules": ["src.score_model"],
+        "path": "models/predictions.csv"
+    },
+    "evaluate": {
+        "inputs": ["predict"],
+        "config": ["evaluate_performance"],
+        "modules": ["src.evaluate_performance"],
+        "path": "models/performance_report.csv"
+    }
+}
+
+
+def run_pipeline(
+        raw_path: str,
+        config: dict,
+        output_prefix: str,
+        cache_dir: typing.Optional[str],
+        local_prefix: typing.Optional[str] = None,
+        artifacts: typing.Iterable[str] = tuple(STEPS)
+) -> typing.Dict[str, typing.Any]:
+    """
+    Run every pipeline step whose artifact is not cached already, in one process.
+
+    Step outputs are handed to downstream steps in memory; an artifact is only
+    loaded from the cache if its step was skipped and a later step needs it.
+    Artifacts are written to the cache and output locations by background threads
+    while later steps run, and all writes finish before returning.
+
+    Args:
+        raw_path (str): Local or S3 path to the raw data
+        config (dict): Config file as read in by PyYAML
+        output_prefix (str): Local directory or S3 location under which each
+            requested artifact is saved (at the path given in `STEPS`)
+        cache_dir (str): Local directory or S3 location of the artifact cache. If
+            None, no steps are skipped and nothing is cached.
+        local_prefix (str, optional): Local directory to also save requested
+            artifacts under. Defaults to None.
+        artifacts (iterable(str), optional): Steps whose artifacts to save to the
+            output locations. Defaults to all steps.
+
+    Returns:
+        dict of each step's output that was computed or loaded in this process
+    """
+    keys = {"raw": hash_file(raw_path)}
+    cache_paths = {}
+    results = {}
+
+    def get_input(name):
+        # Raw data is read directly, as a local copy of it could be outdated
+        if name == "raw":
+            return pd.read_csv(raw_path)
+        if name not in results:
+            results[name] = load_artifact(cache_paths[name])
+        return results[name]
+
+    # Steps don't modify their inputs, so artifacts can be written while later steps run
+    with ThreadPoolExecutor(max_workers=4) as writer:
+        writes = []
+        for step, spec in STEPS.items():
+            keys[step] = step_key(step, [keys[name] for name in spec["inputs"]], config)
+            if cache_dir:
+                extension = os.path.splitext(spec["path"])[1]
+                cache_paths[step] = "/".join([cache_dir.rstrip("/"), step, keys[step] + extension])
+
+            if step in cache_paths and exists(cache_paths[step]):
+                logger.info("Step `%s` unchanged (key %s). Skipped.", step, keys[step][:12])
+            else:
+                logger.info("Running step `%s`", step)
+                results[step] = run_step(step, {name: get_input(name) for name in spec["inputs"]}, config)
+                if step in cache_paths:
+                    writes.append(writer.submit(save_artifact, results[step], cache_paths[step]))
+
+            if step in artifacts:
+                for prefix in filter(None, [output_prefix, local_prefix]):
+                    destination = "/".join([prefix.rstrip("/"), spec["path"]])
+                    if step in results:
+                        writes.append(writer.submit(save_artifact, results[step], destination))
+                    else:
+                        writes.append(writer.submit(copy_artifact, cache_paths[step], destination))
+
+        # Surface any errors from writing artifacts
+        for write in writes:
+            write.result()
+
+    return results
+
+
+def run_step(step: str, inputs: dict, config: dict, validate: bool = False):
+    """
+    Run a single pipeline step.
+
+    Args:
+        step (str): One of "clean", "model", "predict", or "evaluate"
+        inputs (dict): Artifacts the step consumes, keyed as in `STEPS`
+        config (dict): Config file as read in by PyYAML
+        validate (bool, optional): For "model", train on the training split only
+            (as when tuning) and record the loss on the validation split in the
+            pipeline's telemetry. Defaults to False.
+
+    Returns:
+        :obj:`pandas.DataFrame` or fitted :obj:`sklearn.pipeline.Pipeline`
+    """
+    if step == "clean":
+        return clean.clean_dataset(inputs["raw"], config["clean"])
+
+    if step == "model":
+        # Train on full dataset for deployment
+        X, y = model.split_predictors_response(inputs["clean"], **config["model"]["split_predictors_response"])
+        X_val = y_val = None
+        if validate:
+            X, X_val, _, y, y_val, _ = model.split_train_val_test(X, y, **config["model"]["split_train_val_test"])
+        preprocessor = model.make_preprocessor(**config["model"]["make_preprocessor"])
+        estimator = model.make_model(
+            categorical_mask=model.categorical_mask(preprocessor),
+            **config["model"]["make_model"]
+        )
+        fitted_pipeline = model.train_pipeline(
+            X, y, preprocessor, estimator,
+            X_val=X_val, y_val=y_val,
+            **config["model"].get("train_pipeline", {})
+        )
+
+        # Only the "gradient_boosting" engine provides impurity-based importances
+        if "post_process" in config and hasattr(fitted_pipeline["predictor"], "feature_importances_"):
+            feature_importances = post_process.get_feature_importance(
+                fitted_pipeline,
+                **config["post_process"]["get_feature_importance"]
+            )
+            logger.info("Feature importances from training:\n%s", feature_importances)
+        return fitted_pipeline
+
+    if step == "predict":
+        return score_model.append_predictions(
+            inputs["model"],
+            inputs["clean"],
+            **config["score_model"]["append_predictions"]
+        )
+
+    if step == "evaluate":
+        return evaluate_performance.evaluate_model(
+            inputs["predict"],
+            **config["evaluate_performance"]["evaluate_model"]
+        )
+
+    raise ValueError("Unknown pipeline step: %s" % step)
+
+
+def step_key(step: str, input_keys: typing.List[str], config: dict) -> str:
+    """
+    Compute the cache key of a step's artifact.
+
+    Args:
+        step (str): Name of the step
+        input_keys (list(str)): Keys (or content hashes) of the step's inputs
+        config (dict): Config file as read in by PyYAML
+
+    Returns:
+        str hex digest
+    """
+    spec = STEPS[step]
+    config_sections = {section: config.get(section) for section in spec["config"]}
+
+    key = hashlib.sha256()
+    key.update(step.encode("utf-8"))
+    for input_key in input_keys:
+        key.update(input_key.encode("utf-8"))
+    key.update(yaml.dump(config_sections, sort_keys=True).encode("utf-8"))
+    key.update(code_version(spec["modules"]).encode("utf-8"))
+    return key.hexdigest()
+
+
+def code_version(modules: typing.List[str]) -> str:
+    """
+    Hash the source of the given modules, of every `src` module they import
+    (directly or not), and the versions of key dependencies.
+
+    Args:
+        modules (list(str)): Names of `src` modules, e.g. "src.clean"
+
+    Returns:
+        str hex digest
+    """
+    version = hashlib.sha256()
+    version.update(("pandas=%s;sklearn=%s" % (pd.__version__, sklearn.__version__)).encode("utf-8"))
+    for path in module_sources(modules):
+        with open(path, "rb") as file:
+            version.update(file.read())
+    return version.hexdigest()
+
+
+def module_sources(modules: typing.List[str]) -> typing.List[str]:
+    """
+    Find the source files of `src` modules and of every `src` module they import.
+
+    Imports anywhere in a module count, including those inside functions.
+
+    Args:
+        modules (list(str)): Names of `src` modules, e.g. "src.clean"
+
+    Returns:
+        list(str) of paths, sorted
+    """
+    paths = {}
+    pending = list(modules)
+    while pending:
+        name = pending.pop()
+        path = _module_path(name)
+        if name in paths or path is None:
+            continue
+        paths[name] = path
+
+        with open(path, "r", encoding="utf-8") as file:
+            tree = ast.parse(file.read(), filename=path)
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                pending += [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                # `from src import clean` imports src.clean; `from src.clean import f` imports src.clean
+                pending += [node.module] + [node.module + "." + alias.name for alias in node.names]
+    return sorted(paths.values())
+
+
+def _module_path(name: str) -> typing.Optional[str]:
+    """Source file of a `src` module (None for anything else, e.g. a function imported from one)."""
+    parts = name.split(".")
+    if parts[0] != "src":
+        return None
+    path = os.path.join(SRC_DIR, *parts[1:]) + ".py" if len(parts) > 1 else os.path.join(SRC_DIR, "__init__.py")
+    return path if os.path.isfile(path) else None
+
+
+def hash_file(path: str) -> str:
+    """
+    Hash the contents of a local file, or use the ETag of an S3 object.
+
+    Args:
+        path (str): Local or S3 path
+
+    Returns:
+        str identifying the file's contents
+    """
+    if path.startswith("s3://"):
+        s3bucket, s3path = load_data.parse_s3(path)
+        response = boto3.client("s3").head_object(Bucket=s3bucket, Key=s3path)
+        return response["ETag"].strip('"')
+
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def exists(path: str) -> bool:
+    """Whether a local file or S3 object exists."""
+    if not path.startswith("s3://"):
+        return os.path.exists(path)
+
+    s3bucket, s3path = load_data.parse_s3(path)
+    try:
+        boto3.client("s3").head_object(Bucket=s3bucket, Key=s3path)
+    except botocore.exceptions.ClientError:
+        return False
+    except botocore.exceptions.NoCredentialsError:
+        logger.warning(load_data.MISSING_AWS_CREDENTIALS_MSG)
+        return False
+    return True
+
+
+def load_artifact(path: str):
+    """
+    Load a CSV or joblib artifact.
+
+    S3 artifacts are read through a local copy in the same place they would have
+    gone inside S3, which is reused if it exists already.
+
+    Args:
+        path (str): Local or S3 path
+
+    Returns:
+        :obj:`pandas.DataFrame` or unpickled object
+    """
+    local_path = _local_mirror(path)
+    if local_path.endswith(".joblib"):
+        return joblib.load(local_path)
+
+    # Read back exactly what was written, so a loaded artifact matches the
+    # in-memory one (e.g. the artist "NA" stays a string)
+    return pd.read_csv(local_path, float_precision="round_trip", keep_default_na=False, na_values=[""])
+
+
+def save_artifact(artifact, path: str) -> None:
+    """
+    Save a `pandas.DataFrame` as CSV, or anything else with joblib.
+
+    Args:
+        artifact: Object to save
+        path (str): Local or S3 path
+
+    Returns:
+        None
+    """
+    local_path = load_data.parse_s3(path)[1] if path.startswith("s3://") else path
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    if isinstance(artifact, pd.DataFrame):
+        artifact.to_csv(local_path, index=False)
+    else:
+        joblib.dump(serialize.without_training_data(artifact), local_path)
+
+    if path.startswith("s3://"):
+        load_data.upload_file_to_s3(local_path=local_path, s3path=path)
+    logger.debug("Saved artifact to %s", path)
+
+    # Model pipelines' training telemetry and data summary are saved alongside them
+    if hasattr(artifact, "telemetry_"):
+        serialize.save_telemetry(artifact, path)
+    if hasattr(artifact, "training_data_"):
+        serialize.save_training_data(artifact, path)
+
+
+def copy_artifact(source: str, destination: str) -> None:
+    """
+    Copy an artifact between local and S3 locations.
+
+    Args:
+        source (str): Local or S3 path
+        destination (str): Local or S3 path
+
+    Returns:
+        None
+    """
+    local_source = _local_mirror(source)
+    if destination.startswith("s3://"):
+        load_data.upload_file_to_s3(local_path=local_source, s3path=destination)
+    elif os.path.abspath(local_source) != os.path.abspath(destination):
+        os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+        shutil.copyfile(local_source, destination)
+    logger.debug("Copied artifact from %s to %s", source, destination)
+
+    # Along with a model pipeline's training telemetry and data summary, if it has them
+    if source.endswith(".joblib"):
+        for sidecar_path in [serialize.telemetry_path, serialize.training_data_path]:
+            if exists(sidecar_path(source)):
+                copy_artifact(sidecar_path(source), sidecar_path(destination))
+
+
+def _local_mirror(path: str) -> str:
+    """Local copy of an S3 object (downloaded if needed), or the local path itself."""
+    if not path.startswith("s3://"):
+        return path
+
+    _, local_path = load_data.parse_s3(path)
+    if not os.path.exists(local_path):
+        os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+        load_data.download_file_from_s3(local_path=local_path, s3path=path)
+    return local_path
@@ -0,0 +1,189 @@
+"""
+Explain individual predictions of a trained model pipeline by the contribution of
+each input feature (path-dependent TreeSHAP values).
+"""
+import logging
+import math
+import typing
+from time import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+import sklearn.pipeline
+from sklearn.ensemble import GradientBoostingRegressor
+
+from src import model, post_process
+
+logger = logging.getLogger(__name__)
+
+
+class TreeExplainer:
+    """
+    Exact path-dependent TreeSHAP values for a gradient boosting pipeline.
+
+    A tree's expected prediction given only some of the features is a sum over its
+    leaves: each leaf's value times, for every feature split on along the path to
+    it, either whether the row satisfies the path's conditions on that feature (if
+    the feature is known) or the fraction of training rows that went that way at
+    those splits (if not). Each leaf's term is a product over at most `max_depth`
+    features, so its Shapley values have a closed form over the subsets of those
+    features. The paths of every leaf are unpacked once, when the explainer is
+    created, so explaining rows is a handful of array operations over all leaves
+    of all trees at once.
+
+    The contributions of a row sum (with `expected_value`, the model's average
+    prediction on its training data) to its prediction. Contributions of the
+    preprocessed columns are summed back to the input features they came from
+    (e.g. all of "genre"'s one-hot columns).
+
+    Args:
+        trained_pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted pipeline with
+            a `GradientBoostingRegressor` predictor (the "gradient_boosting" engine)
+    """
+
+    def __init__(self, trained_pipeline: sklearn.pipeline.Pipeline):
+        start_time = time()
+        # ONNX pipelines (see `serialize.OnnxPipeline`) have no trees to unpack
+        if not isinstance(trained_pipeline, sklearn.pipeline.Pipeline):
+            raise ValueError("Explanations require a scikit-learn pipeline")
+        predictor = trained_pipeline["predictor"]
+        if not isinstance(predictor, GradientBoostingRegressor):
+            raise ValueError("Explanations require the \"gradient_boosting\" engine")
+
+        self.preprocessor = trained_pipeline["preprocessor"]
+        self.feature_columns = post_process.feature_columns(self.preprocessor)
+        self.n_columns = predictor.n_features_in_
+
+        leaves = [
+            leaf
+            for tree in predictor.estimators_[:, 0]
+            for leaf in _unpack_leaves(tree.tree_, predictor.learning_rate)
+        ]
+        self.depth = max(1, max(len(conditions) for _, conditions in leaves))
+
+        # Pad every leaf to `depth` features. Padding uses an extra, always-satisfied
+        # column whose Shapley value is 0 and doesn't change the others'.
+        padding = (self.n_columns, -np.inf, np.inf, 1.0)
+        conditions = [sorted(conditions.items()) for _, conditions in leaves]
+        conditions = np.array([
+            [(column, lower, upper, fraction) for column, (lower, upper, fraction) in leaf_conditions]
+            + [padding] * (self.depth - len(leaf_conditions))
+            for leaf_conditions in conditions
+        ])
+        self.leaf_values = np.array([value for value, _ in leaves])
+        self.columns = conditions[:, :, 0].astype(int)
+        self.lower = conditions[:, :, 1]
+        self.upper = conditions[:, :, 2]
+        self.fractions = conditions[:, :, 3]
+
+        # The prediction with no features known: every leaf weighted by its share of
+        # the training rows, on top of the (constant) initial estimate
+        init_value = 0.0 if predictor.init_ == "zero" else predictor.init_.predict(np.zeros((1, self.n_columns)))[0]
+        self.expected_value = float(init_value + np.sum(self.leaf_values * np.prod(self.fractions, axis=1)))
+
+        # Shapley weight of a subset of k of the other features, for each k
+        self.subset_weights = np.array([
+            math.factorial(k) * math.factorial(self.depth - k - 1) / math.factorial(self.depth)
+            for k in range(self.depth)
+        ])
+        # Adds up each leaf's contributions by column (one matrix per path position)
+        self.scatter = [
+            scipy.sparse.csr_matrix(
+                (np.ones(len(leaves)), (np.arange(len(leaves)), self.columns[:, position])),
+                shape=(len(leaves), self.n_columns + 1)
+            )
+            for position in range(self.depth)
+        ]
+        logger.debug(
+            "Explainer built over %d leaves (depth %d). Time taken: %0.4fs",
+            len(leaves), self.depth, time() - start_time
+        )
+
+    def contributions(self, data: pd.DataFrame, chunk_size: typing.Optional[int] = None) -> pd.DataFrame:
+        """
+        Compute each input feature's contribution to each row's prediction.
+
+        Args:
+            data (:obj:`pandas.DataFrame`): Input data, as for predictions
+            chunk_size (int, optional): Rows explained at a time. Defaults to
+                about 2 million (leaf, feature) pairs' worth.
+
+        Returns:
+            :obj:`pandas.DataFrame` with a column per input feature (with the same
+                index as `data`)
+        """
+        X = self.preprocessor.transform(model.validate_dataframe(data))
+        chunk_size = chunk_size or max(1, 2000000 // self.columns.size)
+
+        column_contributions = np.vstack([
+            self._column_contributions(X[start:start + chunk_size])
+            for start in range(0, X.shape[0], chunk_size)
+        ])
+        return pd.DataFrame(
+            data={
+                feature: column_contributions[:, columns].sum(axis=1)
+                for feature, columns in self.feature_columns.items()
+            },
+            index=data.index
+        )
+
+    def _column_contributions(self, X) -> np.ndarray:
+        """Contributions of each preprocessed column, for a chunk of rows."""
+        X = X.toarray() if scipy.sparse.issparse(X) else np.asarray(X)
+        # Trees compare features as float32, so the same rows must satisfy the same splits
+        X = np.hstack([X.astype(np.float32), np.zeros((X.shape[0], 1), dtype=np.float32)]).astype(float)
+
+        # Whether each row satisfies each leaf's conditions on each of its features
+        values = X[:, self.columns]
+        satisfied = ((values > self.lower) & (values <= self.upper)).astype(float)
+
+        contributions = np.zeros((X.shape[0], self.n_columns + 1))
+        for position in range(self.depth):
+            # Sum over subsets of the other features, by subset size: the
+            # coefficients of prod(fraction + satisfied * t) over the others
+            coefficients = [np.ones_like(satisfied[:, :, 0])]
+            for other in range(self.depth):
+                if other == position:
+                    continue
+                coefficients = [
+                    (coefficients[k] * self.fractions[:, other] if k < len(coefficients) else 0)
+                    + (coefficients[k - 1] * satisfied[:, :, other] if k > 0 else 0)
+                    for k in range(len(coefficients) + 1)
+                ]
+            weighted = sum(weight * coefficient for weight, coefficient in zip(self.subset_weights, coefficients))
+
+            leaf_contributions = (
+                self.leaf_values * (satisfied[:, :, position] - self.fractions[:, position]) * weighted
+            )
+            contributions += (self.scatter[position].T @ leaf_contributions.T).T
+
+        return contributions[:, :-1]
+
+
+def _unpack_leaves(
+        tree,
+        learning_rate: float
+) -> typing.List[typing.Tuple[float, typing.Dict[int, typing.Tuple[float, float, float]]]]:
+    """
+    List each leaf's (scaled) value and its conditions on each column.
+
+    A leaf's conditions on a column are the interval `(lower, upper]` the column
+    must fall in to reach it, and the fraction of training rows that went the
+    same way at each split on the column along the path.
+    """
+    leaves = []
+    stack = [(0, {})]
+    while stack:
+        node, conditions = stack.pop()
+        left, right = tree.children_left[node], tree.children_right[node]
+        if left == -1:
+            leaves.append((learning_rate * tree.value[node, 0, 0], conditions))
+            continue
+
+        column, threshold = tree.feature[node], tree.threshold[node]
+        lower, upper, fraction = conditions.get(column, (-np.inf, np.inf, 1.0))
+        for child, child_lower, child_upper in [(left, lower, min(upper, threshold)), (right, max(lower, threshold), upper)]:
+            child_fraction = fraction * tree.weighted_n_node_samples[child] / tree.weighted_n_node_samples[node]
+            stack.append((child, {**conditions, column: (child_lower, child_upper, child_fraction)}))
+    return leaves
@@ -2,21 +2,43 @@
 Build, fit, and evaluate predictive models.
 """
 import logging
+import tracemalloc
 import typing
+from contextlib import contextmanager
+from copy import deepcopy
 from time import time
 
+import joblib
+import numpy as np
 import pandas as pd
+import sklearn.base
 import sklearn.compose
 from numpy import NaN
 from sklearn.compose import ColumnTransformer
 from sklearn.ensemble import GradientBoostingRegressor
-
 from sklearn.model_selection import train_test_split
 from sklearn.pipeline import Pipeline
-from sklearn.preprocessing import StandardScaler, OneHotEncoder
+from sklearn.preprocessing import OneHotEncoder, OrdinalEncoder, StandardScaler
+from sklearn.utils.validation import check_memory
+
+try:
+    from sklearn.ensemble import HistGradientBoostingRegressor
+except ImportError:
+    # Experimental in scikit-learn < 1.0, and must be enabled before importing
+    from sklearn.experimental import enable_hist_gradient_boosting  # noqa: F401
+    from sklearn.ensemble import HistGradientBoostingRegressor
+
+from src import encoders
 
 logger = logging.getLogger(__name__)
 
+# Compact encodings for `make_preprocessor`'s high-cardinality features
+HIGH_CARDINALITY_ENCODERS = {
+    "target": encoders.TargetEncoder,
+    "frequency": encoders.FrequencyEncoder,
+    "hashing": encoders.HashingEncoder
+}
+
 # The exact same columns must be present, and in the exact same order, as the
 # original training data for the pipeline to make predictions (even if the
 # columns aren't used at all by the preprocessor or model)
@@ -124,11 +146,17 @@ def train_pipeline(
         X_train: pd.DataFrame,
         y_train: list,
         preprocessor: sklearn.compose.ColumnTransformer,
-        model: sklearn.base.BaseEstimator
+        model: sklearn.base.BaseEstimator,
+        memory: typing.Optional[str] = None,
+        X_val: typing.Optional[pd.DataFrame] = None,
+        y_val: typing.Optional[list] = None
 ) -> sklearn.pipeline.Pipeline:
     """
     Create and fit a preprocessing --> modeling pipeline.
 
+    Training telemetry is recorded in the pipeline's `telemetry_` attribute (see
+    `training_telemetry`).
+
     Args:
         X_train (:obj:`pandas.DataFrame`): Training features
         y_train (array-like): Training targets
@@ -136,28 +164,343 @@ def train_pipeline(
             defining the processing to perform for input data
         model (:obj:`sklearn.base.BaseEstimator`): An untrained `sklearn`
             regression model
+        memory (str, optional): Local directory in which to cache the fitted
+            preprocessor and transformed training data (see `fit_preprocessor`).
+            Defaults to None (no caching).
+        X_val (:obj:`pandas.DataFrame`, optional): Validation features, to record
+            the validation loss after each boosting stage. Defaults to None.
+        y_val (array-like, optional): Validation targets. Defaults to None.
 
     Returns:
         A fitted :obj:`sklearn.pipeline.Pipeline`
     """
-    # Assemble pipeline and train
+    logger.info("Pipeline created successfully. Beginning training.")
+    start_time = time()
+
+    # The preprocessor is fit separately (so it can be cached), then the
+    # pipeline is assembled from the fitted steps
+    stages = {}
+    with _profile(stages, "preprocessor"):
+        preprocessor, X_transformed = fit_preprocessor(preprocessor, X_train, y_train, memory)
+    with _profile(stages, "predictor"):
+        model.fit(X_transformed, y_train)
     pipe = Pipeline(steps=[
         ("preprocessor", preprocessor),
         ("predictor", model)
     ])
-    logger.info("Pipeline created successfully. Beginning training.")
+    pipe.training_data_ = _summarize_training_data(X_train, y_train)
+    pipe.telemetry_ = training_telemetry(
+        pipe, stages, X_transformed, y_train,
+        preprocessor.transform(X_val) if X_val is not None else None, y_val
+    )
+    logger.info("Pipeline training complete. Time taken: %0.4f seconds", time() - start_time)
 
+    return pipe
+
+
+def training_telemetry(
+        trained_pipeline: sklearn.pipeline.Pipeline,
+        stages: dict,
+        X_train_transformed,
+        y_train: list,
+        X_val_transformed=None,
+        y_val: typing.Optional[list] = None
+) -> dict:
+    """
+    Summarize how a pipeline was trained, to spot overfitting and size the model.
+
+    Args:
+        trained_pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted pipeline
+        stages (dict): Seconds taken and peak memory allocated (in MB) by each
+            training stage, as recorded by `_profile`
+        X_train_transformed (array-like): Preprocessed training features
+        y_train (array-like): Training targets
+        X_val_transformed (array-like, optional): Preprocessed validation
+            features. Defaults to None.
+        y_val (array-like, optional): Validation targets. Defaults to None.
+
+    Returns:
+        dict of the stages' time and memory, the number of trees and nodes (None
+            for histogram GBT), and the train (and validation) RMSE after each
+            boosting stage. The number of stages with the lowest validation
+            RMSE is included if validation data is given.
+    """
+    predictor = trained_pipeline["predictor"]
+    if isinstance(predictor, GradientBoostingRegressor):
+        nodes = [tree.tree_.node_count for tree in predictor.estimators_.ravel()]
+        n_trees, n_nodes = len(nodes), int(sum(nodes))
+    else:
+        # Histogram GBT doesn't expose its trees' nodes
+        n_trees, n_nodes = int(predictor.n_iter_ * predictor.n_trees_per_iteration_), None
+
+    telemetry = {
+        "stages": stages,
+        "n_train_rows": len(y_train),
+        "n_trees": n_trees,
+        "n_nodes": n_nodes,
+        "train_rmse": staged_rmse(predictor, X_train_transformed, y_train)
+    }
+    if X_val_transformed is not None:
+        telemetry["n_val_rows"] = len(y_val)
+        telemetry["val_rmse"] = staged_rmse(predictor, X_val_transformed, y_val)
+        telemetry["best_n_stages"] = int(np.argmin(telemetry["val_rmse"])) + 1
+        logger.info(
+            "Validation RMSE %0.4f after %d stages (lowest: %0.4f after %d stages)",
+            telemetry["val_rmse"][-1], len(telemetry["val_rmse"]),
+            min(telemetry["val_rmse"]), telemetry["best_n_stages"]
+        )
+    return telemetry
+
+
+def staged_rmse(predictor: sklearn.base.BaseEstimator, X, y: list) -> typing.List[float]:
+    """
+    Compute the RMSE of a boosted model's predictions after each boosting stage.
+
+    Args:
+        predictor (:obj:`sklearn.base.BaseEstimator`): Fitted boosting model
+        X (array-like): Preprocessed features
+        y (array-like): Targets
+
+    Returns:
+        list(float) of the RMSE after each stage
+    """
+    y = np.asarray(y, dtype=float)
+    return [float(np.sqrt(np.mean((preds - y) ** 2))) for preds in predictor.staged_predict(X)]
+
+
+@contextmanager
+def _profile(stages: dict, stage: str):
+    """
+    Record the seconds taken and peak memory allocated (in MB) by a stage in `stages`.
+
+    Memory is traced with `tracemalloc` (Python and NumPy allocations), so it's only
+    recorded if nothing else is tracing already.
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
     start_time = time()
-    pipe.fit(X_train, y_train)
-    logger.info("Pipeline training complete. Time taken: %0.4f seconds", time() - start_time)
+    try:
+        yield
+    finally:
+        seconds = time() - start_time
+        peak_memory = None
+        if not tracing:
+            peak_memory = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        stages[stage] = {"seconds": seconds, "peak_memory_mb": peak_memory}
+        logger.debug("Training stage `%s` took %0.4f seconds (peak memory: %s MB)", stage, seconds, peak_memory)
+
+
+def retrain_pipeline(
+        trained_pipeline: sklearn.pipeline.Pipeline,
+        X: pd.DataFrame,
+        y: list,
+        n_new_stages: int = 25,
+        n_sample_rows: int = 5000,
+        window: int = 2000,
+        date_col: str = "reviewdate",
+        max_drift: float = 0.5,
+        max_stages: int = 500,
+        random_state: typing.Optional[int] = None,
+        training_data: typing.Optional[dict] = None
+) -> typing.Optional[sklearn.pipeline.Pipeline]:
+    """
+    Update a trained pipeline with the rows of a dataset it wasn't trained on.
+
+    The fitted preprocessor is kept, and `n_new_stages` boosting stages are added
+    (warm-started, so existing stages are kept) to fit the current model's
+    residuals on the new rows plus a random sample of `n_sample_rows` old ones.
+    The sample keeps the new stages from fitting only what's different about
+    recent rows (e.g. recent reviews' higher scores) and applying it to every row.
+
+    A full retrain is needed instead (and None is returned) if the pipeline
+    wasn't trained by `train_pipeline`, if it would grow beyond `max_stages`, or
+    if the new rows have drifted: compared with the `window` most recent old rows
+    by `date_col`, any numeric feature's or the target's mean has moved more than
+    `max_drift` training standard deviations, or more than `max_drift` of the new
+    rows have a category unseen in training.
 
+    Args:
+        trained_pipeline (:obj:`sklearn.pipeline.Pipeline`): Pipeline from
+            `train_pipeline` (or a previous `retrain_pipeline`)
+        X (:obj:`pandas.DataFrame`): Features of the full, updated dataset
+        y (array-like): Targets of the full, updated dataset
+        n_new_stages (int, optional): Boosting stages to add. Defaults to 25.
+        n_sample_rows (int, optional): Number of old rows to fit new stages on,
+            with the new rows. Defaults to 5000.
+        window (int, optional): Number of most recent old rows to check new rows
+            for drift against. Defaults to 2000.
+        date_col (str, optional): Column ordering rows by recency. Defaults to
+            "reviewdate".
+        max_drift (float, optional): Drift beyond which to retrain fully.
+            Defaults to 0.5.
+        max_stages (int, optional): Most boosting stages before retraining fully.
+            Defaults to 500.
+        random_state (int, optional): Seed for sampling old rows. Defaults to None.
+        training_data (dict, optional): Summary of the pipeline's training data,
+            as saved alongside it (see `serialize.load_training_data`). Defaults
+            to None (the pipeline's own `training_data_`, if it's just been trained).
+
+    Returns:
+        Updated :obj:`sklearn.pipeline.Pipeline`, or None if a full retrain is needed
+    """
+    start_time = time()
+    summary = training_data if training_data is not None else getattr(trained_pipeline, "training_data_", None)
+    if summary is None:
+        logger.info("Pipeline has no record of its training data. Full retrain needed.")
+        return None
+
+    y = pd.Series(np.asarray(y, dtype=float), index=X.index)
+    is_new = ~pd.util.hash_pandas_object(X, index=False).isin(summary["row_hashes"])
+    if not is_new.any():
+        logger.info("No new rows since the pipeline was trained. Pipeline unchanged.")
+        return trained_pipeline
+
+    # Compare the new rows with the most recent of the old ones, so features that
+    # trend over time (e.g. release year) don't count as drift
+    recent = pd.to_datetime(X.loc[~is_new, date_col]).rank(method="first", ascending=False) <= window
+    recent = recent[recent].index
+    drift = _drift(trained_pipeline, summary, X[is_new], y[is_new], X.loc[recent], y.loc[recent])
+    if drift > max_drift:
+        logger.info("New rows have drifted (%0.4f > %0.4f). Full retrain needed.", drift, max_drift)
+        return None
+
+    predictor = deepcopy(trained_pipeline["predictor"])
+    stages = "n_estimators" if isinstance(predictor, GradientBoostingRegressor) else "max_iter"
+    if getattr(predictor, stages) + n_new_stages > max_stages:
+        logger.info("Pipeline would exceed %d boosting stages. Full retrain needed.", max_stages)
+        return None
+
+    # Fit new stages on every new row and a sample of the old ones
+    rows = is_new.copy()
+    old_rows = np.flatnonzero(~is_new)
+    rng = np.random.default_rng(random_state)
+    rows.iloc[rng.choice(old_rows, min(n_sample_rows, len(old_rows)), replace=False)] = True
+    predictor.set_params(warm_start=True, **{stages: getattr(predictor, stages) + n_new_stages})
+    X_transformed = trained_pipeline["preprocessor"].transform(X[rows])
+    profiled_stages = {}
+    with _profile(profiled_stages, "predictor"):
+        predictor.fit(X_transformed, y[rows])
+
+    pipe = Pipeline(steps=[
+        ("preprocessor", trained_pipeline["preprocessor"]),
+        ("predictor", predictor)
+    ])
+    pipe.training_data_ = dict(summary, row_hashes=np.union1d(
+        summary["row_hashes"], pd.util.hash_pandas_object(X[is_new], index=False).to_numpy()
+    ))
+    pipe.telemetry_ = training_telemetry(pipe, profiled_stages, X_transformed, y[rows])
+    logger.info(
+        "Pipeline updated with %d new rows (%d stages fit on %d rows, drift %0.4f). Time taken: %0.4f seconds",
+        is_new.sum(), n_new_stages, rows.sum(), drift, time() - start_time
+    )
     return pipe
 
 
+def _summarize_training_data(X_train: pd.DataFrame, y_train: list) -> dict:
+    """What `retrain_pipeline` needs to know about a pipeline's training data."""
+    y_train = np.asarray(y_train, dtype=float)
+    return {
+        "row_hashes": np.unique(pd.util.hash_pandas_object(X_train, index=False).to_numpy()),
+        "target_mean": float(y_train.mean()),
+        "target_std": float(y_train.std())
+    }
+
+
+def _drift(
+        trained_pipeline: sklearn.pipeline.Pipeline,
+        summary: dict,
+        X_new: pd.DataFrame,
+        y_new: pd.Series,
+        X_recent: pd.DataFrame,
+        y_recent: pd.Series
+) -> float:
+    """Largest shift of the new rows from the recent ones (see `retrain_pipeline`)."""
+    recent_mean = y_recent.mean() if len(y_recent) else summary["target_mean"]
+    shifts = [abs(y_new.mean() - recent_mean) / (summary["target_std"] or 1)]
+
+    for _, transformer, columns in trained_pipeline["preprocessor"].transformers_:
+        if isinstance(transformer, StandardScaler):
+            # Scaled to the training data's standard deviation 1 (and mean 0)
+            new_means = np.nanmean(transformer.transform(X_new[columns]), axis=0)
+            recent_means = np.nanmean(transformer.transform(X_recent[columns]), axis=0) if len(X_recent) else 0
+            shifts += list(np.abs(new_means - recent_means))
+        elif isinstance(transformer, (OneHotEncoder, OrdinalEncoder)):
+            for column, categories in zip(columns, transformer.categories_):
+                shifts.append((~X_new[column].isin(categories)).mean())
+    return float(max(shifts))
+
+
+def fit_preprocessor(
+        preprocessor: sklearn.compose.ColumnTransformer,
+        X_train: pd.DataFrame,
+        y_train: typing.Optional[list] = None,
+        memory: typing.Optional[str] = None
+) -> typing.Tuple[sklearn.compose.ColumnTransformer, typing.Any]:
+    """
+    Fit a preprocessor and transform the training data, caching both on disk.
+
+    Results are memoized with `joblib.Memory`, keyed by a hash of the training
+    data and the (unfitted) preprocessor's parameters, so training runs that only
+    change the model's hyperparameters reuse the preprocessing work.
+
+    Args:
+        preprocessor (obj:`sklearn.compose.ColumnTransformer`): Unfitted
+            preprocessor
+        X_train (:obj:`pandas.DataFrame`): Training features
+        y_train (array-like, optional): Training targets, for preprocessors that
+            use them (e.g. target encoding). Defaults to None.
+        memory (str, optional): Local cache directory. Defaults to None (no
+            caching).
+
+    Returns:
+        tuple(:obj:`sklearn.compose.ColumnTransformer`, array-like): Fitted
+            preprocessor and transformed training data
+    """
+    start_time = time()
+    fit_transform = check_memory(memory).cache(_fit_transform, ignore=["X_train", "y_train"])
+
+    # Only hash the columns the preprocessor reads: hashing the text columns
+    # (artist, album, ...) would take longer than fitting the preprocessor
+    preprocessor, X_transformed = fit_transform(
+        preprocessor,
+        X_train,
+        y_train,
+        joblib.hash((X_train[_input_columns(preprocessor, X_train)], y_train)) if memory else None
+    )
+    logger.debug("Preprocessor fit (cache: %s). Time taken: %0.4f seconds", memory, time() - start_time)
+    return preprocessor, X_transformed
+
+
+def _fit_transform(
+        preprocessor: sklearn.compose.ColumnTransformer,
+        X_train: pd.DataFrame,
+        y_train: typing.Optional[list],
+        data_hash: typing.Optional[str]
+):
+    """Fit a copy of the preprocessor and transform the training data (cached by `data_hash`)."""
+    preprocessor = sklearn.base.clone(preprocessor)
+    return preprocessor, preprocessor.fit_transform(X_train, y_train)
+
+
+def _input_columns(preprocessor: sklearn.compose.ColumnTransformer, X_train: pd.DataFrame) -> typing.List[str]:
+    """Columns of `X_train` the preprocessor reads (all of them, if that can't be told from its config)."""
+    columns = [column for _, _, columns in preprocessor.transformers for column in columns]
+    if preprocessor.remainder != "drop" or not all(isinstance(column, str) for column in columns):
+        return list(X_train.columns)
+    return [column for column in X_train.columns if column in set(columns)]
+
+
 def make_preprocessor(
         numeric_features: typing.List[str],
         categorical_features: typing.List[str],
-        handle_unknown: str
+        handle_unknown: str,
+        categorical_encoding: str = "onehot",
+        sparse_output: bool = False,
+        high_cardinality_features: typing.Optional[typing.List[str]] = None,
+        high_cardinality_encoding: str = "target",
+        n_buckets: int = 64
 ) -> sklearn.compose.ColumnTransformer:
     """
     Define preprocessing steps for input features.
@@ -167,41 +510,134 @@ def make_preprocessor(
     features are used when modeling. In other words, this preprocessor determines the
     exact input columns (and order) when training and performing inference.
 
+    Models that handle categorical features natively (see `make_model`) only need each
+    category mapped to an integer code, so with `categorical_encoding="ordinal"` the
+    categorical features are ordinal-encoded instead, one column per feature.
+
+    With `sparse_output=True`, the one-hot encoding and the scaled numeric features
+    are always combined into a CSR matrix, which the "gradient_boosting" engine
+    trains on and predicts from without densifying. Memory then grows with the
+    number of rows and features rather than the number of categories, so
+    high-cardinality features (e.g. "artist" or "recordlabel") can be one-hot
+    encoded. Otherwise, scikit-learn decides by the density of the output.
+
+    High-cardinality features can instead be given their own compact encoding
+    (see `src.encoders`), whose width doesn't depend on the number of categories:
+    "target" (cross-fitted mean score, one column per feature), "frequency" (one
+    column per feature), or "hashing" (`n_buckets` columns shared by all of them).
+
     Args:
         numeric_features (list(str)): Names of numeric features to scale
-        categorical_features (list(str)): Names of categorical features to one-hot encode
+        categorical_features (list(str)): Names of categorical features to encode
         handle_unknown (str): Policy for unknown categories in `OneHotEncoder`
-            (either "handle_unknown" or "error")
+            (either "handle_unknown" or "error"). Unknown categories are always
+            encoded as missing values by the ordinal encoding.
+        categorical_encoding (str, optional): Either "onehot" or "ordinal".
+            Defaults to "onehot".
+        sparse_output (bool, optional): Whether to always output a sparse matrix
+            (one-hot encoding only). Defaults to False.
+        high_cardinality_features (list(str), optional): Names of categorical
+            features to encode compactly. Defaults to None.
+        high_cardinality_encoding (str, optional): One of "target", "frequency",
+            or "hashing". Defaults to "target".
+        n_buckets (int, optional): Number of buckets for the "hashing" encoding.
+            Defaults to 64.
 
     Returns:
         A :obj:`sklearn.compose.ColumnTransformer` with the desired transformation steps
     """
     # Scale numbers to mean 0 & stdev 1; one-hot encode categorical variables
     numeric_transformer = StandardScaler()
-    categorical_transformer = OneHotEncoder(handle_unknown=handle_unknown)
-
-    preprocessor = ColumnTransformer(transformers=[
+    if categorical_encoding == "onehot":
+        categorical_transformer = OneHotEncoder(handle_unknown=handle_unknown)
+    elif categorical_encoding == "ordinal":
+        categorical_transformer = OrdinalEncoder(handle_unknown="use_encoded_value", unknown_value=NaN)
+    else:
+        raise ValueError("Unknown categorical encoding: %s" % categorical_encoding)
+    if sparse_output and categorical_encoding != "onehot":
+        raise ValueError("Sparse output requires one-hot encoding, not %s" % categorical_encoding)
+
+    transformers = [
         ("numeric", numeric_transformer, numeric_features),
         ("categorical", categorical_transformer, categorical_features)
-    ])
+    ]
+    if high_cardinality_features:
+        if high_cardinality_encoding not in HIGH_CARDINALITY_ENCODERS:
+            raise ValueError("Unknown high-cardinality encoding: %s" % high_cardinality_encoding)
+        encoder = HIGH_CARDINALITY_ENCODERS[high_cardinality_encoding]()
+        if high_cardinality_encoding == "hashing":
+            encoder.set_params(n_buckets=n_buckets)
+        transformers.append(("high_cardinality", encoder, high_cardinality_features))
+
+    preprocessor = ColumnTransformer(
+        transformers=transformers,
+        # Stack into a sparse matrix however dense the output is
+        sparse_threshold=1.0 if sparse_output else 0.3
+    )
     return preprocessor
 
 
-def make_model(**kwargs) -> sklearn.base.BaseEstimator:
+def make_model(
+        engine: str = "gradient_boosting",
+        categorical_mask: typing.Optional[typing.List[bool]] = None,
+        **kwargs
+) -> sklearn.base.BaseEstimator:
     """
     Create an untrained GBT model for use in a `sklearn.pipeline.Pipeline`.
 
+    The "gradient_boosting" engine trains on a single thread with exact split finding.
+    The "hist_gradient_boosting" engine bins features into histograms, trains on
+    multiple threads, and splits ordinal-encoded categorical features natively.
+
     Args:
+        engine (str, optional): Either "gradient_boosting" or "hist_gradient_boosting".
+            Defaults to "gradient_boosting".
+        categorical_mask (list(bool), optional): Which preprocessed columns are
+            categorical (see `categorical_mask`). Only the "hist_gradient_boosting"
+            engine supports ordinal-encoded categories. Defaults to None.
         **kwargs: Parameters to pass on to GBT constructor
 
     Returns:
-        Untrained :obj:`sklearn.ensemble.GradientBoostingRegressor` object
+        Untrained :obj:`sklearn.ensemble.GradientBoostingRegressor` or
+            :obj:`sklearn.ensemble.HistGradientBoostingRegressor` object
+
+    Raises:
+        ValueError: If the engine is unknown, or categories are ordinal-encoded
+            for an engine other than "hist_gradient_boosting"
     """
-    # Don't think there's anything else to say for this really
-    model = GradientBoostingRegressor(**kwargs)
+    if categorical_mask is not None and any(categorical_mask) and engine != "hist_gradient_boosting":
+        # Unknown categories are encoded as NaN, which only the histogram engine accepts
+        raise ValueError("Ordinal categorical encoding requires the hist_gradient_boosting engine, not %s" % engine)
+    if engine == "gradient_boosting":
+        model = GradientBoostingRegressor(**kwargs)
+    elif engine == "hist_gradient_boosting":
+        model = HistGradientBoostingRegressor(categorical_features=categorical_mask, **kwargs)
+    else:
+        raise ValueError("Unknown model engine: %s" % engine)
+
     return model
 
 
+def categorical_mask(preprocessor: sklearn.compose.ColumnTransformer) -> typing.Optional[typing.List[bool]]:
+    """
+    Mark which of a preprocessor's output columns hold ordinal-encoded categories.
+
+    Args:
+        preprocessor (:obj:`sklearn.compose.ColumnTransformer`): Preprocessor from
+            `make_preprocessor` (fitted or not)
+
+    Returns:
+        list(bool) with one entry per output column, or None if no columns are
+            ordinal-encoded
+    """
+    mask = []
+    for _, transformer, columns in preprocessor.transformers:
+        width = transformer.n_buckets if isinstance(transformer, encoders.HashingEncoder) else len(columns)
+        mask += [isinstance(transformer, OrdinalEncoder)] * width
+
+    return mask if any(mask) else None
+
+
 def parse_dict_to_dataframe(form_dict: dict) -> pd.DataFrame:
     """
     Parse a dictionary to `pandas.DataFrame` format.
@@ -2,13 +2,26 @@
 Analyze a trained model.
 """
 import logging
+import os
 import typing
+from concurrent.futures import ProcessPoolExecutor
+from time import time
 
+import numpy as np
 import pandas as pd
+import scipy.sparse
+import sklearn.compose
 import sklearn.pipeline
+from sklearn.preprocessing import OneHotEncoder
+
+from src import encoders, model
 
 logger = logging.getLogger(__name__)
 
+# Fitted predictor and preprocessed held-out data, shared by every repeat a worker
+# process scores (set once per worker by `_init_worker`)
+_WORKER_DATA = {}
+
 
 def get_feature_importance(
         trained_pipeline: sklearn.pipeline.Pipeline,
@@ -27,11 +40,134 @@ def get_feature_importance(
     # Retrieve categorical features from the one-hot encoder
     # (numeric features need to be passed in manually)
     categorical_features = list(trained_pipeline["preprocessor"]
-        .transformers_[1][1]
+        .named_transformers_["categorical"]
         .get_feature_names())
     features = numeric_features + categorical_features
 
+    # Compactly-encoded high-cardinality features name their own columns
+    if "high_cardinality" in trained_pipeline["preprocessor"].named_transformers_:
+        features += trained_pipeline["preprocessor"].named_transformers_["high_cardinality"].get_feature_names()
+
     # Fetch importance values (without labels) from the model itself
     importances = trained_pipeline["predictor"].feature_importances_
 
     return pd.Series(data=importances, index=features)
+
+
+def get_permutation_importance(
+        trained_pipeline: sklearn.pipeline.Pipeline,
+        data: pd.DataFrame,
+        target_col: str = "score",
+        n_repeats: int = 5,
+        random_state: typing.Optional[int] = None,
+        n_workers: int = 1
+) -> pd.DataFrame:
+    """
+    Measure how much shuffling each input feature increases the error on held-out data.
+
+    The data is preprocessed once. Shuffling a feature is then the same as
+    shuffling the rows of the preprocessed columns it produces, so only those
+    columns change between permutations (e.g. all of "genre"'s one-hot columns
+    are shuffled together). Features hashed into shared buckets are shuffled
+    together as one. Repeats are scored in parallel processes.
+
+    Args:
+        trained_pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted model pipeline
+        data (:obj:`pandas.DataFrame`): Held-out data, with the target
+        target_col (str, optional): Name of the target column. Defaults to "score".
+        n_repeats (int, optional): Number of times to shuffle each feature.
+            Defaults to 5.
+        random_state (int, optional): Seed for shuffling. Defaults to None.
+        n_workers (int, optional): Number of worker processes, or -1 for one per
+            CPU core. Defaults to 1.
+
+    Returns:
+        :obj:`pandas.DataFrame` with the mean and standard deviation (over
+            repeats) of each feature's increase in mean squared error, most
+            important first
+    """
+    start_time = time()
+    if n_workers == -1:
+        n_workers = os.cpu_count() or 1
+
+    X, y = model.split_predictors_response(data, target_col)
+    preprocessor = trained_pipeline["preprocessor"]
+    X_transformed = preprocessor.transform(model.validate_dataframe(X))
+    if scipy.sparse.issparse(X_transformed):
+        # Shuffled rows are taken one column block at a time
+        X_transformed = X_transformed.tocsc()
+    worker_data = {
+        "predictor": trained_pipeline["predictor"],
+        "X": X_transformed,
+        "y": np.asarray(y, dtype=float),
+        "feature_columns": feature_columns(preprocessor)
+    }
+
+    seeds = np.random.SeedSequence(random_state).spawn(n_repeats)
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(worker_data,)) as executor:
+        increases = np.array(list(executor.map(_score_repeat, seeds)))
+
+    importance = pd.DataFrame(
+        data={"importance_mean": increases.mean(axis=0), "importance_std": increases.std(axis=0)},
+        index=pd.Index(list(worker_data["feature_columns"]), name="feature")
+    ).sort_values("importance_mean", ascending=False)
+    logger.info("Permutation importance computed. Time taken: %0.4fs", time() - start_time)
+    return importance
+
+
+def feature_columns(preprocessor: sklearn.compose.ColumnTransformer) -> typing.Dict[str, typing.List[int]]:
+    """
+    Map each input feature of a fitted preprocessor to the output columns it produces.
+
+    Args:
+        preprocessor (:obj:`sklearn.compose.ColumnTransformer`): Fitted preprocessor
+            from `make_preprocessor`
+
+    Returns:
+        dict of each feature (or " + "-joined features, for hashed features that
+            share columns) and the indices of its output columns
+    """
+    columns = {}
+    start = 0
+    for _, transformer, features in preprocessor.transformers_:
+        if transformer == "drop" or not len(features):
+            continue
+
+        if isinstance(transformer, encoders.HashingEncoder):
+            widths = {" + ".join(features): transformer.n_buckets}
+        elif isinstance(transformer, OneHotEncoder):
+            widths = {feature: len(categories) for feature, categories in zip(features, transformer.categories_)}
+        else:
+            widths = {feature: 1 for feature in features}
+
+        for feature, width in widths.items():
+            columns[feature] = list(range(start, start + width))
+            start += width
+    return columns
+
+
+def _init_worker(worker_data: dict) -> None:
+    """Keep the predictor and preprocessed data in the worker process for every repeat."""
+    _WORKER_DATA.update(worker_data)
+
+
+def _score_repeat(seed: np.random.SeedSequence) -> np.ndarray:
+    """Shuffle each feature once, and return the increase in mean squared error for each."""
+    predictor, X, y = _WORKER_DATA["predictor"], _WORKER_DATA["X"], _WORKER_DATA["y"]
+    rng = np.random.default_rng(seed)
+    baseline = np.mean((predictor.predict(X) - y) ** 2)
+
+    increases = []
+    for columns in _WORKER_DATA["feature_columns"].values():
+        rows = rng.permutation(X.shape[0])
+        first, last = columns[0], columns[-1] + 1
+        if scipy.sparse.issparse(X):
+            X_permuted = scipy.sparse.hstack([X[:, :first], X[rows, first:last], X[:, last:]], format="csr")
+            increases.append(np.mean((predictor.predict(X_permuted) - y) ** 2) - baseline)
+        else:
+            # Shuffle the feature's columns in place (this process's own copy), then restore them
+            original = X[:, first:last].copy()
+            X[:, first:last] = original[rows]
+            increases.append(np.mean((predictor.predict(X) - y) ** 2) - baseline)
+            X[:, first:last] = original
+    return np.array(increases)
@@ -0,0 +1,204 @@
+"""
+Predict with a trained model pipeline in float32, with the exact same results.
+
+Gradient boosting trees compare features as float32 (against float64 split
+thresholds), so the pipeline's float64 preprocessed features are converted
+before every prediction. A float32 pipeline preprocesses straight into float32
+and stores each threshold as the largest float32 not above it, which sends
+every float32 feature value the same way at every split.
+"""
+import logging
+import typing
+from time import time
+
+import numpy as np
+import pandas as pd
+import scipy.sparse
+import sklearn.compose
+import sklearn.pipeline
+from sklearn.ensemble import GradientBoostingRegressor
+from sklearn.pipeline import Pipeline
+
+from src import model
+
+logger = logging.getLogger(__name__)
+
+
+def quantize_pipeline(
+        trained_pipeline: sklearn.pipeline.Pipeline,
+        check_data: typing.Optional[pd.DataFrame] = None
+) -> sklearn.pipeline.Pipeline:
+    """
+    Convert a fitted pipeline to predict in float32.
+
+    If `check_data` is given, every row of it must reach the same leaf of every
+    tree, and get the same prediction, as with the original pipeline.
+
+    Args:
+        trained_pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted pipeline with
+            a `GradientBoostingRegressor` predictor (the "gradient_boosting" engine)
+        check_data (:obj:`pandas.DataFrame`, optional): Input data to check the
+            float32 pipeline on (e.g. the training data). Defaults to None.
+
+    Returns:
+        :obj:`sklearn.pipeline.Pipeline` of a `Float32Preprocessor` and a
+            `Float32GradientBoosting` predictor
+    """
+    start_time = time()
+    if not isinstance(trained_pipeline["predictor"], GradientBoostingRegressor):
+        raise ValueError("Float32 inference requires the \"gradient_boosting\" engine")
+
+    pipe = Pipeline(steps=[
+        ("preprocessor", Float32Preprocessor(trained_pipeline["preprocessor"])),
+        ("predictor", Float32GradientBoosting(trained_pipeline["predictor"]))
+    ])
+
+    if check_data is not None:
+        check_data = model.validate_dataframe(check_data.copy())
+        X = pipe["preprocessor"].transform(check_data)
+        leaves = trained_pipeline["predictor"].apply(trained_pipeline["preprocessor"].transform(check_data))
+        changed_leaves = int(np.sum(pipe["predictor"].apply(X) != leaves))
+        changed_preds = int(np.sum(pipe["predictor"].predict(X) != trained_pipeline.predict(check_data)))
+        if changed_leaves or changed_preds:
+            raise ValueError(
+                "Float32 pipeline reaches %d different leaves and makes %d different predictions"
+                % (changed_leaves, changed_preds)
+            )
+        logger.info("Float32 pipeline checked on %d rows: every leaf and prediction is the same", len(check_data))
+
+    logger.info("Pipeline converted to float32. Time taken: %0.4f seconds", time() - start_time)
+    return pipe
+
+
+class Float32Preprocessor:
+    """
+    A fitted preprocessor that outputs float32.
+
+    Each transformer's output (including the remainder's) is converted on its
+    own, so the full preprocessed data is never held in float64.
+
+    Args:
+        preprocessor (:obj:`sklearn.compose.ColumnTransformer`): Fitted
+            preprocessor
+    """
+
+    def __init__(self, preprocessor: sklearn.compose.ColumnTransformer):
+        self.preprocessor = preprocessor
+
+    def transform(self, X: pd.DataFrame):
+        """
+        Preprocess input data.
+
+        Args:
+            X (:obj:`pandas.DataFrame`): Input data
+
+        Returns:
+            float32 :obj:`numpy.ndarray`, or CSR matrix if the preprocessor
+                outputs sparse data
+        """
+        blocks = []
+        for name, transformer, columns in self.preprocessor.transformers_:
+            if transformer == "drop":
+                continue
+            # The remainder's columns are recorded by position
+            data = X.iloc[:, list(columns)] if name == "remainder" else X[columns]
+            block = data.to_numpy() if transformer == "passthrough" else transformer.transform(data)
+            blocks.append(block.astype(np.float32) if scipy.sparse.issparse(block) else np.asarray(block, np.float32))
+
+        if self.preprocessor.sparse_output_:
+            return scipy.sparse.hstack(blocks, format="csr", dtype=np.float32)
+        return np.hstack([block.toarray() if scipy.sparse.issparse(block) else block for block in blocks])
+
+
+class Float32GradientBoosting:
+    """
+    A fitted gradient boosting model with float32 split thresholds.
+
+    Only what predictions need is kept, in one set of arrays for every node of
+    every tree: float32 thresholds, int32 features and children, and float64
+    values. This makes the model several times smaller to store. Rows are sent
+    down every tree at once, one level at a time, and each tree's value is added
+    in turn (as scikit-learn does), so predictions are identical.
+
+    Args:
+        predictor (:obj:`sklearn.ensemble.GradientBoostingRegressor`): Fitted model
+        batch_size (int, optional): Rows to send down the trees at once, to
+            bound memory use. Defaults to 10000.
+    """
+
+    def __init__(self, predictor: GradientBoostingRegressor, batch_size: int = 10000):
+        trees = [estimator.tree_ for estimator in predictor.estimators_[:, 0]]
+        self.batch_size = batch_size
+        self.n_features_in_ = predictor.n_features_in_
+        self.learning_rate = predictor.learning_rate
+        self.init_value = 0.0 if predictor.init_ == "zero" else float(
+            predictor.init_.predict(np.zeros((1, self.n_features_in_)))[0]
+        )
+        self.max_depth = max(tree.max_depth for tree in trees)
+        self.roots = np.cumsum([0] + [tree.node_count for tree in trees[:-1]]).astype(np.int32)
+
+        # The largest float32 at or below each threshold splits float32 values the same way
+        thresholds = np.concatenate([tree.threshold for tree in trees])
+        self.thresholds = thresholds.astype(np.float32)
+        rounded_up = self.thresholds > thresholds
+        self.thresholds[rounded_up] = np.nextafter(self.thresholds[rounded_up], np.float32(-np.inf))
+
+        # Children are indexed across all trees, and leaves are their own children
+        nodes = [np.arange(tree.node_count) for tree in trees]
+        self.children_left = np.concatenate([
+            np.where(tree.children_left < 0, node, tree.children_left) + root
+            for tree, node, root in zip(trees, nodes, self.roots)
+        ]).astype(np.int32)
+        self.children_right = np.concatenate([
+            np.where(tree.children_right < 0, node, tree.children_right) + root
+            for tree, node, root in zip(trees, nodes, self.roots)
+        ]).astype(np.int32)
+        self.features = np.concatenate([np.maximum(tree.feature, 0) for tree in trees]).astype(np.int32)
+        self.values = np.concatenate([tree.value[:, 0, 0] for tree in trees])
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Predict from preprocessed data.
+
+        Args:
+            X (array-like): Preprocessed data (as float32 avoids a copy)
+
+        Returns:
+            :obj:`numpy.ndarray` of predictions
+        """
+        preds = np.full(X.shape[0], self.init_value)
+        for start, leaves in self._leaves(X):
+            for tree in range(len(self.roots)):
+                preds[start:start + len(leaves)] += self.learning_rate * self.values[leaves[:, tree]]
+        return preds
+
+    def apply(self, X) -> np.ndarray:
+        """
+        Find the leaf each row reaches in each tree.
+
+        Args:
+            X (array-like): Preprocessed data
+
+        Returns:
+            :obj:`numpy.ndarray` of leaf indices (within each tree), with a
+                column per tree
+        """
+        return np.vstack([np.empty((0, len(self.roots)), dtype=np.int32)] + [
+            leaves - self.roots for _, leaves in self._leaves(X)
+        ])
+
+    def _leaves(self, X) -> typing.Iterator[typing.Tuple[int, np.ndarray]]:
+        """First row of each batch, and the node it reaches in every tree."""
+        for start in range(0, X.shape[0], self.batch_size):
+            batch = X[start:start + self.batch_size]
+            batch = batch.toarray() if scipy.sparse.issparse(batch) else batch
+            batch = np.asarray(batch, dtype=np.float32)
+            rows = np.arange(len(batch))[:, np.newaxis]
+            nodes = np.tile(self.roots, (len(batch), 1))
+            for _ in range(self.max_depth):
+                nodes = np.where(
+                    batch[rows, self.features[nodes]] <= self.thresholds[nodes],
+                    self.children_left[nodes],
+                    self.children_right[nodes]
+                )
+            yield start, nodes
@@ -2,24 +2,48 @@
 Generate new values given a trained model and some new input.
 """
 import logging
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
 from copy import deepcopy
 from time import time
 
+import numpy as np
 import pandas as pd
 import sklearn.pipeline
 
-from src import model
+from src import explain, model
 
 logger = logging.getLogger(__name__)
 
+# Shards of rows to score per worker process
+SHARDS_PER_WORKER = 4
 
-def get_predictions(trained_model: sklearn.pipeline.Pipeline, input_data: pd.DataFrame) -> list:
+# Trained model and rows to score, sent once to each worker process (set by
+# `_init_worker`; inherited without copying where processes are forked)
+_WORKER_DATA = {}
+
+
+def get_predictions(
+        trained_model: sklearn.pipeline.Pipeline,
+        input_data: pd.DataFrame,
+        n_workers: int = 1
+) -> list:
     """
     Get predicted values for input data.
 
+    With more than one worker, the rows are split into contiguous shards that are
+    scored in parallel processes (each of which receives the model and data once,
+    and is then only sent the range of rows in each shard), and the predictions
+    are put back together in the original order. Each row's
+    prediction is the same either way.
+
     Args:
         trained_model (:obj:`sklearn.pipeline.Pipeline`): Trained model pipeline
+            (or a `serialize.OnnxPipeline` exported from one)
         input_data (:obj:`pandas.DataFrame`): Input data to predict on
+        n_workers (int, optional): Number of worker processes, or -1 for one per
+            CPU core. Defaults to 1.
 
     Returns:
         array-like of predicted values
@@ -35,7 +59,17 @@ def get_predictions(trained_model: sklearn.pipeline.Pipeline, input_data: pd.Dat
     data = model.validate_dataframe(input_data)
 
     start_time = time()
-    preds = trained_model.predict(data)
+    if n_workers == -1:
+        n_workers = os.cpu_count() or 1
+    if n_workers > 1 and len(data.index) > n_workers:
+        # A few shards per worker evens out uneven workers
+        shards = np.array_split(np.arange(len(data.index)), n_workers * SHARDS_PER_WORKER)
+        with ProcessPoolExecutor(
+                max_workers=n_workers, initializer=_init_worker, initargs=(trained_model, data)
+        ) as executor:
+            preds = np.concatenate(list(executor.map(_predict_shard, [(rows[0], rows[-1] + 1) for rows in shards])))
+    else:
+        preds = trained_model.predict(data)
     logger.debug(
         "Predictions made on input data. Time taken to predict: %0.4f seconds",
         time() - start_time
@@ -47,26 +81,54 @@ def get_predictions(trained_model: sklearn.pipeline.Pipeline, input_data: pd.Dat
 def append_predictions(
         trained_model: sklearn.pipeline.Pipeline,
         input_data: pd.DataFrame,
-        output_col: str = "preds"
+        output_col: str = "preds",
+        explain_predictions: bool = False,
+        n_workers: int = 1
 ) -> pd.DataFrame:
     """
     Append predictions to an existing input DataFrame.
 
     Args:
         trained_model (:obj:`sklearn.pipeline.Pipeline`): Trained model pipeline
+            (or a `serialize.OnnxPipeline` exported from one)
         input_data (:obj:`pandas.DataFrame`): Input data to predict on
         output_col (str, optional): Name of column to place predicted
             values in. Defaults to "preds".
+        explain_predictions (bool, optional): Whether to also append each input
+            feature's contribution to the prediction (see `explain.TreeExplainer`),
+            in columns named "<output_col>_<feature>". Defaults to False.
+        n_workers (int, optional): Number of worker processes to predict with
+            (see `get_predictions`). Defaults to 1.
 
     Returns:
         Input `pandas.DataFrame` with predictions appended as a new column
     """
     data = deepcopy(input_data)
-    predictions = get_predictions(trained_model, input_data)
+    predictions = get_predictions(trained_model, input_data, n_workers=n_workers)
 
     # Overwrites column named `output_col` if it exists already (in this case,
     # it may not actually be the last column). New columns always placed at end.
     data[output_col] = predictions
     logger.info("Predictions appended to original data")
 
+    if explain_predictions:
+        explainer = explain.TreeExplainer(trained_model)
+        contributions = explainer.contributions(input_data).add_prefix(output_col + "_")
+        data[contributions.columns] = contributions
+        logger.info(
+            "Feature contributions appended (on top of an expected value of %0.4f)",
+            explainer.expected_value
+        )
+
     return data
+
+
+def _init_worker(trained_model: sklearn.pipeline.Pipeline, data: pd.DataFrame) -> None:
+    """Keep the trained model and (validated) rows in the worker process for every shard."""
+    _WORKER_DATA.update(model=trained_model, data=data)
+
+
+def _predict_shard(rows: typing.Tuple[int, int]) -> np.ndarray:
+    """Predict one shard of rows, given as a (start, stop) range."""
+    start, stop = rows
+    return _WORKER_DATA["model"].predict(_WORKER_DATA["data"].iloc[start:stop])
@@ -1,12 +1,22 @@
 """
-Serialize and deserialize trained model pipelines.
+Serialize and deserialize trained model pipelines, as joblib objects or ONNX graphs.
 """
+import copy
+import json
 import logging
 import os
+import typing
 
 import joblib
+import numpy as np
+import pandas as pd
 import sklearn.pipeline
 
+try:
+    import onnxruntime
+except ImportError:  # Only needed to predict with ONNX graphs
+    onnxruntime = None
+
 from src import load_data
 
 logger = logging.getLogger(__name__)
@@ -30,24 +40,146 @@ def save_pipeline(pipeline: sklearn.pipeline.Pipeline, save_path: str) -> None:
         _, s3path = load_data.parse_s3(save_path)
         local_path = s3path
 
-        joblib.dump(pipeline, local_path)
+        joblib.dump(without_training_data(pipeline), local_path)
         logger.debug("Saved a copy of the model to %s", local_path)
         load_data.upload_file_to_s3(local_path=local_path, s3path=save_path)
     else:
-        joblib.dump(pipeline, save_path)
+        joblib.dump(without_training_data(pipeline), save_path)
 
     logger.info("Saved model to %s", save_path)
+    if hasattr(pipeline, "telemetry_"):
+        save_telemetry(pipeline, save_path)
+    if hasattr(pipeline, "training_data_"):
+        save_training_data(pipeline, save_path)
+
+
+def telemetry_path(path: str) -> str:
+    """Location of the training telemetry saved alongside a model pipeline."""
+    return os.path.splitext(path)[0] + ".telemetry.json"
+
+
+def save_telemetry(pipeline: sklearn.pipeline.Pipeline, save_path: str) -> None:
+    """
+    Save a fitted pipeline's training telemetry as JSON, alongside the pipeline.
 
+    Args:
+        pipeline (:obj:`sklearn.pipeline.Pipeline`): Pipeline fitted by
+            `model.train_pipeline` or `model.retrain_pipeline`
+        save_path (str): Where the pipeline itself is saved
 
-def load_pipeline(load_path: str) -> sklearn.pipeline.Pipeline:
+    Returns:
+        None
+    """
+    path = telemetry_path(save_path)
+    local_path = load_data.parse_s3(path)[1] if path.startswith("s3://") else path
+    with open(local_path, "w") as telemetry_file:
+        json.dump(pipeline.telemetry_, telemetry_file, indent=2)
+
+    if path.startswith("s3://"):
+        load_data.upload_file_to_s3(local_path=local_path, s3path=path)
+    logger.info("Saved training telemetry to %s", path)
+
+
+def training_data_path(path: str) -> str:
+    """Location of the training data summary saved alongside a model pipeline."""
+    return os.path.splitext(path)[0] + ".training_data.joblib"
+
+
+def without_training_data(pipeline: sklearn.pipeline.Pipeline) -> sklearn.pipeline.Pipeline:
+    """
+    Get a pipeline without its training data summary, to save or deploy.
+
+    The summary (which has a hash of every training row, so grows with the
+    data) is only needed by `model.retrain_pipeline`, so it's saved on its own
+    (see `save_training_data`) rather than loaded wherever the model is.
+
+    Args:
+        pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted model pipeline
+
+    Returns:
+        Shallow copy of the pipeline without `training_data_` (or the pipeline
+            itself, if it has none)
+    """
+    if not hasattr(pipeline, "training_data_"):
+        return pipeline
+    pipeline = copy.copy(pipeline)
+    del pipeline.training_data_
+    return pipeline
+
+
+def save_training_data(pipeline: sklearn.pipeline.Pipeline, save_path: str) -> None:
+    """
+    Save a fitted pipeline's training data summary, alongside the pipeline.
+
+    Args:
+        pipeline (:obj:`sklearn.pipeline.Pipeline`): Pipeline fitted by
+            `model.train_pipeline` or `model.retrain_pipeline`
+        save_path (str): Where the pipeline itself is saved
+
+    Returns:
+        None
+    """
+    path = training_data_path(save_path)
+    local_path = load_data.parse_s3(path)[1] if path.startswith("s3://") else path
+    joblib.dump(pipeline.training_data_, local_path)
+
+    if path.startswith("s3://"):
+        load_data.upload_file_to_s3(local_path=local_path, s3path=path)
+    logger.info("Saved training data summary to %s", path)
+
+
+def load_training_data(load_path: str) -> typing.Optional[dict]:
+    """
+    Load the training data summary saved alongside a model pipeline.
+
+    Args:
+        load_path (str): Where the pipeline itself is saved
+
+    Returns:
+        dict for `model.retrain_pipeline`, or None if there is none
+    """
+    path = training_data_path(load_path)
+    local_path = path
+    if path.startswith("s3://"):
+        _, local_path = load_data.parse_s3(path)
+        if not os.path.exists(local_path):
+            load_data.download_file_from_s3(local_path=local_path, s3path=path)
+
+    if not os.path.exists(local_path):
+        logger.info("No training data summary found at %s", path)
+        return None
+    return joblib.load(local_path)
+
+
+def model_version(pipeline: typing.Union[sklearn.pipeline.Pipeline, "OnnxPipeline"]) -> str:
+    """
+    Identify a fitted model pipeline by a hash of its contents.
+
+    The same pipeline gets the same version when loaded again, so predictions
+    stored under the version (see `albums_database.Predictions`) can be reused
+    until a different model is deployed.
+
+    Args:
+        pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted model pipeline (or a
+            `OnnxPipeline`)
+
+    Returns:
+        str: 32-character hex digest
+    """
+    return joblib.hash(pipeline)
+
+
+def load_pipeline(load_path: str) -> typing.Union[sklearn.pipeline.Pipeline, "OnnxPipeline"]:
     """
     Deserialize a fitted model pipeline.
 
     Args:
-        load_path (str): Path to joblib-saved pipeline
+        load_path (str): Path to joblib-saved pipeline, or to an ONNX graph
+            (ending in ".onnx") saved by `export_onnx`
 
     Returns:
-        Fitted :obj:`sklearn.pipeline.Pipeline` object
+        Fitted :obj:`sklearn.pipeline.Pipeline` object, or an `OnnxPipeline`
+            for an ONNX graph
     """
     # Download from S3 if a local copy does not already exist
     # This helps improve inference speed by reducing unnecessary
@@ -61,9 +193,134 @@ def load_pipeline(load_path: str) -> sklearn.pipeline.Pipeline:
             logger.debug("Downloaded a copy of the model to %s", local_path)
         else:
             logger.debug("Using existing local copy of model at %s", local_path)
-        pipeline = joblib.load(local_path)
     else:
-        pipeline = joblib.load(load_path)
+        local_path = load_path
+
+    if local_path.endswith(".onnx"):
+        with open(local_path, "rb") as onnx_file:
+            pipeline = OnnxPipeline(onnx_file.read())
+    else:
+        pipeline = joblib.load(local_path)
 
     logger.info("Loaded model pipeline from %s", load_path)
     return pipeline
+
+
+def export_onnx(
+        pipeline: sklearn.pipeline.Pipeline,
+        save_path: str,
+        check_data: typing.Optional[pd.DataFrame] = None,
+        tolerance: float = 1e-4,
+        target_opset: typing.Optional[int] = None
+) -> typing.Optional[float]:
+    """
+    Convert a fitted pipeline to an ONNX graph, to predict without scikit-learn.
+
+    The graph has one input per column the preprocessor reads, with a row per
+    album: float for scaled numeric columns and string for one-hot encoded
+    ones. Only the "gradient_boosting" engine with the default preprocessor
+    (`StandardScaler` and `OneHotEncoder`) can be converted.
+
+    The graph computes in float32, where the pipeline scales features in
+    float64, so predictions can differ slightly. If `check_data` is given, the
+    graph's predictions for it are compared with the pipeline's.
+
+    Args:
+        pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted pipeline
+        save_path (str): Where to save the ONNX graph (local or S3)
+        check_data (:obj:`pandas.DataFrame`, optional): Input data to compare
+            predictions on. Defaults to None.
+        tolerance (float, optional): Largest acceptable difference between
+            predictions, beyond which a warning is logged. Defaults to 1e-4.
+        target_opset (int, optional): ONNX opset to convert to. Defaults to None
+            (the latest supported by `skl2onnx`).
+
+    Returns:
+        Largest absolute difference between the pipeline's and the graph's
+            predictions for `check_data`, or None if it isn't given
+    """
+    from sklearn.ensemble import GradientBoostingRegressor
+    from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+    if not isinstance(pipeline["predictor"], GradientBoostingRegressor):
+        raise ValueError("ONNX export requires the \"gradient_boosting\" engine")
+    for name, transformer, _ in pipeline["preprocessor"].transformers_:
+        if not isinstance(transformer, (StandardScaler, OneHotEncoder)) and transformer != "drop":
+            raise ValueError("ONNX export doesn't support the \"%s\" transformer" % name)
+
+    # Only needed to export, and slow to import
+    from skl2onnx import convert_sklearn
+    from skl2onnx.common.data_types import FloatTensorType, StringTensorType
+
+    # One input per column: scaled columns are numbers, and one-hot encoded ones strings
+    input_types = [
+        (column, (FloatTensorType if isinstance(transformer, StandardScaler) else StringTensorType)([None, 1]))
+        for _, transformer, columns in pipeline["preprocessor"].transformers_
+        if transformer != "drop"
+        for column in columns
+    ]
+    onnx_model = convert_sklearn(pipeline, initial_types=input_types, target_opset=target_opset)
+    local_path = load_data.parse_s3(save_path)[1] if save_path.startswith("s3://") else save_path
+    os.makedirs(os.path.dirname(local_path) or ".", exist_ok=True)
+    with open(local_path, "wb") as onnx_file:
+        onnx_file.write(onnx_model.SerializeToString())
+    if save_path.startswith("s3://"):
+        load_data.upload_file_to_s3(local_path=local_path, s3path=save_path)
+    logger.info("Saved ONNX graph to %s", save_path)
+
+    if check_data is None:
+        return None
+    max_difference = float(np.max(np.abs(
+        OnnxPipeline(onnx_model.SerializeToString()).predict(check_data) - pipeline.predict(check_data)
+    )))
+    if max_difference > tolerance:
+        logger.warning("ONNX predictions differ by up to %0.6f (tolerance: %0.6f)", max_difference, tolerance)
+    else:
+        logger.info("ONNX predictions match within %0.6f (largest difference: %0.2e)", tolerance, max_difference)
+    return max_difference
+
+
+class OnnxPipeline:
+    """
+    A pipeline exported by `export_onnx`, run with ONNX Runtime on CPU.
+
+    It predicts from the same input data as the pipeline it was exported from,
+    so it can be used in its place to score data (see `score_model`). It can be
+    pickled (e.g. to send to worker processes) as the graph's bytes.
+
+    Args:
+        onnx_graph (bytes): Serialized ONNX graph
+    """
+
+    def __init__(self, onnx_graph: bytes):
+        if onnxruntime is None:
+            raise ImportError("Predicting with ONNX graphs requires the `onnxruntime` package")
+        self.onnx_graph = onnx_graph
+        self.session = onnxruntime.InferenceSession(onnx_graph, providers=["CPUExecutionProvider"])
+        self.input_types = {
+            graph_input.name: np.float32 if graph_input.type == "tensor(float)" else object
+            for graph_input in self.session.get_inputs()
+        }
+
+    def predict(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        Predict from input data.
+
+        Args:
+            data (:obj:`pandas.DataFrame`): Input data, with (at least) the
+                columns the exported pipeline's preprocessor read
+
+        Returns:
+            :obj:`numpy.ndarray` of predictions
+        """
+        inputs = {
+            column: (data[[column]].astype(str) if input_type is object else data[[column]]).to_numpy(input_type)
+            for column, input_type in self.input_types.items()
+        }
+        return self.session.run(None, inputs)[0].ravel().astype(float)
+
+    def __getstate__(self):
+        return {"onnx_graph": self.onnx_graph}
+
+    def __setstate__(self, state):
+        self.__init__(state["onnx_graph"])
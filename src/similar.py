@@ -0,0 +1,250 @@
+"""
+Find reviewed albums that sound like a given one, by their Spotify audio features.
+"""
+import logging
+import threading
+import typing
+from time import time
+
+import numpy as np
+import pandas as pd
+import sklearn.pipeline
+from sklearn.neighbors import KDTree
+from sklearn.preprocessing import StandardScaler
+
+logger = logging.getLogger(__name__)
+
+
+def build_index(
+        album_data: pd.DataFrame,
+        features: typing.List[str],
+        pipeline: typing.Optional[sklearn.pipeline.Pipeline] = None,
+        leaf_size: int = 40,
+        max_pending: int = 1000
+) -> "SimilarityIndex":
+    """
+    Index albums by their audio features, to find the most similar ones.
+
+    Features are standardized as the model pipeline's fitted scaler does, so
+    each one counts equally towards how similar two albums are.
+
+    Args:
+        album_data (:obj:`pandas.DataFrame`): Each album's "id" and features
+            (e.g. from `AlbumManager.album_features`)
+        features (list(str)): Numeric features to compare albums on
+        pipeline (:obj:`sklearn.pipeline.Pipeline`, optional): Fitted pipeline
+            whose preprocessor scales every one of `features`. Defaults to None
+            (standardize with the albums' own mean and standard deviation).
+        leaf_size (int, optional): Albums per leaf of the KD-tree. Defaults to 40.
+        max_pending (int, optional): Albums to add (see `SimilarityIndex.add`)
+            before the tree is rebuilt. Defaults to 1000.
+
+    Returns:
+        `SimilarityIndex` of the albums
+    """
+    if pipeline is not None:
+        mean, scale = fitted_scaling(pipeline, features)
+    else:
+        scaler = StandardScaler().fit(album_data[features])
+        mean, scale = scaler.mean_, scaler.scale_
+    return SimilarityIndex(album_data, features, mean, scale, leaf_size, max_pending)
+
+
+def fitted_scaling(
+        pipeline: sklearn.pipeline.Pipeline,
+        features: typing.List[str]
+) -> typing.Tuple[np.ndarray, np.ndarray]:
+    """
+    Get the mean and scale a fitted pipeline standardizes features with.
+
+    Args:
+        pipeline (:obj:`sklearn.pipeline.Pipeline`): Fitted pipeline (or one
+            converted by `quantize.quantize_pipeline`)
+        features (list(str)): Numeric features
+
+    Returns:
+        tuple(:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): Mean and scale of each feature
+
+    Raises:
+        ValueError: If the pipeline's preprocessor doesn't scale every feature
+    """
+    preprocessor = pipeline["preprocessor"]
+    preprocessor = getattr(preprocessor, "preprocessor", preprocessor)  # Float32Preprocessor
+    for _, transformer, columns in preprocessor.transformers_:
+        if isinstance(transformer, StandardScaler) and set(features) <= set(columns):
+            positions = [list(columns).index(feature) for feature in features]
+            return transformer.mean_[positions], transformer.scale_[positions]
+    raise ValueError("The pipeline's preprocessor doesn't scale every one of: %s" % ", ".join(features))
+
+
+class SimilarityIndex:
+    """
+    A KD-tree of albums' standardized audio features.
+
+    Missing features are treated as average (0 once standardized). Albums added
+    after the tree is built are searched exhaustively until there are more than
+    `max_pending` of them, and then the tree is rebuilt with them.
+
+    It can be shared between threads: adding and querying hold `lock`, which
+    callers can also hold to add albums based on what's indexed (e.g. those
+    after `max_id`) without another thread adding them too.
+
+    Args:
+        album_data (:obj:`pandas.DataFrame`): Each album's "id" and features
+        features (list(str)): Numeric features to compare albums on
+        mean (:obj:`numpy.ndarray`): Mean to standardize each feature with
+        scale (:obj:`numpy.ndarray`): Scale to standardize each feature with
+        leaf_size (int, optional): Albums per leaf of the KD-tree. Defaults to 40.
+        max_pending (int, optional): Albums to add before the tree is rebuilt.
+            Defaults to 1000.
+    """
+
+    def __init__(
+            self,
+            album_data: pd.DataFrame,
+            features: typing.List[str],
+            mean: np.ndarray,
+            scale: np.ndarray,
+            leaf_size: int = 40,
+            max_pending: int = 1000
+    ):
+        self.features = list(features)
+        self.mean = np.asarray(mean, dtype=float)
+        self.scale = np.asarray(scale, dtype=float)
+        self.leaf_size = leaf_size
+        self.max_pending = max_pending
+        self.lock = threading.RLock()
+        self._build(album_data["id"].to_numpy(), self._standardize(album_data))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.album_ids) + len(self.pending_ids)
+
+    @property
+    def max_id(self) -> typing.Optional[int]:
+        """Largest album id in the index (None if it's empty)."""
+        with self.lock:
+            return int(max(self.album_ids.max(initial=-1), self.pending_ids.max(initial=-1))) if len(self) else None
+
+    def add(self, album_data: pd.DataFrame) -> None:
+        """
+        Add albums to the index.
+
+        Args:
+            album_data (:obj:`pandas.DataFrame`): Each new album's "id" and features
+
+        Returns:
+            None
+        """
+        pending = self._standardize(album_data)
+        with self.lock:
+            self.pending_ids = np.concatenate([self.pending_ids, album_data["id"].to_numpy()])
+            self.pending = np.vstack([self.pending, pending])
+            if len(self.pending_ids) > self.max_pending:
+                start_time = time()
+                self._build(
+                    np.concatenate([self.album_ids, self.pending_ids]),
+                    np.vstack([self.data, self.pending])
+                )
+                logger.info("Rebuilt similarity index of %d albums in %0.4fs", len(self), time() - start_time)
+
+    def query(
+            self,
+            data: typing.Optional[pd.DataFrame] = None,
+            album_id: typing.Optional[int] = None,
+            k: int = 10
+    ) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the albums most similar to an album in the index or to given features.
+
+        Args:
+            data (:obj:`pandas.DataFrame`, optional): One row with the features
+                to compare to. Defaults to None.
+            album_id (int, optional): Album (in the index) to compare to, which
+                isn't counted as similar to itself. Defaults to None.
+            k (int, optional): Number of albums to find. Defaults to 10.
+
+        Returns:
+            tuple(:obj:`numpy.ndarray`, :obj:`numpy.ndarray`): Ids of the most
+                similar albums and their (standardized) Euclidean distances, closest first
+
+        Raises:
+            KeyError: If `album_id` isn't in the index
+        """
+        if album_id is None and data is None:
+            raise ValueError("Give either `data` or `album_id` to compare to")
+
+        with self.lock:
+            point = self._vector(album_id) if album_id is not None else self._standardize(data)[0]
+            # One extra neighbour to leave the album itself out
+            n_neighbours = min(k + (album_id is not None), len(self.album_ids))
+            distances, rows = self.tree.query(point[np.newaxis], k=n_neighbours) if n_neighbours else ([[]], [[]])
+            ids = np.concatenate([self.album_ids[np.asarray(rows[0], dtype=int)], self.pending_ids])
+            distances = np.concatenate([distances[0], np.sqrt(((self.pending - point) ** 2).sum(axis=1))])
+
+        order = np.argsort(distances, kind="stable")
+        if album_id is not None:
+            order = order[ids[order] != album_id]
+        order = order[:k]
+        return ids[order], distances[order]
+
+    def _build(self, album_ids: np.ndarray, X: np.ndarray) -> None:
+        """Build the tree, sorted by album id, with no albums pending."""
+        order = np.argsort(album_ids, kind="stable")
+        self.album_ids = album_ids[order]
+        self.data = X[order]
+        self.tree = KDTree(self.data, leaf_size=self.leaf_size) if len(self.data) else None
+        self.pending_ids = np.empty(0, dtype=self.album_ids.dtype)
+        self.pending = np.empty((0, len(self.features)))
+
+    def _standardize(self, data: pd.DataFrame) -> np.ndarray:
+        """Standardized features, with missing values at the mean."""
+        X = (data[self.features].to_numpy(dtype=float) - self.mean) / self.scale
+        return np.nan_to_num(X, nan=0.0)
+
+    def _vector(self, album_id: int) -> np.ndarray:
+        """Standardized features of an album in the index."""
+        row = np.searchsorted(self.album_ids, album_id)
+        if row < len(self.album_ids) and self.album_ids[row] == album_id:
+            return self.data[row]
+        pending_rows = np.flatnonzero(self.pending_ids == album_id)
+        if len(pending_rows):
+            return self.pending[pending_rows[0]]
+        raise KeyError("Album %s is not in the similarity index" % album_id)
+
+
+def similar_albums(
+        index: SimilarityIndex,
+        album_manager,
+        data: typing.Optional[pd.DataFrame] = None,
+        album_id: typing.Optional[int] = None,
+        k: int = 10
+) -> pd.DataFrame:
+    """
+    Look up the albums most similar to an album, or to given features.
+
+    Args:
+        index (`SimilarityIndex`): Index of the albums in the database
+        album_manager (`albums_database.AlbumManager`): Session on the database
+        data (:obj:`pandas.DataFrame`, optional): One row with the features to
+            compare to. Defaults to None.
+        album_id (int, optional): Album to compare to. Defaults to None.
+        k (int, optional): Number of albums to find. Defaults to 10.
+
+    Returns:
+        :obj:`pandas.DataFrame` of each similar album's id, artist, title,
+            genre, release year, actual score, and distance, closest first
+    """
+    start_time = time()
+    ids, distances = index.query(data=data, album_id=album_id, k=k)
+    albums = {album.id: album for album in album_manager.get_albums(ids.tolist())}
+    similar = pd.DataFrame(
+        [
+            (album_id, album.artist, album.album, album.genre, album.releaseyear, album.score, distance)
+            for album_id, distance in zip(ids.tolist(), distances)
+            for album in [albums.get(album_id)] if album is not None  # Unless deleted since indexing
+        ],
+        columns=["id", "artist", "album", "genre", "releaseyear", "score", "distance"]
+    )
+    logger.debug("Found %d similar albums in %0.4fs", len(similar), time() - start_time)
+    return similar
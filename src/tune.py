@@ -0,0 +1,173 @@
+"""
+Search for model hyperparameters with successive halving.
+"""
+import itertools
+import logging
+import math
+import os
+import typing
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+import numpy as np
+import pandas as pd
+import sklearn.base
+from sklearn.metrics import mean_squared_error
+
+from src import model
+
+logger = logging.getLogger(__name__)
+
+# Preprocessed training and validation data, shared by every candidate a worker
+# process trains (set once per worker by `_init_worker`)
+_WORKER_DATA = {}
+
+
+def tune_model(
+        data: pd.DataFrame,
+        model_config: dict,
+        search_space: typing.Dict[str, list],
+        resource: str = "n_estimators",
+        min_resource: int = 25,
+        max_resource: int = 200,
+        factor: int = 3,
+        n_workers: int = 1
+) -> typing.Tuple[pd.DataFrame, dict]:
+    """
+    Find the best `make_model` parameters by successive halving.
+
+    Every combination of values in `search_space` is trained on the training split
+    and scored (RMSE) on the validation split. Candidates start with
+    `min_resource` boosting stages; after each round only the best 1/`factor` are
+    kept, and those continue boosting (warm-started, so earlier stages are reused)
+    with `factor` times as many stages, up to `max_resource`.
+
+    The preprocessor is fit once on the training split (or loaded from the
+    preprocessor cache configured for `train_pipeline`), and the preprocessed data
+    is sent to each worker process once rather than with every candidate.
+
+    Args:
+        data (:obj:`pandas.DataFrame`): Cleaned data
+        model_config (dict): `model` section of the config file
+        search_space (dict): Candidate values for each `make_model` parameter
+        resource (str, optional): Parameter counting boosting stages ("n_estimators"
+            for "gradient_boosting", "max_iter" for "hist_gradient_boosting").
+            Defaults to "n_estimators".
+        min_resource (int, optional): Stages in the first round. Defaults to 25.
+        max_resource (int, optional): Most stages in any round. Defaults to 200.
+        factor (int, optional): Reduction factor between rounds. Defaults to 3.
+        n_workers (int, optional): Number of worker processes, or -1 for one per
+            CPU core. Defaults to 1.
+
+    Returns:
+        tuple(:obj:`pandas.DataFrame`, dict): Leaderboard with each candidate's
+            parameters, the last round it reached, and its validation RMSE there
+            (best first); and the winning `make_model` parameters
+    """
+    start_time = time()
+    if n_workers == -1:
+        n_workers = os.cpu_count() or 1
+
+    # Split and preprocess once for every candidate
+    X, y = model.split_predictors_response(data, **model_config["split_predictors_response"])
+    X_train, X_val, _, y_train, y_val, _ = model.split_train_val_test(
+        X, y, **model_config["split_train_val_test"]
+    )
+    preprocessor, X_train = model.fit_preprocessor(
+        model.make_preprocessor(**model_config["make_preprocessor"]),
+        X_train,
+        y_train,
+        **model_config.get("train_pipeline", {})
+    )
+    worker_data = {
+        "X_train": X_train,
+        "X_val": preprocessor.transform(X_val),
+        "y_train": np.asarray(y_train),
+        "y_val": np.asarray(y_val)
+    }
+    mask = model.categorical_mask(preprocessor)
+
+    # Every combination of candidate values, on top of the configured parameters
+    names = list(search_space)
+    candidates = [
+        dict(model_config["make_model"], **dict(zip(names, values)))
+        for values in itertools.product(*(search_space[name] for name in names))
+    ]
+    estimators = [None] * len(candidates)
+    alive = list(range(len(candidates)))
+    results = {}
+    logger.info("Tuning %d candidates with %d workers", len(candidates), n_workers)
+
+    with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(worker_data,)) as executor:
+        for round_number in itertools.count():
+            n_stages = min(min_resource * factor ** round_number, max_resource)
+            fitted = executor.map(
+                _fit_candidate,
+                [candidates[i] for i in alive],
+                [estimators[i] for i in alive],
+                itertools.repeat(resource),
+                itertools.repeat(n_stages),
+                itertools.repeat(mask)
+            )
+            for i, (estimator, rmse) in zip(alive, fitted):
+                estimators[i] = estimator
+                results[i] = {"round": round_number, resource: n_stages, "val_rmse": rmse}
+
+            logger.info(
+                "Round %d: %d candidates with %d stages. Best validation RMSE: %0.4f",
+                round_number, len(alive), n_stages, min(results[i]["val_rmse"] for i in alive)
+            )
+            if n_stages >= max_resource or len(alive) == 1:
+                break
+
+            # Keep the best 1/factor of candidates for the next round
+            alive = sorted(alive, key=lambda i: results[i]["val_rmse"])[:max(1, len(alive) // factor)]
+
+    leaderboard = pd.DataFrame([
+        dict({name: candidates[i][name] for name in names}, **results[i])
+        for i in range(len(candidates))
+    ])
+    leaderboard = leaderboard.sort_values(["round", "val_rmse"], ascending=[False, True], ignore_index=True)
+
+    best_index = min(alive, key=lambda i: results[i]["val_rmse"])
+    best = dict(candidates[best_index], **{resource: results[best_index][resource]})
+    logger.info("Best parameters: %s. Time taken: %0.4fs", best, time() - start_time)
+
+    return leaderboard, best
+
+
+def _init_worker(worker_data: dict) -> None:
+    """Keep the preprocessed data in the worker process for every candidate."""
+    _WORKER_DATA.update(worker_data)
+
+
+def _fit_candidate(
+        params: dict,
+        estimator: typing.Optional[sklearn.base.BaseEstimator],
+        resource: str,
+        n_stages: int,
+        mask: typing.Optional[typing.List[bool]]
+) -> typing.Tuple[sklearn.base.BaseEstimator, float]:
+    """
+    Train (or continue training) one candidate and score it on the validation split.
+
+    Args:
+        params (dict): `make_model` parameters
+        estimator (:obj:`sklearn.base.BaseEstimator`): Estimator from the previous
+            round, or None in the first round
+        resource (str): Parameter counting boosting stages
+        n_stages (int): Boosting stages to train up to
+        mask (list(bool)): Categorical columns of the preprocessed data
+
+    Returns:
+        tuple(:obj:`sklearn.base.BaseEstimator`, float): Fitted estimator and its
+            validation RMSE
+    """
+    if estimator is None:
+        estimator = model.make_model(categorical_mask=mask, **params)
+        estimator.set_params(warm_start=True)
+    estimator.set_params(**{resource: n_stages})
+
+    estimator.fit(_WORKER_DATA["X_train"], _WORKER_DATA["y_train"])
+    preds = estimator.predict(_WORKER_DATA["X_val"])
+    return estimator, math.sqrt(mean_squared_error(_WORKER_DATA["y_val"], preds))
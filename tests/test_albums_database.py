@@ -0,0 +1,249 @@
+"""
+Test albums_database.py module.
+"""
+import shutil
+import threading
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+import sqlalchemy
+
+from src import albums_database, model
+from src.albums_database import AlbumManager, Albums, HeartbeatHistory, Predictions
+
+
+@pytest.fixture
+def trained():
+    """Pipeline trained on energy and genre"""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(data={
+        "energy": rng.uniform(size=100),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 25
+    })
+    target = 5 * data["energy"] + (data["genre"] == "Rap")
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    return model.train_pipeline(data, target, preprocessor, model.make_model(n_estimators=20))
+
+
+@pytest.fixture
+def album_manager():
+    """Session on an in-memory database of three albums"""
+    manager = AlbumManager(engine_string="sqlite://")
+    albums_database.Base.metadata.create_all(manager.session.get_bind())
+    manager.session.add_all([
+        Albums(album=album, reviewauthor="Author", score=7.0, genre=genre, energy=energy)
+        for album, genre, energy in [("A", "Rap", 0.25), ("B", "Rock", 0.5), ("C", "Jazz", 0.75)]
+    ])
+    manager.session.commit()
+    yield manager
+    manager.close()
+
+
+def test_refresh_predictions(album_manager, trained):
+    """Only albums without a prediction from the model version are scored."""
+    assert album_manager.refresh_predictions(trained, "v1", batch_size=2) == 3
+    assert album_manager.refresh_predictions(trained, "v1") == 0
+
+    album_manager.session.add(Albums(album="D", reviewauthor="Author", score=5.0, genre="Rap", energy=0.9))
+    album_manager.session.commit()
+    assert album_manager.refresh_predictions(trained, "v1") == 1
+    assert album_manager.refresh_predictions(trained, "v2") == 4
+
+    stored = album_manager.session.query(Predictions.score).filter(Predictions.model_version == "v1")
+    expected = trained.predict(pd.DataFrame(data={
+        "energy": [0.25, 0.5, 0.75, 0.9],
+        "genre": ["Rap", "Rock", "Jazz", "Rap"]
+    }))
+    np.testing.assert_allclose(sorted(score for score, in stored), sorted(expected))
+
+
+def test_refresh_predictions_of_added_album(album_manager, trained):
+    """Only the given albums are scored, such as one just added."""
+    album_id = album_manager.add_album(
+        "D", "Artist", "Author", 5.0, 2021, "June 9 2021", "Label", "Rap", *[0.9] * 10
+    )
+
+    assert album_manager.refresh_predictions(trained, "v1", album_ids=[album_id]) == 1
+    assert album_manager.session.query(Predictions.album_id).all() == [(album_id,)]
+    assert album_manager.add_album("E", "Artist", "Author", 5.0, 2021, "Not a date", "Label", "Rap", *[0.9] * 10) is None
+
+
+def test_album_features_index_added(album_manager):
+    """Databases created without the index of albums by features get it."""
+    bind = album_manager.session.get_bind()
+    bind.execute("DROP INDEX ix_albums_features")
+    album_manager._ensure_tables()
+
+    indexes = sqlalchemy.inspect(bind).get_indexes("albums")
+    assert [index["column_names"] for index in indexes] == [albums_database.FEATURE_INDEX_COLUMNS]
+
+
+def test_query_with_predictions(album_manager, trained):
+    """Albums not scored by the model version have no predicted score."""
+    album_manager.refresh_predictions(trained, "v1")
+    album_manager.session.add(Albums(album="D", reviewauthor="Author", score=5.0))
+    album_manager.session.commit()
+
+    predicted = {album.album: score for album, score in album_manager.query_with_predictions("v1")}
+    assert predicted["D"] is None
+    assert all(predicted[album] is not None for album in ["A", "B", "C"])
+    assert all(score is None for _, score in album_manager.query_with_predictions("v2"))
+
+
+def test_find_prediction(album_manager, trained):
+    """Only albums with exactly the same features (given as strings) match."""
+    album_manager.refresh_predictions(trained, "v1")
+    expected = trained.predict(pd.DataFrame(data={"energy": [0.5], "genre": ["Rock"]}))[0]
+
+    assert album_manager.find_prediction("v1", {"energy": "0.5", "genre": "Rock"}) == pytest.approx(expected)
+    assert album_manager.find_prediction("v1", {"energy": "0.5", "genre": "Rap"}) is None
+    assert album_manager.find_prediction("v1", {"energy": "0.51", "genre": "Rock"}) is None
+    assert album_manager.find_prediction("v1", {"energy": "loud", "genre": "Rock"}) is None
+    assert album_manager.find_prediction("v2", {"energy": "0.5", "genre": "Rock"}) is None
+
+
+def add_albums(album_manager, albums):
+    """Add (genre, releaseyear, recordlabel, score, energy) albums through `add_album`"""
+    for genre, releaseyear, recordlabel, score, energy in albums:
+        album_manager.add_album(
+            "Album", "Artist", "Author", score, releaseyear, "June 9 2021", recordlabel, genre, *[energy] * 10
+        )
+
+
+def test_album_stats_counts_new_albums(album_manager):
+    """Albums already in the database are summarized once, and new ones as they're added."""
+    albums_database.AlbumStats.__table__.drop(album_manager.session.get_bind())
+    add_albums(album_manager, [("Rap", 2019, "Label", 9.0, 0.5), ("Rock", 2019, None, 6.0, None)])
+    add_albums(album_manager, [("Rap", 2018, "Label", 8.0, 0.75)])
+    albums = pd.read_sql(album_manager.session.query(Albums).statement, album_manager.session.get_bind())
+
+    stats = album_manager.album_stats(["genre"], ["score", "energy"]).set_index("genre")
+    expected = albums.groupby("genre")
+    np.testing.assert_allclose(stats["score_mean"], expected["score"].mean())
+    np.testing.assert_allclose(stats["score_std"], expected["score"].std())
+    np.testing.assert_allclose(stats["energy_count"], expected["energy"].count())
+    np.testing.assert_allclose(stats["energy_max"], expected["energy"].max())
+
+    rap_2019 = album_manager.album_stats(measures=["score"], genre="Rap", releaseyear=2019)
+    assert rap_2019["score_count"].item() == 1
+    no_label = album_manager.album_stats(["recordlabel"], ["score"], genre="Rock")
+    assert no_label["recordlabel"].tolist() == [""]
+    assert album_manager.album_stats(measures=["score"])["score_count"].item() == 6
+
+
+def test_rebuild_stats(album_manager):
+    """Rebuilding the statistics from scratch matches the incrementally updated ones."""
+    albums_database.AlbumStats.__table__.drop(album_manager.session.get_bind())
+    add_albums(album_manager, [("Rap", 2019, "Label", 9.0, 0.5), ("Rap", 2019, "Label", 7.0, 0.25)])
+    before = album_manager.album_stats(["genre", "releaseyear", "recordlabel"])
+    album_manager.rebuild_stats()
+
+    pd.testing.assert_frame_equal(album_manager.album_stats(["genre", "releaseyear", "recordlabel"]), before)
+    with pytest.raises(ValueError):
+        album_manager.album_stats(["artist"])
+
+
+def test_update_stats_adds_to_stored_stats(tmp_path):
+    """New albums' statistics are added to those stored by another manager, as all of them summarized at once."""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(data={
+        "genre": rng.choice(["Rap", "Rock", None], size=100),
+        "releaseyear": rng.choice([2018, 2019], size=100),
+        "recordlabel": rng.choice(["A", "B"], size=100),
+        **{measure: rng.uniform(size=100) for measure in albums_database.STATS_MEASURES}
+    })
+    data.loc[95:, "energy"] = np.nan
+    engine_string = "sqlite:///" + str(tmp_path / "albums.db")
+    albums_database.create_db(engine_string)
+    managers = [AlbumManager(engine_string=engine_string) for _ in range(2)]
+    for manager, rows in zip(managers, [data[:90], data[90:]]):
+        manager.session.add_all([Albums(album="A", reviewauthor="Author", **row) for row in rows.to_dict("records")])
+        manager._update_stats(manager.session.new)
+        manager.session.commit()
+
+    table = albums_database.AlbumStats.__table__
+    stored = pd.DataFrame(
+        managers[0].session.query(table).all(), columns=[column.name for column in table.columns]
+    ).set_index(["grouping"] + albums_database.STATS_DIMENSIONS)
+    expected = albums_database.aggregate_stats(data)
+    for manager in managers:
+        manager.close()
+
+    pd.testing.assert_frame_equal(stored.loc[expected.index], expected, check_dtype=False)
+
+
+def test_read_replicas(tmp_path):
+    """Reads go to a replica once it has the thread's latest write, and until then to the primary."""
+    primary, replica = str(tmp_path / "primary.db"), str(tmp_path / "replica.db")
+    albums_database.create_db("sqlite:///" + primary)
+    album_manager = AlbumManager(engine_string="sqlite:///" + primary, replica_strings=["sqlite:///" + replica])
+    add_albums(album_manager, [("Rap", 2019, "Label", 9.0, 0.5)])
+    assert album_manager.read_session() is album_manager.session
+    assert album_manager.replica_lag()[0]["versions_behind"] is None  # The replica isn't set up yet
+
+    shutil.copy(primary, replica)  # Replicate
+    assert album_manager.read_session() is album_manager.replica_sessions[0]
+    assert album_manager.replica_lag()[0]["versions_behind"] == 0
+
+    add_albums(album_manager, [("Rock", 2018, "Label", 6.0, 0.25)])
+    assert album_manager.replica_lag()[0]["versions_behind"] == 1
+    assert len(album_manager.get_albums([1, 2])) == 2  # Read from the primary
+
+    shutil.copy(primary, replica)
+    album_manager.replica_sessions[0].execute("DELETE FROM albums WHERE id = 1")  # Only on the replica
+    album_manager.replica_sessions[0].commit()
+    assert [album.id for album in album_manager.get_albums([1, 2])] == [2]
+    album_manager.close()
+
+
+def test_read_replicas_per_client(tmp_path):
+    """Only a client that wrote needs a replica with its write, whichever manager (i.e. app process) serves it."""
+    primary, replica = str(tmp_path / "primary.db"), str(tmp_path / "replica.db")
+    albums_database.create_db("sqlite:///" + primary)
+    managers = [
+        AlbumManager(engine_string="sqlite:///" + primary, replica_strings=["sqlite:///" + replica])
+        for _ in range(2)
+    ]
+    add_albums(managers[0], [("Rap", 2019, "Label", 9.0, 0.5)])
+    shutil.copy(primary, replica)
+    add_albums(managers[0], [("Rock", 2018, "Label", 6.0, 0.25)])
+    write_version = managers[0].required_version
+
+    # Another client's requests, on another thread, may read the lagging replica
+    other_client = []
+    thread = threading.Thread(target=lambda: other_client.append(managers[0].read_session()))
+    thread.start()
+    thread.join()
+    assert other_client == [managers[0].replica_sessions[0]]
+
+    # The writing client's next request, served by the other manager
+    managers[1].require_version(write_version)
+    assert managers[1].read_session() is managers[1].session
+    assert managers[1].read_session(min_version=write_version - 1) is managers[1].replica_sessions[0]
+    shutil.copy(primary, replica)
+    assert managers[1].read_session() is managers[1].replica_sessions[0]
+    for manager in managers:
+        manager.close()
+
+
+def test_replica_lag_since_first_missing_write(tmp_path):
+    """A replica is behind by the time since the first write it's missing, not since its own latest write."""
+    primary, replica = str(tmp_path / "primary.db"), str(tmp_path / "replica.db")
+    albums_database.create_db("sqlite:///" + primary)
+    album_manager = AlbumManager(engine_string="sqlite:///" + primary, replica_strings=["sqlite:///" + replica])
+    add_albums(album_manager, [("Rap", 2019, "Label", 9.0, 0.5)])
+    shutil.copy(primary, replica)
+
+    # A day later, the primary takes another write that isn't replicated yet
+    for session in [album_manager.session, album_manager.replica_sessions[0]]:
+        session.query(albums_database.Heartbeat).update({"written_at": datetime.utcnow() - timedelta(days=1)})
+        session.commit()
+    add_albums(album_manager, [("Rock", 2018, "Label", 6.0, 0.25)])
+    lag = album_manager.replica_lag()[0]
+
+    assert lag["versions_behind"] == 1
+    assert 0 <= lag["seconds_behind"] < 60
+    assert album_manager.session.query(HeartbeatHistory).count() == 2
+    album_manager.close()
@@ -330,3 +330,79 @@ def test_bucket_values_together_scalar_values(dummy_df):
             values="Run the Jewels 2",
             replace_with="RTJ2"
         )
+
+
+def test_clean_dataset_parallel_matches_serial():
+    """Cleaning partitions in a process pool gives the same output as a serial run."""
+    config = {
+        "fill_na_with_str": {
+            "iteration1": {"colname": "artist", "fill_string": "NA"},
+            "iteration2": {"colname": "genre", "fill_string": "Missing"}
+        },
+        "convert_str_to_datetime": {"colname": "reviewdate", "datetime_format": "%B %d %Y"},
+        "approximate_missing_year": {"fill_column": "releaseyear", "approximate_with": "reviewdate"},
+        "convert_datetime_to_date": {"colname": "reviewdate"},
+        "fill_missing_manually": {"colname": "recordlabel", "fill_with": MISSING_RECORD_LABELS * 3},
+        "strip_whitespace": {"colname": "recordlabel"},
+        "bucket_values_together": {
+            "iteration1": {"colname": "recordlabel", "values": ["XL"], "replace_with": "XL Recordings"},
+            "iteration2": {"colname": "genre", "values": ["Metal"], "replace_with": "Rock"}
+        }
+    }
+    raw = pd.DataFrame(data=RAW_DATA * 3, columns=COLUMNS)
+
+    expected = clean.clean_dataset(raw.copy(), config)
+    actual = clean.clean_dataset(raw.copy(), config, n_workers=2)
+
+    pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_clean_dataset_parallel_bad_fill_length(dummy_df):
+    """Differing number of missing values and manual fill values."""
+    config = {"fill_missing_manually": {"colname": "recordlabel", "fill_with": MISSING_RECORD_LABELS[:-1]}}
+    with pytest.raises(ValueError):
+        clean.clean_dataset(dummy_df, config, n_workers=2)
+
+
+def test_clean_incremental_matches_full_clean():
+    """Cleaning only new rows on top of a previous snapshot matches a full clean."""
+    config = {
+        "convert_str_to_datetime": {"colname": "reviewdate", "datetime_format": "%B %d %Y"},
+        "fill_missing_manually": {"colname": "recordlabel", "fill_with": MISSING_RECORD_LABELS * 2},
+        "strip_whitespace": {"colname": "artist"}
+    }
+    raw = pd.DataFrame(data=RAW_DATA * 2, columns=COLUMNS)
+    raw.loc[5, "album"] = "...And Justice for All"
+
+    # Previous snapshot holds the first three rows
+    previous_config = deepcopy(config)
+    previous_config["fill_missing_manually"]["fill_with"] = MISSING_RECORD_LABELS
+    previous_fingerprints = clean.fingerprint_rows(raw.iloc[:3], previous_config)
+    previous = clean.clean_dataset(raw.iloc[:3].copy(), previous_config)
+
+    actual, fingerprints = clean.clean_incremental(raw.copy(), config, previous, previous_fingerprints)
+    expected = clean.clean_dataset(raw.copy(), config)
+
+    pd.testing.assert_frame_equal(actual, expected)
+    pd.testing.assert_series_equal(fingerprints, clean.fingerprint_rows(raw, config))
+
+
+def test_clean_incremental_reuses_previous_rows(dummy_df):
+    """Rows found in the previous snapshot are taken from it rather than cleaned again."""
+    config = {"strip_whitespace": {"colname": "artist"}}
+    previous_fingerprints = clean.fingerprint_rows(dummy_df.iloc[:2], config)
+    previous = clean.clean_dataset(dummy_df.iloc[:2].copy(), config)
+    previous.loc[0, "album"] = "From the snapshot"
+
+    actual, _ = clean.clean_incremental(dummy_df.copy(), config, previous, previous_fingerprints)
+
+    assert list(actual["album"]) == ["From the snapshot", "Modern Vampires of the City", "Metallica"]
+    assert list(actual["artist"]) == ["Run the Jewels", "Vampire Weekend", "Metallica"]
+
+
+def test_fingerprint_rows_config_change(dummy_df):
+    """Changing the cleaning config changes every fingerprint."""
+    before = clean.fingerprint_rows(dummy_df, {"strip_whitespace": {"colname": "artist"}})
+    after = clean.fingerprint_rows(dummy_df, {"strip_whitespace": {"colname": "album"}})
+
+    assert not before.isin(after).any()
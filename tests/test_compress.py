@@ -0,0 +1,79 @@
+"""
+Test compress.py module.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import compress, model
+
+
+@pytest.fixture
+def trained():
+    """Pipeline trained on the first 150 of 200 rows"""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(data={
+        "energy": rng.uniform(size=200),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 50
+    })
+    target = 5 * data["energy"] + (data["genre"] == "Rap") + rng.normal(scale=0.1, size=200)
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    pipe = model.train_pipeline(data[:150], target[:150], preprocessor, model.make_model(n_estimators=50))
+    return pipe, data, target
+
+
+@pytest.mark.parametrize("engine", ["gradient_boosting", "hist_gradient_boosting"])
+def test_truncate_pipeline(trained, engine):
+    """A truncated pipeline predicts what the original did after as many stages."""
+    _, data, target = trained
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    stages = {"gradient_boosting": "n_estimators", "hist_gradient_boosting": "max_iter"}[engine]
+    pipe = model.train_pipeline(data, target, preprocessor, model.make_model(engine=engine, **{stages: 20}))
+    truncated = compress.truncate_pipeline(pipe, 5, data, target)
+
+    staged = list(pipe["predictor"].staged_predict(pipe["preprocessor"].transform(data)))
+    np.testing.assert_allclose(truncated.predict(data), staged[4])
+    assert len(staged) == 20
+
+
+def test_truncate_pipeline_refit_requires_training_data(trained):
+    """Histogram GBT can only be truncated by refitting it on the training data."""
+    _, data, target = trained
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    pipe = model.train_pipeline(data, target, preprocessor, model.make_model(engine="hist_gradient_boosting"))
+    with pytest.raises(ValueError):
+        compress.truncate_pipeline(pipe, 5)
+
+
+def test_compress_pipeline_accuracy_budget(trained):
+    """The fewest stages within the accuracy budget are kept."""
+    pipe, data, target = trained
+    compressed, report = compress.compress_pipeline(
+        pipe, data[:150], target[:150], data[150:], target[150:], max_rmse_increase=0.05
+    )
+    truncated = report.set_index("candidate").loc["truncated"]
+
+    assert truncated["selected"]
+    assert 1 <= truncated["n_stages"] < 50
+    assert truncated["rmse_increase"] <= 0.05
+    assert compressed["predictor"].n_estimators_ == truncated["n_stages"]
+    assert compressed.telemetry_["compression"][1]["candidate"] == "truncated"
+
+
+def test_compress_pipeline_distill(trained):
+    """A linear student can replace the ensemble if it's accurate enough."""
+    pipe, data, target = trained
+    compressed, report = compress.compress_pipeline(
+        pipe, data[:150], target[:150], data[150:], target[150:], max_rmse_increase=1.0, distill="linear"
+    )
+
+    assert list(report["candidate"]) == ["original", "truncated", "distilled_linear"]
+    assert report.loc[report["selected"], "candidate"].item() == "distilled_linear"
+    assert compressed.predict(data[150:]).shape == (50,)
+
+
+def test_compress_pipeline_requires_budget(trained):
+    """Either an accuracy or a latency budget must be given."""
+    pipe, data, target = trained
+    with pytest.raises(ValueError):
+        compress.compress_pipeline(pipe, data[:150], target[:150], data[150:], target[150:])
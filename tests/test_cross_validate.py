@@ -0,0 +1,35 @@
+"""
+Test cross_validate.py module.
+"""
+import numpy as np
+import pandas as pd
+
+from src import cross_validate
+
+MODEL_CONFIG = {
+    "split_predictors_response": {"target_col": "score"},
+    "make_model": {"random_state": 0, "n_estimators": 10},
+    "make_preprocessor": {
+        "numeric_features": ["energy"],
+        "categorical_features": ["genre"],
+        "handle_unknown": "ignore"
+    }
+}
+
+
+def test_cross_validate_model():
+    """Every fold, and all out-of-fold predictions together, get every metric."""
+    data = pd.DataFrame(data={
+        "energy": np.linspace(0, 1, 100),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 25,
+        "score": np.linspace(0, 10, 100)
+    })
+
+    report = cross_validate.cross_validate_model(
+        data, MODEL_CONFIG, n_folds=4, n_bootstrap=50, random_state=0, n_workers=2
+    )
+
+    assert len(report.index) == 5 * 5
+    assert list(report["fold"].unique()) == [0, 1, 2, 3, "all"]
+    assert list(report.loc[report["fold"] == "all", "n_rows"].unique()) == [100]
+    assert (report["ci_lower"] <= report["ci_upper"]).all()
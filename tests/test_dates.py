@@ -0,0 +1,42 @@
+"""
+Test dates.py module.
+"""
+import datetime
+
+import pandas as pd
+import pytest
+from numpy import NaN
+
+from src import dates
+
+
+def test_parse_dates_detects_format():
+    """Raw and ISO-formatted date strings are both parsed."""
+    actual = dates.parse_dates(["October 29 2014", "2013-05-13", "October 29 2014"])
+    expected = pd.Series(pd.to_datetime(["2014-10-29", "2013-05-13", "2014-10-29"]))
+
+    pd.testing.assert_series_equal(actual, expected)
+
+
+def test_parse_dates_keeps_index_and_missing_values():
+    """Index of an input `pandas.Series` is kept and missing values become `NaT`."""
+    values = pd.Series(["July 9 2017", NaN], index=[5, 8])
+    actual = dates.parse_dates(values)
+    expected = pd.Series(pd.to_datetime(["2017-07-09", None]), index=[5, 8])
+
+    pd.testing.assert_series_equal(actual, expected)
+
+
+def test_parse_dates_no_matching_format():
+    """A string matching none of the formats raises an error."""
+    with pytest.raises(ValueError):
+        dates.parse_dates(["October 29 2014"], formats=("%Y-%m-%d",))
+
+
+def test_parse_date():
+    """Parse a single date string to `datetime.date`."""
+    assert dates.parse_date("May 13 2013") == datetime.date(2013, 5, 13)
+    assert dates.parse_date("2013-05-13") == datetime.date(2013, 5, 13)
+
+    with pytest.raises(ValueError):
+        dates.parse_date("13/05/2013")
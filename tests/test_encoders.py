@@ -0,0 +1,55 @@
+"""
+Test encoders.py module.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import encoders
+
+
+@pytest.fixture
+def labels():
+    """Record labels with a target that depends on them"""
+    X = pd.DataFrame(data={"recordlabel": ["Sub Pop", "Merge", "XL", "Merge"] * 25})
+    y = np.where(X["recordlabel"] == "Merge", 8.0, 6.0)
+    return X, y
+
+
+def test_target_encoder(labels):
+    """Cross-fitted training encodings differ from the full-data encodings used later."""
+    X, y = labels
+    encoder = encoders.TargetEncoder(smoothing=0)
+    train_encoded = encoder.fit_transform(X, y)
+    new_encoded = encoder.transform(pd.DataFrame(data={"recordlabel": ["Merge", "Matador"]}))
+
+    np.testing.assert_allclose(train_encoded[:, 0], y)
+    np.testing.assert_allclose(new_encoded[:, 0], [8.0, y.mean()])
+    assert encoder.get_feature_names() == ["recordlabel_target"]
+
+
+def test_target_encoder_smoothing(labels):
+    """Smoothing shrinks each category's mean towards the overall mean."""
+    X, y = labels
+    encoder = encoders.TargetEncoder(smoothing=50).fit(X, y)
+
+    # 50 rows of "Merge" are pulled halfway towards the overall mean
+    merge = encoder.transform(pd.DataFrame(data={"recordlabel": ["Merge"]}))[0, 0]
+    assert merge == pytest.approx((8.0 + y.mean()) / 2)
+
+
+def test_frequency_encoder(labels):
+    """Categories are encoded by their share of the training rows, unseen ones by 0."""
+    X, _ = labels
+    encoded = encoders.FrequencyEncoder().fit(X).transform(pd.DataFrame(data={"recordlabel": ["Merge", "XL", "4AD"]}))
+    np.testing.assert_allclose(encoded[:, 0], [0.5, 0.25, 0.0])
+
+
+def test_hashing_encoder(labels):
+    """Each row hashes into exactly one of a fixed number of buckets per feature."""
+    X, _ = labels
+    X["artist"] = ["Low", "Wilco"] * 50
+    encoded = encoders.HashingEncoder(n_buckets=16).fit(X).transform(X)
+
+    assert encoded.shape == (100, 16)
+    np.testing.assert_array_equal(encoded.sum(axis=1), 2)
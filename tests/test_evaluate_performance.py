@@ -0,0 +1,115 @@
+"""
+Test evaluate_performance.py module.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import evaluate_performance
+
+
+def test_bootstrap_metrics_cover_point_estimates():
+    """Intervals contain the full-sample metrics and don't depend on the batch size."""
+    rng = np.random.default_rng(0)
+    y_true = rng.normal(7, 1.3, size=500)
+    y_pred = y_true + rng.normal(0, 1, size=500)
+
+    point = evaluate_performance.evaluate_model(
+        pd.DataFrame(data={"score": y_true, "preds": y_pred}), "score", "preds"
+    ).set_index("metric")["performance"]
+    intervals = evaluate_performance.bootstrap_metrics(y_true, y_pred, n_bootstrap=200, random_state=0)
+    rebatched = evaluate_performance.bootstrap_metrics(
+        y_true, y_pred, n_bootstrap=200, random_state=0, batch_size=200
+    )
+
+    intervals = intervals.set_index("metric")
+    for metric in ["mse", "rmse", "mad", "r_squared"]:
+        assert intervals.loc[metric, "ci_lower"] <= point[metric] <= intervals.loc[metric, "ci_upper"]
+    assert intervals.loc["max_err", "ci_upper"] <= point["max_err"]
+    pd.testing.assert_frame_equal(intervals.reset_index(), rebatched)
+
+
+def test_bootstrap_metrics_constant_resamples():
+    """Resamples with constant true values have a finite R-squared."""
+    intervals = evaluate_performance.bootstrap_metrics([7.0, 7.5], [7.0, 7.0], n_bootstrap=50, random_state=0)
+
+    assert np.isfinite(intervals.set_index("metric").loc["r_squared", ["ci_lower", "ci_upper"]]).all()
+
+
+@pytest.mark.parametrize("y_pred", [[5.0, 4.0, 6.0], [5.0, 5.0, 5.0]])
+def test_metric_accumulator_constant_true_values(y_pred):
+    """Constant true values get the same R-squared as from evaluate_model."""
+    report = evaluate_performance.MetricAccumulator().update([5.0, 5.0, 5.0], y_pred).report()
+    expected = evaluate_performance.evaluate_model(
+        pd.DataFrame(data={"score": [5.0, 5.0, 5.0], "preds": y_pred}), "score", "preds"
+    )
+
+    pd.testing.assert_frame_equal(report, expected, rtol=2e-3)  # MAD is within the sketch's 0.1%
+
+
+def test_metric_accumulator_requires_predictions():
+    """An empty stream has no metrics to report."""
+    with pytest.raises(ValueError):
+        evaluate_performance.MetricAccumulator().update([], []).report()
+
+
+def test_evaluate_model_streaming_matches_in_memory(tmp_path):
+    """Chunked, multi-file evaluation matches evaluate_model (MAD within its bound)."""
+    rng = np.random.default_rng(1)
+    results = pd.DataFrame(data={"score": rng.normal(7, 1.3, size=1001)})
+    results["preds"] = results["score"] + rng.normal(0, 1, size=1001)
+    results.iloc[:400].to_csv(tmp_path / "part-0.csv", index=False)
+    results.iloc[400:].to_csv(tmp_path / "part-1.csv", index=False)
+
+    expected = evaluate_performance.evaluate_model(results, "score", "preds").set_index("metric")
+    actual = evaluate_performance.evaluate_model_streaming(
+        [str(tmp_path / "part-0.csv"), str(tmp_path / "part-1.csv")],
+        "score", "preds", chunksize=150, relative_accuracy=0.01, n_workers=2
+    ).set_index("metric")
+
+    exact = ["mse", "rmse", "r_squared", "max_err"]
+    np.testing.assert_allclose(actual.loc[exact, "performance"], expected.loc[exact, "performance"])
+    assert actual.loc["mad", "performance"] == pytest.approx(expected.loc["mad", "performance"], rel=0.01)
+
+
+@pytest.mark.parametrize("q", [0.01, 0.25, 0.5, 0.9, 1.0])
+def test_quantile_sketch_error_bound(q):
+    """Merged sketches estimate each quantile within the relative accuracy."""
+    values = np.random.default_rng(2).exponential(size=10001)
+    sketch = evaluate_performance.QuantileSketch(relative_accuracy=0.005).update(values[:5000])
+    sketch.merge(evaluate_performance.QuantileSketch(relative_accuracy=0.005).update(values[5000:]))
+
+    exact = np.sort(values)[int(q * (len(values) - 1))]
+    assert sketch.quantile(q) == pytest.approx(exact, rel=0.005)
+
+
+def test_evaluate_slices():
+    """Each group's metrics match `evaluate_model` on that group alone."""
+    rng = np.random.default_rng(3)
+    results = pd.DataFrame(data={
+        "genre": ["Rap", "Rock", "Jazz"] * 40,
+        "releaseyear": np.arange(1990, 2110),
+        "score": rng.normal(7, 1.3, size=120)
+    })
+    results["preds"] = results["score"] + rng.normal(0, 1, size=120)
+
+    report = evaluate_performance.evaluate_slices(
+        results, "score", "preds", ["genre", ["genre", "releaseyear"]], bucket_widths={"releaseyear": 50}
+    )
+
+    rap = report[(report["slice"] == "genre") & (report["group"] == "Rap")].set_index("metric")
+    expected = evaluate_performance.evaluate_model(results[results["genre"] == "Rap"], "score", "preds")
+    np.testing.assert_allclose(rap.loc[expected["metric"], "performance"], expected["performance"])
+    assert list(rap["n_rows"].unique()) == [40]
+
+    crossed = report[report["slice"] == "genre x releaseyear"]
+    assert set(crossed["group"]) == {"%s x %d" % (g, y) for g in ["Jazz", "Rap", "Rock"] for y in [1950, 2000, 2050, 2100]}
+
+
+def test_evaluate_slices_constant_group():
+    """A group with one row has an R-squared of 1 if predicted exactly, else 0."""
+    results = pd.DataFrame(data={"genre": ["Rap", "Rock"], "score": [7.0, 8.0], "preds": [7.0, 7.5]})
+    report = evaluate_performance.evaluate_slices(results, "score", "preds", ["genre"])
+
+    r_squared = report[report["metric"] == "r_squared"].set_index("group")["performance"]
+    assert r_squared.to_dict() == {"Rap": 1.0, "Rock": 0.0}
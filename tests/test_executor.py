@@ -0,0 +1,121 @@
+"""
+Test executor.py module.
+"""
+import json
+import shutil
+
+import pandas as pd
+import pytest
+
+from src import executor
+
+CONFIG = {
+    "clean": {"strip_whitespace": {"colname": "artist"}},
+    "model": {
+        "split_predictors_response": {"target_col": "score"},
+        "make_model": {"n_estimators": 5, "random_state": 0},
+        "make_preprocessor": {
+            "numeric_features": ["energy"],
+            "categorical_features": ["genre"],
+            "handle_unknown": "ignore"
+        }
+    },
+    "score_model": {"append_predictions": {"output_col": "preds"}},
+    "evaluate_performance": {"evaluate_model": {"y_true_colname": "score", "y_pred_colname": "preds"}}
+}
+
+
+@pytest.fixture
+def raw_path(tmp_path):
+    """Small raw dataset saved to a CSV file."""
+    data = pd.DataFrame(data={
+        "artist": ["Run the Jewels ", "Vampire Weekend ", "Metallica ", "Nas "] * 5,
+        "genre": ["Rap", "Rock", "Metal", "Rap"] * 5,
+        "energy": [0.65, 0.55, 0.9, 0.6] * 5,
+        "score": [9.0, 9.3, 7.7, 10.0] * 5
+    })
+    path = str(tmp_path / "raw.csv")
+    data.to_csv(path, index=False)
+    return path
+
+
+def test_step_key_only_depends_on_own_config_section():
+    """Changing one config section changes the keys of steps reading it, not others."""
+    changed = dict(CONFIG, evaluate_performance={"evaluate_model": {"y_true_colname": "preds"}})
+
+    assert executor.step_key("model", ["abc"], CONFIG) == executor.step_key("model", ["abc"], changed)
+    assert executor.step_key("evaluate", ["abc"], CONFIG) != executor.step_key("evaluate", ["abc"], changed)
+    assert executor.step_key("model", ["abc"], CONFIG) != executor.step_key("model", ["abd"], CONFIG)
+
+
+def test_model_step_code_includes_encoders():
+    """The model step's code version covers the compact encoders its preprocessor may use."""
+    sources = [path.replace("\\", "/") for path in executor.module_sources(executor.STEPS["model"]["modules"])]
+    assert any(path.endswith("src/encoders.py") for path in sources)
+
+
+def test_predict_step_code_includes_explanations():
+    """The predict step's code version covers the TreeSHAP contributions it may append."""
+    sources = [path.replace("\\", "/") for path in executor.module_sources(executor.STEPS["predict"]["modules"])]
+    assert any(path.endswith("src/explain.py") for path in sources)
+    assert any(path.endswith("src/post_process.py") for path in sources)
+
+
+def test_run_pipeline_skips_cached_steps(raw_path, tmp_path, monkeypatch):
+    """A second run with a changed evaluation config only reruns `evaluate`."""
+    output_dir = str(tmp_path / "output")
+    cache_dir = str(tmp_path / "cache")
+    executor.run_pipeline(raw_path, CONFIG, output_dir, cache_dir)
+
+    steps_run = []
+    run_step = executor.run_step
+    monkeypatch.setattr(executor, "run_step", lambda step, *args: steps_run.append(step) or run_step(step, *args))
+
+    changed = dict(CONFIG, evaluate_performance={
+        "evaluate_model": {"y_true_colname": "preds", "y_pred_colname": "preds"}
+    })
+    executor.run_pipeline(raw_path, changed, output_dir, cache_dir)
+
+    assert steps_run == ["evaluate"]
+    report = pd.read_csv(str(tmp_path / "output" / "models" / "performance_report.csv"))
+    assert report.loc[report["metric"] == "mse", "performance"].item() == 0
+
+
+def test_run_pipeline_reruns_steps_importing_changed_code(raw_path, tmp_path, monkeypatch):
+    """Editing a module a step only imports indirectly reruns that step and those after it."""
+    shutil.copytree(executor.SRC_DIR, str(tmp_path / "src"), ignore=shutil.ignore_patterns("__pycache__"))
+    monkeypatch.setattr(executor, "SRC_DIR", str(tmp_path / "src"))
+    output_dir = str(tmp_path / "output")
+    cache_dir = str(tmp_path / "cache")
+    executor.run_pipeline(raw_path, CONFIG, output_dir, cache_dir)
+
+    steps_run = []
+    run_step = executor.run_step
+    monkeypatch.setattr(executor, "run_step", lambda step, *args: steps_run.append(step) or run_step(step, *args))
+    with open(str(tmp_path / "src" / "encoders.py"), "a") as file:
+        file.write("\n# Changed\n")
+    executor.run_pipeline(raw_path, CONFIG, output_dir, cache_dir)
+
+    assert steps_run == ["model", "predict", "evaluate"]
+
+
+def test_run_pipeline_saves_requested_artifacts(raw_path, tmp_path):
+    """Without a cache, every step runs and only requested artifacts are saved."""
+    output_dir = tmp_path / "output"
+    results = executor.run_pipeline(raw_path, CONFIG, str(output_dir), None, artifacts=["evaluate"])
+
+    assert list(results) == list(executor.STEPS)
+    assert [path.name for path in output_dir.rglob("*") if path.is_file()] == ["performance_report.csv"]
+    pd.testing.assert_frame_equal(
+        pd.read_csv(str(output_dir / "models" / "performance_report.csv")),
+        results["evaluate"]
+    )
+
+
+def test_run_pipeline_saves_model_telemetry(raw_path, tmp_path):
+    """The model's training telemetry is saved alongside it, also when copied from the cache."""
+    cache_dir = str(tmp_path / "cache")
+    for output_dir in [tmp_path / "first", tmp_path / "second"]:
+        executor.run_pipeline(raw_path, CONFIG, str(output_dir), cache_dir, artifacts=["model"])
+        with open(str(output_dir / "models" / "gbt_pipeline.telemetry.json")) as telemetry_file:
+            assert json.load(telemetry_file)["n_trees"] == 5
@@ -0,0 +1,89 @@
+"""
+Test explain.py module.
+"""
+import itertools
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import explain, model, score_model
+
+
+@pytest.fixture
+def fitted_pipeline():
+    """Small gradient boosting pipeline over three numeric features and a genre"""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(data=rng.uniform(size=(200, 3)), columns=["energy", "tempo", "valence"])
+    data["genre"] = ["Rap", "Rock", "Metal", "Jazz"] * 50
+    target = data["energy"] * data["tempo"] + data["valence"] + (data["genre"] == "Rap")
+
+    preprocessor = model.make_preprocessor(["energy", "tempo", "valence"], ["genre"], "ignore")
+    estimator = model.make_model(n_estimators=5, max_depth=3, random_state=0)
+    return model.train_pipeline(data, target, preprocessor, estimator), data
+
+
+def _expected_value(tree, x, known):
+    """Path-dependent expected prediction of a tree given only the `known` columns."""
+    def recurse(node):
+        if tree.children_left[node] == -1:
+            return tree.value[node, 0, 0]
+        left, right = tree.children_left[node], tree.children_right[node]
+        if tree.feature[node] in known:
+            return recurse(left if x[tree.feature[node]] <= tree.threshold[node] else right)
+        weights = tree.weighted_n_node_samples
+        return (weights[left] * recurse(left) + weights[right] * recurse(right)) / weights[node]
+    return recurse(0)
+
+
+def test_contributions_match_shapley_values(fitted_pipeline):
+    """Numeric features' contributions equal Shapley values computed by brute force."""
+    pipe, data = fitted_pipeline
+    explainer = explain.TreeExplainer(pipe)
+    contributions = explainer.contributions(data.iloc[:3])
+
+    predictor = pipe["predictor"]
+    n_columns = predictor.n_features_in_
+    for row in range(3):
+        x = pipe["preprocessor"].transform(data.iloc[[row]])[0].astype(np.float32)
+
+        def value(known):
+            return predictor.learning_rate * sum(
+                _expected_value(tree.tree_, x, known) for tree in predictor.estimators_[:, 0]
+            )
+
+        for column, feature in enumerate(["energy", "tempo", "valence"]):
+            others = [other for other in range(n_columns) if other != column]
+            shapley = sum(
+                math.factorial(len(subset)) * math.factorial(n_columns - len(subset) - 1)
+                / math.factorial(n_columns) * (value(set(subset) | {column}) - value(set(subset)))
+                for size in range(n_columns) for subset in itertools.combinations(others, size)
+            )
+            assert contributions.loc[row, feature] == pytest.approx(shapley, abs=1e-10)
+
+
+def test_contributions_sum_to_predictions(fitted_pipeline):
+    """Each row's contributions plus the expected value add up to its prediction."""
+    pipe, data = fitted_pipeline
+    explainer = explain.TreeExplainer(pipe)
+    contributions = explainer.contributions(data, chunk_size=64)
+
+    assert list(contributions.columns) == ["energy", "tempo", "valence", "genre"]
+    np.testing.assert_allclose(explainer.expected_value + contributions.sum(axis=1), pipe.predict(data))
+
+
+def test_explainer_requires_gradient_boosting(fitted_pipeline):
+    """Only GradientBoostingRegressor pipelines can be explained."""
+    pipe, data = fitted_pipeline
+    pipe.steps[-1] = ("predictor", model.make_model(engine="hist_gradient_boosting"))
+    with pytest.raises(ValueError):
+        explain.TreeExplainer(pipe)
+
+
+def test_append_predictions_with_contributions(fitted_pipeline):
+    """Contribution columns follow the predictions, one per original feature."""
+    pipe, data = fitted_pipeline
+    results = score_model.append_predictions(pipe, data, explain_predictions=True)
+
+    assert list(results.columns[-5:]) == ["preds", "preds_energy", "preds_tempo", "preds_valence", "preds_genre"]
@@ -4,8 +4,9 @@ Test model.py module.
 import numpy as np
 import pandas as pd
 import pytest
+import scipy.sparse
 
-from src import model
+from src import model, serialize
 
 
 @pytest.fixture
@@ -160,3 +161,187 @@ def test_validate_dataframe_empty_input():
     expected = pd.DataFrame(columns=expected_columns, dtype=np.float64)
 
     pd.testing.assert_frame_equal(actual, expected)
+
+
+def test_make_model_engines():
+    """Select the estimator class by engine name."""
+    assert type(model.make_model(learning_rate=0.1)).__name__ == "GradientBoostingRegressor"
+    assert type(model.make_model(engine="hist_gradient_boosting")).__name__ == "HistGradientBoostingRegressor"
+
+    with pytest.raises(ValueError):
+        model.make_model(engine="random_forest")
+    with pytest.raises(ValueError):
+        model.make_model(categorical_mask=[False, True])
+
+
+def test_categorical_mask():
+    """Ordinal-encoded columns are marked categorical; one-hot columns are not."""
+    ordinal = model.make_preprocessor(["energy", "tempo"], ["genre"], "ignore", categorical_encoding="ordinal")
+    onehot = model.make_preprocessor(["energy", "tempo"], ["genre"], "ignore")
+
+    assert model.categorical_mask(ordinal) == [False, False, True]
+    assert model.categorical_mask(onehot) is None
+
+
+def test_train_pipeline_native_categorical():
+    """Histogram GBT trains on ordinal-encoded categories and ignores unseen ones."""
+    data = pd.DataFrame(data={
+        "energy": np.linspace(0, 1, 40),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 10
+    })
+    target = data["energy"] + (data["genre"] == "Rap")
+
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore", categorical_encoding="ordinal")
+    estimator = model.make_model(
+        engine="hist_gradient_boosting",
+        categorical_mask=model.categorical_mask(preprocessor),
+        min_samples_leaf=2
+    )
+    pipe = model.train_pipeline(data, target, preprocessor, estimator)
+
+    preds = pipe.predict(pd.DataFrame(data={"energy": [0.5, 0.5], "genre": ["Rap", "Polka"]}))
+    assert preds[0] > preds[1]
+
+
+def test_fit_preprocessor_cached(tmp_path):
+    """The preprocessor is fit once per distinct training data and config."""
+    data = pd.DataFrame(data={
+        "energy": np.linspace(0, 1, 20),
+        "genre": ["Rap", "Rock"] * 10
+    })
+    onehot = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    ordinal = model.make_preprocessor(["energy"], ["genre"], "ignore", categorical_encoding="ordinal")
+
+    fitted, transformed = model.fit_preprocessor(onehot, data, memory=str(tmp_path))
+    fitted_again, transformed_again = model.fit_preprocessor(onehot, data.copy(), memory=str(tmp_path))
+    model.fit_preprocessor(ordinal, data, memory=str(tmp_path))
+
+    np.testing.assert_array_equal(transformed, transformed_again)
+    np.testing.assert_array_equal(fitted.transform(data), fitted_again.transform(data))
+    assert len(list(tmp_path.glob("**/output.pkl"))) == 2
+
+
+def test_make_preprocessor_sparse_output():
+    """Sparse output stays CSR and trains the same model as dense output."""
+    data = pd.DataFrame(data={
+        "energy": np.linspace(0, 1, 40),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 10
+    })
+    target = data["energy"] + (data["genre"] == "Rap")
+
+    sparse = model.make_preprocessor(["energy"], ["genre"], "ignore", sparse_output=True)
+    dense = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    sparse_pipe = model.train_pipeline(data, target, sparse, model.make_model(random_state=0))
+    dense_pipe = model.train_pipeline(data, target, dense, model.make_model(random_state=0))
+
+    assert scipy.sparse.isspmatrix_csr(sparse_pipe["preprocessor"].transform(data))
+    np.testing.assert_allclose(sparse_pipe.predict(data), dense_pipe.predict(data))
+
+
+def test_make_preprocessor_sparse_output_requires_onehot():
+    """Sparse output can't be combined with ordinal encoding."""
+    with pytest.raises(ValueError):
+        model.make_preprocessor(["energy"], ["genre"], "ignore", categorical_encoding="ordinal", sparse_output=True)
+
+
+@pytest.mark.parametrize("encoding, width", [("target", 2), ("frequency", 2), ("hashing", 8)])
+def test_make_preprocessor_high_cardinality(encoding, width):
+    """High-cardinality features are encoded at a fixed width and used by the model."""
+    data = pd.DataFrame(data={
+        "energy": np.linspace(0, 1, 40),
+        "artist": ["Artist %d" % (i % 13) for i in range(40)],
+        "recordlabel": ["Label %d" % (i % 7) for i in range(40)]
+    })
+    target = data["energy"] + (data["artist"] == "Artist 0")
+
+    preprocessor = model.make_preprocessor(
+        ["energy"], [], "ignore",
+        high_cardinality_features=["artist", "recordlabel"],
+        high_cardinality_encoding=encoding,
+        n_buckets=8
+    )
+    pipe = model.train_pipeline(data, target, preprocessor, model.make_model(random_state=0))
+
+    assert pipe["preprocessor"].transform(data).shape == (40, 1 + width)
+    assert pipe.predict(data).shape == (40,)
+
+
+@pytest.fixture
+def dated_reviews():
+    """Reviews with a date, and a pipeline trained on the first 80 of them"""
+    data = pd.DataFrame(data={
+        "energy": np.linspace(0, 1, 100),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 25,
+        "reviewdate": pd.date_range("2019-01-01", periods=100).astype(str)
+    })
+    target = data["energy"] + (data["genre"] == "Rap")
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    pipe = model.train_pipeline(data[:80], target[:80], preprocessor, model.make_model(n_estimators=10))
+    return data, target, pipe
+
+
+def test_retrain_pipeline(dated_reviews):
+    """New rows add boosting stages to the existing ones."""
+    data, target, pipe = dated_reviews
+    retrained = model.retrain_pipeline(pipe, data, target, n_new_stages=5, max_drift=np.inf, random_state=0)
+
+    assert retrained["predictor"].n_estimators_ == 15
+    assert retrained["predictor"].estimators_[0, 0] is not pipe["predictor"].estimators_[0, 0]
+    assert pipe["predictor"].n_estimators_ == 10
+    assert model.retrain_pipeline(retrained, data, target) is retrained
+
+
+def test_retrain_pipeline_full_retrain_needed(dated_reviews):
+    """Drifted new rows, too many stages, or an unknown training set need a full retrain."""
+    data, target, pipe = dated_reviews
+    drifted = data.assign(genre=np.where(data.index < 80, data["genre"], "Polka"))
+
+    assert model.retrain_pipeline(pipe, drifted, target) is None
+    assert model.retrain_pipeline(pipe, data, target, max_drift=np.inf, max_stages=12) is None
+    del pipe.training_data_
+    assert model.retrain_pipeline(pipe, data, target) is None
+
+
+def test_retrain_pipeline_from_saved_training_data(dated_reviews, tmp_path):
+    """The training data summary is saved beside the model, not in it, and retraining reads it from there."""
+    data, target, pipe = dated_reviews
+    path = str(tmp_path / "model.joblib")
+    serialize.save_pipeline(pipe, path)
+    loaded = serialize.load_pipeline(path)
+
+    assert hasattr(pipe, "training_data_") and not hasattr(loaded, "training_data_")
+    assert model.retrain_pipeline(loaded, data, target, max_drift=np.inf) is None
+    retrained = model.retrain_pipeline(
+        loaded, data, target, n_new_stages=5, max_drift=np.inf, training_data=serialize.load_training_data(path)
+    )
+    assert retrained["predictor"].n_estimators_ == 15
+
+
+def test_train_pipeline_telemetry(dated_reviews):
+    """Training records each stage's cost, the model's size, and the loss after each stage."""
+    data, target, _ = dated_reviews
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    pipe = model.train_pipeline(
+        data[:80], target[:80], preprocessor, model.make_model(n_estimators=10, max_depth=2),
+        X_val=data[80:], y_val=target[80:]
+    )
+    telemetry = pipe.telemetry_
+
+    assert set(telemetry["stages"]) == {"preprocessor", "predictor"}
+    assert telemetry["stages"]["predictor"]["peak_memory_mb"] > 0
+    assert telemetry["n_trees"] == 10
+    assert telemetry["n_nodes"] <= 10 * 7
+    assert len(telemetry["train_rmse"]) == len(telemetry["val_rmse"]) == 10
+    assert telemetry["train_rmse"] == sorted(telemetry["train_rmse"], reverse=True)
+    assert telemetry["val_rmse"][telemetry["best_n_stages"] - 1] == min(telemetry["val_rmse"])
+
+
+def test_train_pipeline_telemetry_hist_gradient_boosting(dated_reviews):
+    """Histogram GBT telemetry counts the trees boosted before early stopping, but not their nodes."""
+    data, target, _ = dated_reviews
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    estimator = model.make_model(engine="hist_gradient_boosting", max_iter=10, min_samples_leaf=2)
+    telemetry = model.train_pipeline(data, target, preprocessor, estimator).telemetry_
+
+    assert telemetry["n_trees"] == estimator.n_iter_ == len(telemetry["train_rmse"])
+    assert telemetry["n_nodes"] is None
@@ -0,0 +1,52 @@
+"""
+Test post_process.py module.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import model, post_process
+
+
+@pytest.fixture
+def albums():
+    """Albums whose score depends on genre and energy, but not tempo"""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(data={
+        "energy": rng.uniform(size=200),
+        "tempo": rng.uniform(60, 180, size=200),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 50,
+        "artist": ["Artist %d" % (i % 17) for i in range(200)]
+    })
+    data["score"] = 3 * data["energy"] + 2 * (data["genre"] == "Rap")
+    return data
+
+
+def test_feature_columns(albums):
+    """One-hot columns map back to their feature; hashed features share their buckets."""
+    preprocessor = model.make_preprocessor(
+        ["energy", "tempo"], ["genre"], "ignore",
+        high_cardinality_features=["artist", "genre"], high_cardinality_encoding="hashing", n_buckets=4
+    ).fit(albums)
+
+    assert post_process.feature_columns(preprocessor) == {
+        "energy": [0],
+        "tempo": [1],
+        "genre": [2, 3, 4, 5],
+        "artist + genre": [6, 7, 8, 9]
+    }
+
+
+@pytest.mark.parametrize("sparse_output", [False, True])
+def test_get_permutation_importance(albums, sparse_output):
+    """Held-out permutation importance is reported per original feature, most important first."""
+    preprocessor = model.make_preprocessor(["energy", "tempo"], ["genre"], "ignore", sparse_output=sparse_output)
+    X, y = model.split_predictors_response(albums.iloc[:150])
+    pipe = model.train_pipeline(X, y, preprocessor, model.make_model(random_state=0))
+
+    importance = post_process.get_permutation_importance(
+        pipe, albums.iloc[150:], n_repeats=3, random_state=0, n_workers=2
+    )
+
+    assert list(importance.index) == ["energy", "genre", "tempo"]
+    assert importance.loc["tempo", "importance_mean"] < 0.05
@@ -0,0 +1,87 @@
+"""
+Test quantize.py module.
+"""
+import pickle
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.compose import ColumnTransformer
+from sklearn.preprocessing import OneHotEncoder
+
+from src import model, quantize
+
+
+@pytest.fixture
+def data():
+    """Albums with a score that depends on their (unrounded) energy and genre"""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(data={
+        "energy": rng.uniform(size=500),
+        "loudness": rng.normal(-8, 3, size=500),
+        "genre": rng.choice(["Rap", "Rock", "Metal", "Jazz"], size=500)
+    })
+    return data, data["energy"] + data["loudness"] / 10 + (data["genre"] == "Rap")
+
+
+@pytest.mark.parametrize("sparse_output", [False, True])
+def test_quantize_pipeline(data, sparse_output):
+    """The float32 predictor stores float32 thresholds, is smaller, and predicts exactly the same once unpickled."""
+    X, y = data
+    preprocessor = model.make_preprocessor(["energy", "loudness"], ["genre"], "ignore", sparse_output=sparse_output)
+    pipe = model.train_pipeline(X, y, preprocessor, model.make_model(max_depth=5, random_state=0))
+    pickled = pickle.dumps(quantize.quantize_pipeline(pipe, check_data=X)["predictor"])
+    float32_predictor = pickle.loads(pickled)
+    X_float32 = quantize.Float32Preprocessor(pipe["preprocessor"]).transform(X)
+
+    assert float32_predictor.thresholds.dtype == np.float32
+    assert len(pickled) < len(pickle.dumps(pipe["predictor"])) / 2
+    np.testing.assert_array_equal(float32_predictor.predict(X_float32), pipe.predict(X))
+
+
+def test_quantize_pipeline_remainder(data):
+    """Columns passed through as the preprocessor's remainder are kept."""
+    X, y = data
+    preprocessor = ColumnTransformer(
+        transformers=[("categorical", OneHotEncoder(handle_unknown="ignore"), ["genre"])],
+        remainder="passthrough"
+    )
+    pipe = model.train_pipeline(X, y, preprocessor, model.make_model(max_depth=5, random_state=0))
+    float32_pipe = quantize.quantize_pipeline(pipe)
+
+    assert float32_pipe["preprocessor"].transform(X).shape == (500, 6)
+    np.testing.assert_array_equal(float32_pipe.predict(X), pipe.predict(X))
+
+
+def test_float32_thresholds_round_down(data):
+    """Thresholds are stored as the largest float32 not above the original."""
+    X, y = data
+    pipe = model.train_pipeline(X, y, model.make_preprocessor(["energy"], [], "ignore"), model.make_model())
+    thresholds = np.concatenate([tree.tree_.threshold for tree in pipe["predictor"].estimators_[:, 0]])
+    float32_thresholds = quantize.Float32GradientBoosting(pipe["predictor"]).thresholds
+
+    assert float32_thresholds.dtype == np.float32
+    assert np.all(float32_thresholds <= thresholds)
+    assert np.all(np.nextafter(float32_thresholds, np.float32(np.inf)) > thresholds)
+
+
+def test_float32_gradient_boosting_batches(data):
+    """Rows sent down the trees in batches reach the same leaves as with scikit-learn."""
+    X, y = data
+    pipe = model.train_pipeline(X, y, model.make_preprocessor(["energy"], ["genre"], "ignore"), model.make_model())
+    X_transformed = pipe["preprocessor"].transform(X)
+    predictor = quantize.Float32GradientBoosting(pipe["predictor"], batch_size=64)
+
+    np.testing.assert_array_equal(predictor.apply(X_transformed), pipe["predictor"].apply(X_transformed))
+    np.testing.assert_array_equal(predictor.predict(X_transformed), pipe["predictor"].predict(X_transformed))
+    assert predictor.apply(X_transformed[:0]).shape == (0, 100)
+
+
+def test_quantize_pipeline_requires_gradient_boosting(data):
+    """Only GradientBoostingRegressor pipelines can be converted to float32."""
+    X, y = data
+    pipe = model.train_pipeline(
+        X, y, model.make_preprocessor(["energy"], [], "ignore"), model.make_model(engine="hist_gradient_boosting")
+    )
+    with pytest.raises(ValueError):
+        quantize.quantize_pipeline(pipe)
@@ -0,0 +1,24 @@
+"""
+Test score_model.py module.
+"""
+import numpy as np
+import pandas as pd
+
+from src import model, score_model
+
+
+def test_append_predictions_sharded():
+    """Predictions from several worker processes match single-process ones, in order."""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(data={
+        "energy": rng.uniform(size=103),
+        "genre": rng.choice(["Rap", "Rock", "Metal", "Jazz"], size=103)
+    }, index=rng.permutation(103))
+    target = data["energy"] + (data["genre"] == "Rap")
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    pipe = model.train_pipeline(data, target, preprocessor, model.make_model(random_state=0))
+
+    expected = score_model.append_predictions(pipe, data.copy())
+    actual = score_model.append_predictions(pipe, data.copy(), n_workers=3)
+
+    pd.testing.assert_frame_equal(actual, expected)
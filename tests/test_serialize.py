@@ -0,0 +1,44 @@
+"""
+Test serialize.py module.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import model, serialize
+
+
+@pytest.fixture
+def data():
+    """Albums with a score that depends on their energy and genre"""
+    data = pd.DataFrame(data={
+        "energy": np.linspace(0, 1, 40),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 10
+    })
+    return data, data["energy"] + (data["genre"] == "Rap")
+
+
+def test_export_onnx_requires_gradient_boosting(data, tmp_path):
+    """Only GradientBoostingRegressor pipelines can be exported to ONNX."""
+    X, y = data
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    pipe = model.train_pipeline(X, y, preprocessor, model.make_model(engine="hist_gradient_boosting"))
+
+    with pytest.raises(ValueError):
+        serialize.export_onnx(pipe, str(tmp_path / "model.onnx"))
+
+
+def test_export_onnx(data, tmp_path):
+    """The ONNX graph (saved to a new directory) predicts what the pipeline does, including for unseen genres."""
+    pytest.importorskip("skl2onnx")
+    pytest.importorskip("onnxruntime")
+    X, y = data
+    preprocessor = model.make_preprocessor(["energy"], ["genre"], "ignore")
+    pipe = model.train_pipeline(X, y, preprocessor, model.make_model(random_state=0))
+    X_new = pd.DataFrame(data={"energy": [0.25, 0.5], "genre": ["Rap", "Polka"]})
+
+    max_difference = serialize.export_onnx(pipe, str(tmp_path / "models" / "model.onnx"), check_data=X)
+    onnx_pipe = serialize.load_pipeline(str(tmp_path / "models" / "model.onnx"))
+
+    assert max_difference < 1e-4
+    np.testing.assert_allclose(onnx_pipe.predict(X_new), pipe.predict(X_new), atol=1e-4)
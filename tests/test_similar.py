@@ -0,0 +1,129 @@
+"""
+Test similar.py module.
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src import albums_database, model, similar
+from src.albums_database import AlbumManager, Albums
+
+FEATURES = ["energy", "tempo"]
+
+
+@pytest.fixture
+def album_data():
+    """Ids and features of 500 albums, some missing"""
+    rng = np.random.default_rng(0)
+    data = pd.DataFrame(data={
+        "id": np.arange(1, 501),
+        "energy": rng.uniform(size=500),
+        "tempo": rng.uniform(60, 220, size=500)
+    })
+    data.loc[::50, "tempo"] = np.nan
+    return data
+
+
+def brute_force(album_data, point, k):
+    """Ids of the k closest albums by standardized distance"""
+    X = album_data[FEATURES].to_numpy()
+    X = np.nan_to_num((X - np.nanmean(X, axis=0)) / np.nanstd(X, axis=0))
+    return album_data["id"].to_numpy()[np.argsort(np.linalg.norm(X - point, axis=1), kind="stable")[:k]]
+
+
+def test_query_matches_brute_force(album_data):
+    """The KD-tree finds the same albums as an exhaustive search, closest first."""
+    index = similar.build_index(album_data, FEATURES, leaf_size=5)
+    ids, distances = index.query(pd.DataFrame(data={"energy": [0.5], "tempo": [np.nan]}), k=10)
+
+    point = np.array([(0.5 - np.nanmean(album_data["energy"])) / np.nanstd(album_data["energy"]), 0.0])
+    np.testing.assert_array_equal(ids, brute_force(album_data, point, 10))
+    assert np.all(np.diff(distances) >= 0)
+
+
+def test_query_by_album_leaves_it_out(album_data):
+    """An album isn't counted as similar to itself, and unknown albums raise KeyError."""
+    index = similar.build_index(album_data, FEATURES)
+    ids, distances = index.query(album_id=7, k=5)
+
+    assert 7 not in ids
+    assert len(ids) == 5
+    with pytest.raises(KeyError):
+        index.query(album_id=1000)
+
+
+def test_add_searches_new_albums(album_data):
+    """Added albums are found before and after the tree is rebuilt with them."""
+    index = similar.build_index(album_data[:400], FEATURES, max_pending=60)
+    index.add(album_data[400:450])
+    assert len(index.pending_ids) == 50
+    assert index.query(album_id=420, k=0)[0].size == 0
+    np.testing.assert_array_equal(index.query(album_id=420, k=5)[0], similar.SimilarityIndex(
+        album_data[:450], FEATURES, index.mean, index.scale
+    ).query(album_id=420, k=5)[0])
+
+    index.add(album_data[450:])
+    assert len(index.pending_ids) == 0
+    assert len(index) == index.max_id == 500
+
+
+def test_add_and_query_from_threads(album_data):
+    """Albums added after `max_id` by concurrent threads are indexed once, while others query."""
+    index = similar.build_index(album_data[:100], FEATURES, max_pending=50)
+    errors = []
+
+    def add_new():
+        for _ in range(50):
+            with index.lock:
+                index.add(album_data[album_data["id"] > index.max_id][:3])
+
+    def query():
+        try:
+            for album_id in range(1, 100):
+                ids, distances = index.query(album_id=album_id, k=20)
+                assert len(ids) == len(distances) == 20
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=target) for target in [add_new, add_new, query, query]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(index) == index.max_id == 400
+    assert len(np.unique(np.concatenate([index.album_ids, index.pending_ids]))) == 400
+
+
+def test_fitted_scaling(album_data):
+    """The fitted scaler's mean and scale are used for the requested features."""
+    album_data = album_data.dropna()
+    preprocessor = model.make_preprocessor(FEATURES, [], "ignore")
+    pipe = model.train_pipeline(album_data, album_data["energy"], preprocessor, model.make_model(n_estimators=5))
+    mean, scale = similar.fitted_scaling(pipe, ["tempo"])
+
+    assert mean[0] == pytest.approx(album_data["tempo"].mean())
+    assert scale[0] == pytest.approx(album_data["tempo"].std(ddof=0))
+    with pytest.raises(ValueError):
+        similar.fitted_scaling(pipe, ["danceability"])
+
+
+def test_similar_albums():
+    """Similar albums are looked up in the database, with their actual scores."""
+    album_manager = AlbumManager(engine_string="sqlite://")
+    albums_database.Base.metadata.create_all(album_manager.session.get_bind())
+    album_manager.session.add_all([
+        Albums(album=album, reviewauthor="Author", score=score, energy=energy, tempo=120.0)
+        for album, score, energy in [("A", 7.0, 0.1), ("B", 8.0, 0.2), ("C", 9.0, 0.9)]
+    ])
+    album_manager.session.commit()
+
+    index = similar.build_index(album_manager.album_features(FEATURES), FEATURES)
+    albums = similar.similar_albums(index, album_manager, album_id=1, k=2)
+    album_manager.close()
+
+    assert list(albums["album"]) == ["B", "C"]
+    assert list(albums["score"]) == [8.0, 9.0]
@@ -0,0 +1,42 @@
+"""
+Test tune.py module.
+"""
+import numpy as np
+import pandas as pd
+
+from src import tune
+
+MODEL_CONFIG = {
+    "split_predictors_response": {"target_col": "score"},
+    "split_train_val_test": {"train_val_test_ratio": "6:2:2", "random_state": 0},
+    "make_model": {"random_state": 0},
+    "make_preprocessor": {
+        "numeric_features": ["energy"],
+        "categorical_features": ["genre"],
+        "handle_unknown": "ignore"
+    }
+}
+
+
+def test_tune_model_successive_halving():
+    """Candidates are pruned each round and the winner comes from the last round."""
+    data = pd.DataFrame(data={
+        "energy": np.linspace(0, 1, 100),
+        "genre": ["Rap", "Rock", "Metal", "Jazz"] * 25,
+        "score": np.linspace(0, 10, 100)
+    })
+    search_space = {"learning_rate": [0.01, 0.1, 0.3], "max_depth": [1, 2, 3]}
+
+    leaderboard, best = tune.tune_model(
+        data, MODEL_CONFIG, search_space, min_resource=2, max_resource=18, factor=3, n_workers=2
+    )
+
+    assert len(leaderboard.index) == 9
+    assert list(leaderboard["round"].value_counts().sort_index()) == [6, 2, 1]
+    assert leaderboard.loc[0, "n_estimators"] == 18
+    assert best == {
+        "random_state": 0,
+        "learning_rate": leaderboard.loc[0, "learning_rate"],
+        "max_depth": leaderboard.loc[0, "max_depth"],
+        "n_estimators": 18
+    }